@@ -11,6 +11,7 @@ Created on Mon Feb  3 15:08:56 2014
 
 
 import random
+import importlib
 import sys
 
 
@@ -21,3 +22,17 @@ random.seed()
 # check whether the correct system encoding is given
 if sys.getfilesystemencoding().lower() not in ('utf-8'):
     raise Exception("BBSS requires a UTF-8 locale.")
+
+
+# modules for file formats and services that are imported only when they are
+# first accessed as attribute of the package, e.g. "bbss.pdf", so that their
+# dependencies (ReportLab, xlrd, authentik_client, ...) do not slow down the
+# start of applications that do not need them
+_lazy_modules = ('csv', 'sso', 'pdf', 'radius', 'xls', 'moodle', 'webuntis', 'labsoft', 'iserv',
+                 'bbs_verwaltung', 'export', 'analytics', 'ldap_sync', 'images', 'convert')
+
+
+def __getattr__(name):
+    if name in _lazy_modules:
+        return importlib.import_module('{}.{}'.format(__name__, name))
+    raise AttributeError("module '{}' has no attribute '{}'".format(__name__, name))
@@ -19,6 +19,9 @@ logger = logging.getLogger('bbss.ad')
 LDAP_SERVER = 'ldaps://dc.host.com'
 USER_BASE = 'ou=Schueler,ou=BBSBS,DC=SN,DC=BBSBS,DC=LOCAL'
 
+# DNS name of the domain, used as suffix of the user principal names
+DOMAIN = 'sn.bbsbs.local'
+
 
 def setup_ad():
     """Set all user accounts for students in AD."""
@@ -26,8 +29,20 @@ def setup_ad():
     logger.info('AD set up.')
 
 
+def escape_dn_value(value):
+    """Escapes special characters in an attribute value of a DN (RFC 4514)."""
+    value = ''.join('\\' + c if c in ',+"\\<>;=' else c for c in value)
+    if value.startswith(('#', ' ')):
+        value = '\\' + value
+    if value.endswith(' '):
+        value = value[:-1] + '\\ '
+    return value
+
+
 def generateOU(class_name, class_determinator, department):
-    s = 'ou=' + class_name + ','
-    s += 'ou=' + class_determinator + ','
-    s += 'ou=' + department + ',' + USER_BASE
-    return s
+    """
+    Generates the DN of the organizational unit for a class. Empty parts, e.g.
+    for classes without department, are left out.
+    """
+    parts = ['ou=' + escape_dn_value(p) for p in (class_name, class_determinator, department) if p]
+    return ','.join(parts + [USER_BASE])
@@ -0,0 +1,209 @@
+
+"""
+bbss - BBS Student Management
+
+Exports the student database and change sets into columnar files (Apache
+Parquet or Arrow IPC) for analysing enrollment trends, class changes and
+retention with other tools. Rows are read and written in batches, so that
+even the complete history of many years can be exported with constant
+memory. Class names are stored dictionary-encoded and dates as typed dates.
+
+Passwords are never exported.
+
+Created on Mon Oct 19 16:02:51 2026
+
+@author: Christian Wichmann
+"""
+
+
+import os
+import logging
+import datetime
+
+# pyarrow is only necessary when exporting data for analytics
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+from bbss import export
+from bbss import fileio
+
+
+__all__ = ['export_database', 'export_data', 'ParquetWriter', 'ArrowWriter']
+
+
+logger = logging.getLogger('bbss.analytics')
+
+
+# number of rows read from the database and written into a single record batch
+BATCH_SIZE = 10000
+
+# file extensions of supported file formats
+FILE_EXTENSIONS = {'parquet': '.parquet', 'arrow': '.arrow'}
+
+# columns of all exported tables with their kind of data (int, str, date or class)
+TABLES = {'Imports': (('id', 'int'), ('filename', 'str'), ('date', 'date')),
+          'Students': (('id', 'int'), ('surname', 'str'), ('firstname', 'str'), ('classname', 'class'),
+                       ('birthday', 'date'), ('username', 'str'), ('email', 'str'), ('guid', 'str'),
+                       ('courses', 'str')),
+          'StudentsInImports': (('student_id', 'int'), ('import_id', 'int'), ('class_in_import', 'class')),
+          'ClassChanges': (('student_id', 'int'), ('import_id', 'int'), ('old_class_name', 'class')),
+          'ImportSources': (('import_id', 'int'), ('filename', 'str'), ('student_count', 'int'))}
+
+# columns for students of a change set
+CHANGESET_COLUMNS = (('change', 'class'), ('surname', 'str'), ('firstname', 'str'), ('classname', 'class'),
+                     ('birthday', 'date'), ('username', 'str'), ('email', 'str'), ('guid', 'str'),
+                     ('entry_date', 'date'), ('exit_date', 'date'))
+
+
+def _check_pyarrow():
+    if pyarrow is None:
+        raise ImportError('Package pyarrow is necessary to export data for analytics.')
+
+
+def _create_schema(columns):
+    types = {'int': pyarrow.int64(),
+             'str': pyarrow.string(),
+             'date': pyarrow.date32(),
+             'class': pyarrow.dictionary(pyarrow.int32(), pyarrow.string())}
+    return pyarrow.schema([(name, types[kind]) for name, kind in columns])
+
+
+def _parse_date(value):
+    """Converts a date from the database into a date object, invalid or missing dates become None."""
+    if isinstance(value, datetime.date):
+        return value
+    try:
+        return datetime.date.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class _DictionaryEncoder(object):
+    """
+    Encodes the values of a column as indices into a dictionary. The
+    dictionary is shared by all batches of a file and only grows, so that
+    every batch can be written as delta to the previous dictionary.
+    """
+    def __init__(self):
+        self._indices = {}
+        self._values = []
+
+    def encode(self, values):
+        indices = []
+        for v in values:
+            if v is not None and v not in self._indices:
+                self._indices[v] = len(self._values)
+                self._values.append(v)
+            indices.append(self._indices.get(v))
+        return pyarrow.DictionaryArray.from_arrays(pyarrow.array(indices, type=pyarrow.int32()),
+                                                   pyarrow.array(self._values, type=pyarrow.string()))
+
+
+class _BatchFileWriter(object):
+    """Writes record batches with a fixed schema into a Parquet or Arrow IPC file."""
+    def __init__(self, output, columns, file_format):
+        self._columns = columns
+        self._schema = _create_schema(columns)
+        self._encoders = {name: _DictionaryEncoder() for name, kind in columns if kind == 'class'}
+        if file_format == 'parquet':
+            self._writer = pyarrow.parquet.ParquetWriter(output, self._schema, compression='zstd')
+        elif file_format == 'arrow':
+            options = pyarrow.ipc.IpcWriteOptions(emit_dictionary_deltas=True)
+            self._writer = pyarrow.ipc.new_file(output, self._schema, options=options)
+        else:
+            raise ValueError('Unknown file format for analytics: {}'.format(file_format))
+        self.row_count = 0
+
+    def write_rows(self, rows):
+        """Converts a list of tuples into columns and writes them as a single record batch."""
+        if not rows:
+            return
+        arrays = []
+        for (name, kind), values in zip(self._columns, zip(*rows)):
+            if kind == 'class':
+                arrays.append(self._encoders[name].encode(values))
+            elif kind == 'date':
+                arrays.append(pyarrow.array([_parse_date(v) for v in values], type=pyarrow.date32()))
+            else:
+                arrays.append(pyarrow.array(values, type=self._schema.field(name).type))
+        batch = pyarrow.RecordBatch.from_arrays(arrays, schema=self._schema)
+        self._writer.write_batch(batch)
+        self.row_count += len(rows)
+
+    def close(self):
+        self._writer.close()
+
+
+def export_database(output_directory, database, file_format='parquet', batch_size=BATCH_SIZE):
+    """
+    Exports the tables of the student database into one columnar file per
+    table, e.g. "Students.parquet".
+
+    :param output_directory: directory to write files to
+    :param database: StudentDatabase object to read data from
+    :param file_format: "parquet" or "arrow" for Arrow IPC files
+    :param batch_size: number of rows read and written at once
+    :return: list of names of all written files
+    """
+    _check_pyarrow()
+    os.makedirs(output_directory, exist_ok=True)
+    output_files = []
+    for table_name, columns in TABLES.items():
+        output_file = os.path.join(output_directory, table_name + FILE_EXTENSIONS[file_format])
+        with fileio.atomic_open(output_file, 'wb') as output:
+            writer = _BatchFileWriter(output, columns, file_format)
+            for rows in database.get_table_in_batches(table_name, [name for name, _ in columns], batch_size):
+                writer.write_rows(rows)
+            writer.close()
+        logger.debug('{} rows of table {} written to file: {}'.format(writer.row_count, table_name, output_file))
+        output_files.append(output_file)
+    return output_files
+
+
+def export_data(output_file, change_set, file_format='parquet'):
+    writer_class = ParquetWriter if file_format == 'parquet' else ArrowWriter
+    export.export_changeset(change_set, [writer_class(output_file)])
+
+
+class ParquetWriter(export.Writer):
+    """
+    Writes all students of a change set with the kind of change into a single
+    Parquet file. Students are written in batches while iterating over the
+    change set.
+    """
+    extension = '.parquet'
+    file_format = 'parquet'
+
+    def open(self):
+        _check_pyarrow()
+        self._output = fileio.atomic_open(self.output_file, 'wb')
+        self._files.append(self._output)
+        self._writer = _BatchFileWriter(self._output, CHANGESET_COLUMNS, self.file_format)
+        self._rows = []
+
+    def write(self, record):
+        student = record.student
+        self._rows.append((record.change, student.surname, student.firstname, student.classname,
+                           student.birthday, record.username, student.email, str(student.guid or ''),
+                           getattr(student, 'entry_date', None), getattr(student, 'exit_date', None)))
+        if len(self._rows) >= BATCH_SIZE:
+            self._writer.write_rows(self._rows)
+            self._rows = []
+
+    def finish(self):
+        self._writer.write_rows(self._rows)
+        self._writer.close()
+
+    def close(self):
+        super().close()
+        logger.debug('{} students written to file: {}'.format(self._writer.row_count, self.output_file))
+
+
+class ArrowWriter(ParquetWriter):
+    """Writes all students of a change set into a single Arrow IPC file."""
+    extension = '.arrow'
+    file_format = 'arrow'
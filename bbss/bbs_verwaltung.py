@@ -14,26 +14,90 @@ import csv
 import uuid
 import logging
 import datetime
+import concurrent.futures
 
 from bbss import data
+from bbss import fileio
 
 
-__all__ = ['import_data']
+__all__ = ['import_data', 'import_data_from_files', 'merge_student_lists']
 
 
 logger = logging.getLogger('bbss.bbs_verwaltung')
 
 
 def import_data(import_file):
+    student_list = _read_students(import_file)
+    _assign_missing_guids(student_list)
+    return student_list
+
+
+def _read_students(import_file):
+    """Reads all students from a file. Students without valid GUID get None as GUID."""
     student_count = 0
     student_list = []
     # open CSV file with strange encoding because otherwise BOM markers show up
-    with open(import_file, 'r', encoding='utf-8-sig') as csvfile:
+    # (compressed files and ZIP archives are decompressed while reading)
+    with fileio.open_import_file(import_file, encoding='utf-8-sig') as csvfile:
         student_file_reader = csv.reader(csvfile, delimiter=';')
         for row in student_file_reader:
             student_count += _read_student(row, student_list)
         logger.info('{} students imported.'.format(student_count))
-        return student_list
+    for student in student_list:
+        student.source_file = import_file
+    return student_list
+
+
+def import_data_from_files(import_files, max_workers=None):
+    """
+    Reads multiple CSV files from BBS-Verwaltung concurrently and merges them
+    into a single list of students, so that they can be stored as a single
+    import in the database.
+
+    The files are parsed by a pool of threads. Reading and decompressing of
+    the files runs in parallel, because the compression libraries release the
+    GIL while working.
+
+    :param import_files: list of file names to be imported
+    :param max_workers: maximum number of files read at the same time
+    :return: merged list of students from all files without duplicates
+    """
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        student_lists = list(executor.map(_read_students, import_files))
+    # random GUIDs are assigned only after merging, so that these students are identified by name and birthday
+    student_list = merge_student_lists(student_lists)
+    _assign_missing_guids(student_list)
+    return student_list
+
+
+def merge_student_lists(student_lists):
+    """
+    Merges multiple lists of students into a single list. Students are
+    identified by their GUID or, if no GUID is given, by their name and
+    birthday. If a student is contained in more than one list, only the first
+    occurrence is kept.
+
+    :param student_lists: list of lists containing students
+    :return: merged list of students
+    """
+    merged_students = {}
+    for student_list in student_lists:
+        for student in student_list:
+            key = student.guid or (student.surname, student.firstname, student.birthday)
+            if key in merged_students:
+                logger.debug('Skipping student {} from file {}, because already imported from file {}.'.format(
+                    student, student.source_file, merged_students[key].source_file))
+                continue
+            merged_students[key] = student
+    logger.info('{} students merged from {} files.'.format(len(merged_students), len(student_lists)))
+    return list(merged_students.values())
+
+
+def _assign_missing_guids(student_list):
+    """Creates a new random GUID for all students whose GUID could not be parsed."""
+    for student in student_list:
+        if student.guid is None:
+            student.guid = str(uuid.uuid4())
 
 
 def _read_student(row, student_list):
@@ -49,9 +113,9 @@ def _read_student(row, student_list):
         # parse GUID as validation, although it is stored as string in the database
         guid = uuid.UUID(str(row[0]))
     except ValueError:
-        # create new random UUID if value from file could not be parsed
+        # a new random UUID is created later, after students from multiple files were merged
         logger.error('Could not parse UUID: {}'.format(str(row[0])))
-        guid = uuid.uuid4()
+        guid = None
     # assign all values from row
     mail_adress = row[1]
     bbs_verwaltung_username = row[2]
@@ -99,7 +163,7 @@ def _read_student(row, student_list):
         new_student = data.Student(surname, firstname, classname, birthday)
         # include mail address and GUID
         new_student.email = data.verify_mail_address(mail_adress)
-        new_student.guid = str(guid)
+        new_student.guid = str(guid) if guid else None
         new_student.is_new = (is_new_user == '-1')
         new_student.was_deleted = (student_was_deleted == '-1')
         new_student.courses = courses
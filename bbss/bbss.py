@@ -5,6 +5,10 @@ bbss - BBS Student Management
 Reads student data from csv files and stores them in a database. Data can be
 exported to be used by other systems like AD or RADIUS servers.
 
+All state (the list of imported students, the connection to the database and
+the connections to the SSO server) is owned by a BBSSSession. The functions
+of this module work on a default session, that is created on first use.
+
 Created on Mon Feb  3 15:08:56 2014
 
 @author: Christian Wichmann
@@ -12,24 +16,23 @@ Created on Mon Feb  3 15:08:56 2014
 
 import logging
 import os
+import threading
+import collections
 
+# all other modules of the package, e.g. for file formats, are imported on
+# first use as attribute of the package (see bbss/__init__.py)
 import bbss.db
-import bbss.csv
-import bbss.sso
-import bbss.pdf
-import bbss.radius
-import bbss.xls
-import bbss.moodle
-import bbss.webuntis
-import bbss.labsoft
-import bbss.iserv
-import bbss.bbs_verwaltung
-
-
-__all__ = ['import_csv_file', 'import_excel_file',
-           'import_bbs_verwaltung_csv_file', 'export_csv_file',
+import bbss.config
+
+
+__all__ = ['BBSSSession', 'get_default_session',
+           'import_csv_file', 'import_excel_file',
+           'import_bbs_verwaltung_csv_file', 'import_bbs_verwaltung_csv_files',
+           'export_csv_file',
            'export_moodle_file', 'export_webuntis_file', 'export_labsoft_file',
-           'export_radius_file', 'export_pdf_file',
+           'export_radius_file', 'export_pdf_file', 'export_files',
+           'export_files_parallel', 'export_files_since_last', 'export_analytics',
+           'upload_students_to_school_server', 'upload_students_to_school_server_since_last',
            'clear_database', 'store_students_db',
            'search_student_in_database', 'generate_changeset']
 
@@ -37,8 +40,407 @@ __all__ = ['import_csv_file', 'import_excel_file',
 logger = logging.getLogger('bbss.main')
 
 
-student_list = []
-student_database = bbss.db.StudentDatabase()
+class BBSSSession(object):
+    """
+    Session owning a list of imported students, a connection to a student
+    database and the connections to the SSO server with their cached lists.
+    The connection to the database is opened on first use.
+
+    All methods of a session are serialized by a lock, so a session can be
+    shared by threads. Sessions do not share any state, so several sessions
+    run in parallel threads without waiting for each other, except for locks
+    of the database itself while one of them is writing. A session can be
+    pickled, e.g. to be passed to a process pool. The copy gets the list of
+    imported students and opens its own connections.
+    """
+    def __init__(self, db_filename=None):
+        """
+        Creates a new session.
+
+        :param db_filename: file name of the student database, None for the
+                            default file name (bbss.db.DB_FILENAME)
+        """
+        self.db_filename = db_filename
+        self.student_list = []
+        self._database = None
+        self._user_management = None
+        self._lock = threading.RLock()
+
+    def __getstate__(self):
+        return {'db_filename': self.db_filename, 'student_list': self.student_list}
+
+    def __setstate__(self, state):
+        self.__init__(state['db_filename'])
+        self.student_list = state['student_list']
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def database_file(self):
+        return self.db_filename or bbss.db.DB_FILENAME
+
+    @property
+    def database(self):
+        """Connection to the student database, it is opened on first use."""
+        with self._lock:
+            if self._database is None:
+                # the lock of the session serializes all accesses from different threads
+                self._database = bbss.db.StudentDatabase(self.database_file, check_same_thread=False)
+            return self._database
+
+    def _get_user_management(self):
+        """
+        Returns the user management for the SSO server configured in
+        bbss.config. It is created on first use and shared by all following
+        uploads of the session, so that open connections and cached lists of
+        users and groups are reused.
+        """
+        with self._lock:
+            if self._user_management is None:
+                self._user_management = bbss.sso.UserManagement(bbss.config.SSO_DOMAIN, bbss.config.SSO_TOKEN)
+            return self._user_management
+
+    def close(self):
+        """Closes the connection to the database, it is opened again when needed."""
+        with self._lock:
+            if self._database is not None:
+                self._database.close_connection()
+                self._database = None
+
+    def import_csv_file(self, input_file):
+        """Reads a csv file and adds student to list."""
+        logger.info('Importing students from file...')
+        self.student_list = bbss.csv.import_data(input_file)
+        self._check_for_doubles()
+
+    def import_bbs_verwaltung_csv_file(self, input_file):
+        """Reads a CVS file from BBS-Verwaltung and adds student to list."""
+        logger.info('Importing students from file...')
+        self.student_list = bbss.bbs_verwaltung.import_data(input_file)
+        self._check_for_doubles()
+
+    def import_bbs_verwaltung_csv_files(self, input_files, max_workers=None):
+        """Reads multiple CSV files from BBS-Verwaltung concurrently and merges
+        all students into a single list."""
+        logger.info('Importing students from {} files...'.format(len(input_files)))
+        self.student_list = bbss.bbs_verwaltung.import_data_from_files(input_files, max_workers)
+        self._check_for_doubles()
+
+    def import_excel_file(self, input_file, callback=None):
+        """Reads a Microsoft Excel file and adds student to list."""
+        logger.info('Importing students from file...')
+        self.student_list = bbss.xls.import_data(input_file, callback)
+        self._check_for_doubles()
+
+    def _check_for_doubles(self):
+        """Checks for students with the same generated user name."""
+        logger.info('Checking student list for doubles...')
+        seen = set()
+        for student in self.student_list:
+            if student.generate_user_id() in seen:
+                logger.warning('Double entry ' + student.generate_user_id())
+            seen.add(student.generate_user_id())
+
+    def export_files_since_last(self, output_file, formats, replace_illegal_characters=None, max_workers=None):
+        """
+        Writes files for multiple export formats containing only the changes since
+        the last successful export for each format. After all files of a format
+        were written, the last import is stored as new watermark for this format.
+        Formats that were never exported before get all students of the last
+        import. Returns a dictionary with the exported range of imports for each
+        format.
+        """
+        with self._lock:
+            database = self.database
+            last_import_id = database.get_last_import_id()
+            # formats with the same watermark can be exported from the same change set
+            formats_by_watermark = collections.defaultdict(list)
+            for format_name in formats:
+                formats_by_watermark[database.get_export_watermark(format_name)].append(format_name)
+            exported_imports = {}
+            for watermark, watermark_formats in sorted(formats_by_watermark.items()):
+                if watermark >= last_import_id:
+                    logger.info('No new imports for {} since last export.'.format(', '.join(watermark_formats)))
+                    continue
+                logger.info('Exporting changes between imports {} and {} for {}...'.format(
+                    watermark, last_import_id, ', '.join(watermark_formats)))
+                changes = database.generate_changeset(old_import_id=watermark, new_import_id=last_import_id,
+                                                      include_dates='webuntis' in watermark_formats)
+                # use the same file names as if all formats were exported together
+                if max_workers:
+                    bbss.export.export_data_parallel(output_file, changes, watermark_formats,
+                                                     replace_illegal_characters, max_workers, use_processes=True,
+                                                     include_format_in_filename=len(formats) > 1)
+                else:
+                    bbss.export.export_data(output_file, changes, watermark_formats, replace_illegal_characters,
+                                            include_format_in_filename=len(formats) > 1)
+                # advance watermark only after all files were written completely
+                database.set_export_watermarks(watermark_formats, last_import_id)
+                exported_imports.update((f, (watermark, last_import_id)) for f in watermark_formats)
+        logger.info('Student list written to files.')
+        return exported_imports
+
+    def export_analytics(self, output_directory, file_format='parquet'):
+        """Writes all tables of the student database as columnar files (Parquet
+        or Arrow IPC) for analysing the student data with other tools."""
+        logger.info('Writing student database to {} files...'.format(file_format))
+        with self._lock:
+            output_files = bbss.analytics.export_database(output_directory, self.database, file_format)
+        logger.info('Student database written to {} files.'.format(len(output_files)))
+        return output_files
+
+    def export_user_images(self, image_archive, output_file, classes=None, changes_only=False, manifest_file=None,
+                           avatar_size=None):
+        """
+        Writes a ZIP archive with the photos of all students of the last import
+        named after their user names, e.g. as profile pictures for Moodle. The
+        photos are taken from an archive in which every photo is named after the
+        GUID of the student. Returns the number of copied, unchanged and missing
+        photos.
+
+        :param classes: list of class names to include, None for all classes
+        :param changes_only: whether to include only students added or changed
+                             by the last import
+        :param manifest_file: JSON file with the photos of previous exports, if
+                              given only new and changed photos are included
+        :param avatar_size: width and height in pixels to normalize all photos
+                            to, None to include the photos unchanged
+        """
+        if changes_only:
+            # changes between the next to last and the last import
+            changes = self.generate_changeset(old_import_id=-1)
+            students = changes.students_added + changes.students_changed
+        else:
+            students = self.generate_changeset(old_import_id=0).students_added
+        students = bbss.images.select_students(students, classes)
+        logger.info('Collecting photos of {} students...'.format(len(students)))
+        return bbss.images.collect_images(image_archive, output_file, students, manifest_file, avatar_size)
+
+    def upload_students_to_school_server(self, selected_students):
+        """
+        Uploads students to the school server and returns a summary with the
+        result for each student. All completed steps are stored in the journal,
+        so that an aborted upload of the same students is continued by the next
+        call.
+        """
+        logger.info('Upload following students to school server: "{0}".'.format(selected_students))
+        with self._lock:
+            journal = bbss.sso.UploadJournal(self.database)
+            summary = self._get_user_management().import_users(selected_students, journal=journal)
+            if summary.failed:
+                # keep the journal, so that the upload can be continued
+                logger.error('Upload of {} students failed.'.format(len(summary.failed)))
+                return summary
+            # entries of other students, e.g. of an aborted upload since the last import, are kept
+            journal.clear(selected_students)
+        logger.info('Upload complete.')
+        return summary
+
+    def reconcile_school_server(self, dry_run=False):
+        """
+        Compares all students of the last import with the users on the school
+        server and sends only the necessary changes (new users, updated names and
+        email addresses, changed classes and deactivated users). Returns the plan
+        of all changes and the summary for the created users (None for a dry run).
+        """
+        changes = self.generate_changeset(old_import_id=0)
+        logger.info('Reconciling {} students with school server...'.format(len(changes.students_added)))
+        plan, summary = self._get_user_management().reconcile(changes.students_added, dry_run)
+        logger.info('Reconciliation complete.')
+        return plan, summary
+
+    def upload_students_to_school_server_since_last(self):
+        """
+        Uploads all students added or changed since the last successful upload to
+        the school server and afterwards stores the last import as new watermark.
+        Users are created and get their initial password only for added students,
+        users of changed students are moved into the group of their new class and
+        keep their passwords. All completed steps are stored in a journal, so that
+        an aborted upload is continued by the next call.
+        """
+        with self._lock:
+            database = self.database
+            last_import_id = database.get_last_import_id()
+            watermark = database.get_export_watermark('sso')
+            if watermark >= last_import_id:
+                logger.info('No new imports since last upload to school server.')
+                return
+            changes = database.generate_changeset(old_import_id=watermark, new_import_id=last_import_id)
+            # continue an aborted upload without repeating completed steps
+            journal = bbss.sso.UploadJournal(database)
+            user_management = self._get_user_management()
+            # students in more than one class can be added and changed at the same time
+            added_students = [s for s in changes.students_added if s not in changes.students_changed]
+            logger.info('Upload following students to school server: "{0}".'.format(added_students))
+            summary = user_management.import_users(added_students, journal=journal)
+            if summary.failed:
+                # keep the watermark and the journal, so that the upload can be continued
+                logger.error('Upload of {} students failed.'.format(len(summary.failed)))
+                return summary
+            if changes.students_changed:
+                # existing users must not get their initial password again
+                logger.info('Update following students on school server: "{0}".'.format(changes.students_changed))
+                _, changed_summary = user_management.reconcile(changes.students_changed, deactivate_unknown=False)
+                if changed_summary.failed:
+                    logger.error('Update of {} students failed.'.format(len(changed_summary.failed)))
+                    return changed_summary
+            database.set_export_watermarks(['sso'], last_import_id)
+            journal.clear()
+        return summary
+
+    def sync_directory_since_last(self, servers, user, password, flavor='openldap', full=False, dry_run=False):
+        """
+        Synchronizes the accounts in a directory service (OpenLDAP or Active
+        Directory) with all changes since the last successful synchronization.
+        For a full synchronization all students of the last import are compared
+        with the directory and accounts of unknown students are deleted. Returns
+        the plan and the result of applying it (None for a dry run).
+        """
+        target = 'ldap' if flavor == 'openldap' else 'ldap-' + flavor
+        with self._lock:
+            database = self.database
+            last_import_id = database.get_last_import_id()
+            watermark = 0 if full else database.get_export_watermark(target)
+            if watermark >= last_import_id:
+                logger.info('No new imports since last synchronization with directory service.')
+                return [], None
+            changes = database.generate_changeset(old_import_id=watermark, new_import_id=last_import_id)
+            connection = bbss.ldap_sync.connect(servers, user, password)
+            try:
+                plan, result = bbss.ldap_sync.sync_directory(connection, changes, flavor, remove_unknown=full,
+                                                             dry_run=dry_run)
+            finally:
+                connection.unbind()
+            if result and not result.errors:
+                database.set_export_watermarks([target], last_import_id)
+        return plan, result
+
+    def generate_changeset(self, old_import_id=0, new_import_id=0, include_dates=False):
+        """Generates a changeset between two given imports."""
+        with self._lock:
+            return self.database.generate_changeset(old_import_id, new_import_id, include_dates=include_dates)
+
+    def store_students_db(self, importfile_name, callback=None):
+        """Stores a set of student data in student database.
+
+        The database is initialized the first time it is used. By calling this
+        function a newly imported student list will be added to the database.
+        In the database the name of the imported file is also stored for future
+        reference.
+
+        :param importfile_name: name of the file from which the students were
+                                imported (or the names of multiple files, if the
+                                students were merged from them)
+        :param callback: Function that is called after each of the students that
+                         are imported. First parameter is the current imported
+                         student, second parameter is the number of students to be
+                         imported.
+        """
+        with self._lock:
+            self.database.store_students_db(importfile_name, self.student_list, callback)
+            self.database.print_statistics()
+
+    def search_student_in_database(self, search_string):
+        with self._lock:
+            return self.database.search_for_student(search_string)
+
+    def get_imports_for_student(self, student):
+        """
+        Gets a list of the import IDs for all imports that contain the given
+        student. The student is identified by her first name, last name and
+        birthday.
+
+        :param student: student to find imports for
+        :return: list of imports containing the given student
+        """
+        with self._lock:
+            return self.database.get_imports_for_student(student.firstname, student.surname, student.birthday)
+
+    def compare_mail_addresses(self, moodle_user_file, differences_export_file):
+        """
+        Compare all current mail addresses, exported from Moodle, with the stored
+        mail addresses coming from BBS-Verwaltung.
+        """
+        same = 0
+        different = 0
+        differences_list = []
+        moodle_list = bbss.csv.import_user_list_from_moodle(moodle_user_file)
+        changeset = self.generate_changeset(old_import_id=0, new_import_id=0)
+        # loop through all students in database...
+        for s_db in changeset.students_added:
+            found = False
+            # ...and check whether the student can be found in the Moodle user list
+            for s_moodle in moodle_list:
+                # do a caseless comparison to ignore upper and lower case
+                if s_db.user_id.casefold() == s_moodle.user_id.casefold():
+                    found = True
+                    # remove automatically assigned mail addresses coming from Moodle
+                    if '@example.com' in s_moodle.email:
+                        s_moodle.email = ''
+                    if s_db.email.casefold() != s_moodle.email.casefold():
+                        differences_list.append((s_db, s_moodle))
+                        different += 1
+                    else:
+                        same += 1
+                    break
+            if not found:
+                logger.warning('Student {} not found in Moodle user list!'.format(s_db))
+        bbss.csv.export_differences_list(differences_export_file, differences_list)
+        logger.info('Same mail address: {}, different mail address: {}'.format(same, different))
+
+    def clear_database(self):
+        """
+        Clears database by removing its file from the filesystem.
+
+        All student data is stored in a database file on the filesystem in the
+        directory the main application is started. By calilng this function this
+        file will be deleted without a additional confirmation! Other sessions
+        for the same file have to be closed before.
+        """
+        with self._lock:
+            self.close()
+            try:
+                os.remove(self.database_file)
+            except FileNotFoundError as exception:
+                logger.info('No database file found: {}'.format(exception))
+
+    def get_class_history(self, student_id):
+        with self._lock:
+            return self.database.get_class_history(student_id)
+
+    def delete_old_data(self, retention_period, callback=None):
+        with self._lock:
+            return self.database.delete_old_data(retention_period, callback)
+
+    def get_usernames_and_ids(self):
+        with self._lock:
+            return self.database.get_usernames_and_ids()
+
+
+_default_session = None
+_default_session_lock = threading.Lock()
+
+
+def get_default_session():
+    """Returns the session used by all functions of this module, it is created on first use."""
+    global _default_session
+    with _default_session_lock:
+        if _default_session is None:
+            _default_session = BBSSSession()
+        return _default_session
+
+
+def __getattr__(name):
+    # the list of imported students and the database belong to the default session
+    if name == 'student_list':
+        return get_default_session().student_list
+    if name == 'student_database':
+        return get_default_session().database
+    raise AttributeError("module '{}' has no attribute '{}'".format(__name__, name))
 
 
 # TODO: Replace seperate functions for different import/export file formats
@@ -47,26 +449,23 @@ student_database = bbss.db.StudentDatabase()
 
 def import_csv_file(input_file):
     """Reads a csv file and adds student to list."""
-    logger.info('Importing students from file...')
-    global student_list
-    student_list = bbss.csv.import_data(input_file)
-    _check_for_doubles()
+    get_default_session().import_csv_file(input_file)
 
 
 def import_bbs_verwaltung_csv_file(input_file):
     """Reads a CVS file from BBS-Verwaltung and adds student to list."""
-    logger.info('Importing students from file...')
-    global student_list
-    student_list = bbss.bbs_verwaltung.import_data(input_file)
-    _check_for_doubles()
+    get_default_session().import_bbs_verwaltung_csv_file(input_file)
+
+
+def import_bbs_verwaltung_csv_files(input_files, max_workers=None):
+    """Reads multiple CSV files from BBS-Verwaltung concurrently and merges
+    all students into a single list."""
+    get_default_session().import_bbs_verwaltung_csv_files(input_files, max_workers)
 
 
 def import_excel_file(input_file, callback=None):
     """Reads a Microsoft Excel file and adds student to list."""
-    logger.info('Importing students from file...')
-    global student_list
-    student_list = bbss.xls.import_data(input_file, callback)
-    _check_for_doubles()
+    get_default_session().import_excel_file(input_file, callback)
 
 
 def export_csv_file(output_file, changes, replace_illegal_characters=True):
@@ -113,105 +512,119 @@ def export_iserv_file(output_file, changes):
     logger.info('Student list written to file.')
 
 
-def export_pdf_file(output_file, selected_students):
-    """Writes a PDF file to be distributed to the students."""
+def export_files(output_file, changes, formats, replace_illegal_characters=None):
+    """Writes files for multiple export formats in a single pass over the
+    student data."""
+    logger.info('Writing student data to files for {}...'.format(', '.join(formats)))
+    bbss.export.export_data(output_file, changes, formats, replace_illegal_characters)
+    logger.info('Student list written to files.')
+
+
+def export_files_parallel(output_file, changes, formats, replace_illegal_characters=None,
+                          max_workers=None, use_processes=False):
+    """Writes files for multiple export formats concurrently and returns the
+    time needed for each format."""
+    logger.info('Writing student data to files for {} in parallel...'.format(', '.join(formats)))
+    timings = bbss.export.export_data_parallel(output_file, changes, formats, replace_illegal_characters,
+                                               max_workers, use_processes)
+    logger.info('Student list written to files.')
+    return timings
+
+
+def export_files_since_last(output_file, formats, replace_illegal_characters=None, max_workers=None):
+    """See BBSSSession.export_files_since_last()."""
+    return get_default_session().export_files_since_last(output_file, formats, replace_illegal_characters,
+                                                         max_workers)
+
+
+def export_analytics(output_directory, file_format='parquet'):
+    """See BBSSSession.export_analytics()."""
+    return get_default_session().export_analytics(output_directory, file_format)
+
+
+def export_pdf_file(output_file, selected_students, max_workers=None, as_zip=False):
+    """
+    Writes a PDF file to be distributed to the students. The documents of all
+    classes are rendered in parallel and either merged into a single file or
+    stored as separate files in a ZIP archive.
+    """
     logger.info('Writing student list to PDF file...')
-    bbss.pdf.export_data(output_file, selected_students)
-    logger.info('Student list written to file.')
+    output_file = bbss.pdf.export_data(output_file, selected_students, max_workers, as_zip)
+    logger.info('Student list written to file: {}'.format(output_file))
+
+
+def export_user_images(image_archive, output_file, classes=None, changes_only=False, manifest_file=None,
+                       avatar_size=None):
+    """See BBSSSession.export_user_images()."""
+    return get_default_session().export_user_images(image_archive, output_file, classes, changes_only,
+                                                    manifest_file, avatar_size)
+
+
+def convert_user_list(input_file, output_file=None, domain=None, password_length=None, max_workers=1, callback=None):
+    """
+    Converts a user list exported from iServ into a CSV file for uploading
+    users into Moodle. Returns the name of the written file and the number
+    of converted users.
+
+    :param output_file: file name of the converted user list, by default
+                        the name of the input file with ".converted" added
+    :param domain: domain part of the email addresses, None for the default
+    :param password_length: length of generated passwords, None for the default
+    :param max_workers: maximum number of processes converting the user list
+    :param callback: function called with the number of bytes read and the
+                     size of the input file
+    """
+    if not output_file:
+        name, extension = os.path.splitext(input_file)
+        output_file = '{}.converted{}'.format(name, extension)
+    domain = domain or bbss.convert.DOMAIN
+    password_length = password_length or bbss.convert.PASSWORD_LENGTH
+    count = bbss.convert.convert_user_list(input_file, output_file, domain, password_length, max_workers, callback)
+    return output_file, count
 
 
 def upload_students_to_school_server(selected_students):
-    """Writes a PDF file to be distributed to the students."""
-    logger.info('Upload following students to school server: "{0}".'.format(selected_students))
-    bbss.sso.upload_data(selected_students)
-    logger.info('Upload complete.')
+    """Uploads students to the school server and returns a summary with the result for each student."""
+    return get_default_session().upload_students_to_school_server(selected_students)
 
 
-def generate_changeset(old_import_id=0, new_import_id=0, include_dates=False):
-    """Generates a changeset between two given imports."""
-    global student_database
-    changes = student_database.generate_changeset(old_import_id, new_import_id, include_dates=include_dates)
-    return changes
+def reconcile_school_server(dry_run=False):
+    """See BBSSSession.reconcile_school_server()."""
+    return get_default_session().reconcile_school_server(dry_run)
+
+
+def upload_students_to_school_server_since_last():
+    """See BBSSSession.upload_students_to_school_server_since_last()."""
+    return get_default_session().upload_students_to_school_server_since_last()
+
 
+def sync_directory_since_last(servers, user, password, flavor='openldap', full=False, dry_run=False):
+    """See BBSSSession.sync_directory_since_last()."""
+    return get_default_session().sync_directory_since_last(servers, user, password, flavor, full, dry_run)
 
-def _check_for_doubles():
-    """Checks for students with the same generated user name."""
-    logger.info('Checking student list for doubles...')
-    global student_list
-    seen = set()
-    for student in student_list:
-        if student.generate_user_id() in seen:
-            logger.warning('Double entry ' + student.generate_user_id())
-        seen.add(student.generate_user_id())
+
+def generate_changeset(old_import_id=0, new_import_id=0, include_dates=False):
+    """Generates a changeset between two given imports."""
+    return get_default_session().generate_changeset(old_import_id, new_import_id, include_dates)
 
 
 def store_students_db(importfile_name, callback=None):
-    """Stores a set of student data in student database.
-
-    The database is initialized the first time it is used. By calling this
-    function a newly imported student list will be added to the database.
-    In the database the name of the imported file is also stored for future
-    reference.
-
-    :param importfile_name: name of the file from which the students were
-                            imported
-    :param callback: Function that is called after each of the students that
-                     are imported. First parameter is the current imported
-                     student, second parameter is the number of students to be
-                     imported.
-    """
-    global student_database
-    student_database.store_students_db(importfile_name, student_list, callback)
-    student_database.print_statistics()
+    """See BBSSSession.store_students_db()."""
+    get_default_session().store_students_db(importfile_name, callback)
 
 
 def search_student_in_database(search_string):
-    return student_database.search_for_student(search_string)
+    return get_default_session().search_student_in_database(search_string)
 
 
 def get_imports_for_student(student):
-    """
-    Gets a list of the import IDs for all imports that contain the given
-    student. The student is identified by her first name, last name and
-    birthday.
-
-    :param student: student to find imports for
-    :return: list of imports containing the given student
-    """
-    return student_database.get_imports_for_student(student.firstname, student.surname, student.birthday)
+    """See BBSSSession.get_imports_for_student()."""
+    return get_default_session().get_imports_for_student(student)
 
 
 def compare_mail_addresses(moodle_user_file, differences_export_file):
-    """
-    Compare all current mail addresses, exported from Moodle, with the stored
-    mail addresses coming from BBS-Verwaltung.
-    """
-    same = 0
-    different = 0
-    differences_list = []
-    moodle_list = bbss.csv.import_user_list_from_moodle(moodle_user_file)
-    changeset = generate_changeset(old_import_id=0, new_import_id=0)
-    # loop through all students in database...
-    for s_db in changeset.students_added:
-        found = False
-        # ...and check whether the student can be found in the Moodle user list
-        for s_moodle in moodle_list:
-            # do a caseless comparison to ignore upper and lower case
-            if s_db.user_id.casefold() == s_moodle.user_id.casefold():
-                found = True
-                # remove automatically assigned mail addresses coming from Moodle
-                if '@example.com' in s_moodle.email:
-                    s_moodle.email = ''
-                if s_db.email.casefold() != s_moodle.email.casefold():
-                    differences_list.append((s_db, s_moodle))
-                    different += 1
-                else:
-                    same += 1
-                break
-        if not found:
-            logger.warning('Student {} not found in Moodle user list!'.format(s_db))
-    bbss.csv.export_differences_list(differences_export_file, differences_list)
-    logger.info('Same mail address: {}, different mail address: {}'.format(same, different))
+    """See BBSSSession.compare_mail_addresses()."""
+    get_default_session().compare_mail_addresses(moodle_user_file, differences_export_file)
 
 
 def clear_database():
@@ -222,22 +635,16 @@ def clear_database():
     directory the main application is started. By calilng this function this
     file will be deleted without a additional confirmation!
     """
-    try:
-        global student_database
-        student_database.close_connection()
-        os.remove(bbss.db.DB_FILENAME)
-        student_database = bbss.db.StudentDatabase()
-    except FileNotFoundError as exception:
-        logger.info('No database file found: {}'.format(exception))
+    get_default_session().clear_database()
 
 
 def get_class_history(student_id):
-    return student_database.get_class_history(student_id)
+    return get_default_session().get_class_history(student_id)
 
 
 def delete_old_data(retention_period, callback=None):
-    return student_database.delete_old_data(retention_period, callback)
+    return get_default_session().delete_old_data(retention_period, callback)
 
 
 def get_usernames_and_ids():
-    return student_database.get_usernames_and_ids()
+    return get_default_session().get_usernames_and_ids()
@@ -11,6 +11,9 @@ Created on Mon Feb  3 15:08:56 2013
 """
 
 
+import os
+
+
 # option whether to overwrite username and password at each import
 ALWAYS_OVERWRITE_USERNAME_AND_PASSWORD = False
 
@@ -23,6 +26,29 @@ ALWAYS_IMPORT_EMAIL_ADDRESSES = True
 SHOULD_SET_REMOVE_DATE_FROM_WEBUNTIS = True
 
 
+# domain of the SSO server (authentik) and API token for uploading students
+SSO_DOMAIN = 'auth.xxx.com'
+SSO_TOKEN = ''
+
+
+# number of HTTP connections to the SSO server kept open and reused between uploads
+SSO_POOL_SIZE = 8
+
+
+# timeouts in seconds for connecting to the SSO server and for reading its responses
+SSO_CONNECT_TIMEOUT = 5
+SSO_READ_TIMEOUT = 60
+
+
+# time in seconds that lists of users and groups read from the SSO server are reused
+SSO_CACHE_TTL = 300
+
+
+# directory storing data that is reused between runs, e.g. normalized photos of students
+CACHE_DIRECTORY = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'),
+                               'bbss')
+
+
 # black list of classes not to load
 class_blacklist = ('OWH', 'OWSMO', 'OWSDI', 'OWSMI', 'OWSDO')
 
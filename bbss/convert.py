@@ -0,0 +1,173 @@
+
+"""
+bbss - BBS Student Management
+
+Converts user lists exported from iServ into the CSV format for uploading
+users into Moodle. Accounts without password get a new random password.
+
+The user list is read as a stream in chunks of rows. Rows are handled as
+tuples and the columns are looked up once in the header. The passwords for
+all rows of a chunk are generated at once from a single block of random
+bytes. Chunks can be converted in a pool of processes while the next chunks
+are read, so that converting large user lists is limited only by reading
+and writing the files.
+
+Created on Tue Oct 20 10:05:37 2026
+
+@author: Christian Wichmann
+"""
+
+
+import io
+import os
+import csv
+import string
+import logging
+import secrets
+import itertools
+import collections
+import concurrent.futures
+
+from bbss import fileio
+
+
+__all__ = ['convert_user_list', 'generate_passwords']
+
+
+logger = logging.getLogger('bbss.convert')
+
+
+# columns of the user list exported from iServ: surname, first name, class, account and password
+INPUT_COLUMNS = ('Nachname', 'Vorname', 'Klasse/Information', 'Account', 'Passwort')
+
+# columns of the converted user list for uploading users into Moodle
+OUTPUT_HEADER = ('lastname', 'firstname', 'cohort1', 'username', 'email', 'password', 'profile_field_source', 'auth')
+
+# mark all students as imported from iServ and all accounts as using OAuth2 authentication
+SOURCE = 'iServ'
+AUTH = 'oauth2'
+
+DOMAIN = 'bbs-brinkstrasse.net'
+PASSWORD_LENGTH = 24
+PASSWORD_ALPHABET = string.ascii_letters + string.digits
+
+# number of rows converted at once
+CHUNK_SIZE = 10000
+
+# random bytes are mapped onto the alphabet, bytes above the largest multiple
+# of the length of the alphabet are dropped, so that all characters are
+# equally likely
+_LIMIT = 256 - 256 % len(PASSWORD_ALPHABET)
+_PASSWORD_TABLE = bytes(ord(PASSWORD_ALPHABET[b % len(PASSWORD_ALPHABET)]) for b in range(_LIMIT)) + bytes(256 - _LIMIT)
+_REJECTED_BYTES = bytes(range(_LIMIT, 256))
+
+
+def generate_passwords(count, length=PASSWORD_LENGTH):
+    """
+    Generates random passwords of letters and digits. All characters are
+    taken from a single block of random bytes of the secrets module.
+
+    :param count: number of passwords
+    :param length: number of characters of every password
+    :return: list of passwords
+    """
+    needed = count * length
+    characters = b''
+    while len(characters) < needed:
+        # some bytes are dropped, so request a little more than needed
+        block = secrets.token_bytes((needed - len(characters)) * 17 // 16 + 16)
+        characters += block.translate(_PASSWORD_TABLE, _REJECTED_BYTES)
+    characters = characters[:needed].decode('ascii')
+    return [characters[i:i + length] for i in range(0, needed, length)]
+
+
+def _find_columns(header):
+    """Returns the index of every input column in the header or None, if a column is missing."""
+    header = [name.strip() for name in header]
+    return tuple(header.index(name) if name in header else None for name in INPUT_COLUMNS)
+
+
+def _convert_chunk(rows, columns, domain, password_length):
+    """
+    Converts a chunk of rows and returns them as CSV text.
+
+    :param rows: list of rows of the user list, each as list of strings
+    :param columns: index of every input column, see _find_columns()
+    :param domain: domain part of the email addresses
+    :param password_length: length of generated passwords
+    :return: converted rows as text in CSV format
+    """
+    values = [tuple(row[i].strip() if i is not None and i < len(row) else '' for i in columns) for row in rows]
+    passwords = iter(generate_passwords(sum(1 for v in values if not v[4]), password_length))
+    output = io.StringIO()
+    writer = csv.writer(output, delimiter=';')
+    writer.writerows((surname, firstname, classname, username, f'{username}@{domain}' if username else '',
+                      password or next(passwords), SOURCE, AUTH)
+                     for surname, firstname, classname, username, password in values)
+    return output.getvalue()
+
+
+def _read_chunks(reader):
+    # skip blank lines and rows without any value like the former conversion with csv.DictReader
+    reader = (row for row in reader if any(field.strip() for field in row))
+    while True:
+        rows = list(itertools.islice(reader, CHUNK_SIZE))
+        if not rows:
+            return
+        yield rows
+
+
+def convert_user_list(input_file, output_file, domain=DOMAIN, password_length=PASSWORD_LENGTH, max_workers=1,
+                      callback=None):
+    """
+    Converts a user list exported from iServ into a CSV file for uploading
+    users into Moodle.
+
+    :param input_file: file name of the user list exported from iServ
+    :param output_file: file name of the converted user list
+    :param domain: domain part of the email addresses
+    :param password_length: length of generated passwords for accounts without password
+    :param max_workers: maximum number of processes converting chunks of
+                        rows, 1 to convert all rows in the current process
+    :param callback: function called after every chunk with the number of
+                     bytes read and the size of the input file
+    :return: number of converted rows
+    """
+    logger.info('Converting user list {}...'.format(input_file))
+    total_size = os.path.getsize(input_file)
+    count = 0
+    with open(input_file, 'r', encoding='utf-8-sig', newline='') as input_csv, \
+            fileio.atomic_open(output_file, 'w', encoding='utf-8', newline='') as output_csv:
+        reader = csv.reader(input_csv)
+        columns = _find_columns(next(reader, []))
+        for name, index in zip(INPUT_COLUMNS, columns):
+            if index is None:
+                logger.warning('Column {} not found in user list.'.format(name))
+        csv.writer(output_csv, delimiter=';').writerow(OUTPUT_HEADER)
+
+        def write(chunk_size, text):
+            nonlocal count
+            output_csv.write(text)
+            count += chunk_size
+            if callback:
+                callback(input_csv.buffer.tell(), total_size)
+
+        if max_workers == 1:
+            for rows in _read_chunks(reader):
+                write(len(rows), _convert_chunk(rows, columns, domain, password_length))
+        else:
+            # keep only a few chunks in memory while they are converted
+            window_size = 2 * (max_workers or os.cpu_count() or 1)
+            window = collections.deque()
+            with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+                for rows in _read_chunks(reader):
+                    window.append((len(rows), executor.submit(_convert_chunk, rows, columns, domain,
+                                                              password_length)))
+                    if len(window) >= window_size:
+                        chunk_size, future = window.popleft()
+                        write(chunk_size, future.result())
+                while window:
+                    chunk_size, future = window.popleft()
+                    write(chunk_size, future.result())
+    logger.info('{} users converted into file {}.'.format(count, output_file))
+    return count
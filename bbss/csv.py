@@ -16,9 +16,11 @@ import logging
 import datetime
 
 from bbss import data
+from bbss import export
+from bbss import fileio
 
 
-__all__ = ['import_data', 'export_data', 'import_user_list_from_moodle', 'export_differences_list']
+__all__ = ['import_data', 'export_data', 'import_user_list_from_moodle', 'export_differences_list', 'CsvWriter']
 
 
 logger = logging.getLogger('bbss.csv')
@@ -36,7 +38,7 @@ column_map = {'surname': 0,
 def import_data(import_file):
     student_count = 0
     student_list = []
-    with open(import_file, 'r', newline='', encoding='utf8') as csvfile:
+    with fileio.open_import_file(import_file, encoding='utf8', newline='') as csvfile:
         # TODO Set dialect for csv.reader?
         student_file_reader = csv.reader(csvfile)
         # find columns from file
@@ -89,45 +91,33 @@ def _read_student(row, student_list):
 
 
 def export_data(output_file, change_set, replace_illegal_characters=True):
-    if os.path.exists(output_file):
-        logger.warning('Output file already exists, will be overwritten...')
-    with open(output_file, 'w', newline='', encoding='utf8') as csvfile:
-        output_file_writer = csv.writer(csvfile, delimiter=';')
-        output_file_writer.writerow(('Class', 'Name', 'Firstname', 'UserID',
-                                     'Password'))
-        for student in sorted(change_set.students_added):
-            _write_student(student, output_file_writer,
-                           replace_illegal_characters)
-
-
-def _write_student(student, output_file_writer, replace_illegal_characters):
-    """Writes a single student (her/his data) to file writer of csv file."""
-    # get data from change set
-    class_of_student = student.get_class_name_for_class_id()
-    surname_of_student = student.surname
-    firstname_of_student = student.firstname
-    # replace illegal characters if needed
-    if replace_illegal_characters:
-        class_of_student, surname_of_student, firstname_of_student =\
-            map(data.replace_illegal_characters,
-                (class_of_student, surname_of_student,
-                 firstname_of_student))
-        # check for non ascii characters in string
-        try:
-            class_of_student.encode('ascii')
-            surname_of_student.encode('ascii')
-            firstname_of_student.encode('ascii')
-        except UnicodeEncodeError:
-            logger.warning('Non ascii characters in %s %s in %s' %
-                           (firstname_of_student,
-                            surname_of_student,
-                            class_of_student))
-    # output student data for change set into file
-    output_file_writer.writerow((class_of_student,
-                                 surname_of_student,
-                                 firstname_of_student,
-                                 student.generate_user_id(),
-                                 student.generate_password()))
+    export.export_changeset(change_set, [CsvWriter(output_file, replace_illegal_characters)])
+
+
+class CsvWriter(export.Writer):
+    """
+    Writes a CSV file containing class, name, user id and password of all
+    added students, e.g. to import them into Logodidact.
+    """
+    def __init__(self, output_file, replace_illegal_characters=True):
+        super().__init__(output_file, replace_illegal_characters)
+
+    def open(self):
+        self._output_file_writer = self._open_csv_file(self.output_file,
+                                                       ('Class', 'Name', 'Firstname', 'UserID', 'Password'))
+
+    def write(self, record):
+        """Writes a single student (her/his data) to file writer of csv file."""
+        if record.change != export.ADDED:
+            return
+        class_of_student, surname_of_student, firstname_of_student = \
+            record.names(self.replace_illegal_characters)
+        # output student data for change set into file
+        self._output_file_writer.writerow((class_of_student,
+                                           surname_of_student,
+                                           firstname_of_student,
+                                           record.user_id,
+                                           record.password))
 
 
 def import_user_list_from_moodle(import_file):
@@ -146,7 +136,7 @@ def import_user_list_from_moodle(import_file):
                   'profile_field_dateofbirth', 'profile_field_placeofbirth',
                   'profile_field_gender', 'profile_field_class']
     student_list = []
-    with open(import_file, 'r', encoding='utf-8') as csvfile:
+    with fileio.open_import_file(import_file, encoding='utf-8') as csvfile:
         reader = csv.DictReader(csvfile, delimiter=',', fieldnames=fieldnames)
         for row in reader:
             username = row['username']
@@ -10,6 +10,7 @@ Created on Mon Feb  3 15:08:56 2014
 @author: Christian Wichmann
 """
 
+import copy
 import random
 import logging
 import string
@@ -59,6 +60,10 @@ class Student(object):
         # store initial user account data if it was imported
         self.initial_username = ''
         self.initial_password = ''
+        # store name of the file the student was imported from
+        self.source_file = ''
+        # store class name before the student changed class (only for changed students in a change set)
+        self.old_classname = ''
 
     def __str__(self):
         return "<{0} {1} from {2}>".format(self.firstname,
@@ -315,3 +320,26 @@ class ChangeSet(object):
 
     def get_statistics(self):
         return ChangeSetStatistics(len(self.students_added), len(self.students_changed), len(self.students_removed))
+
+    def snapshot(self):
+        """
+        Returns a read-only copy of this change set that can be shared between
+        multiple threads or processes. All lists are replaced by sorted tuples
+        containing copies of the students. User IDs and passwords are generated
+        beforehand, so that the students are never altered while exporting.
+        """
+        def copy_students(students):
+            copies = []
+            for s in students:
+                s = copy.copy(s)
+                s.generate_user_id()
+                s.generate_password()
+                copies.append(s)
+            return tuple(sorted(copies))
+        snapshot = ChangeSet()
+        snapshot.students_added = copy_students(self.students_added)
+        snapshot.students_removed = copy_students(self.students_removed)
+        snapshot.students_changed = copy_students(self.students_changed)
+        snapshot.classes_added = tuple(self.classes_added)
+        snapshot.classes_removed = tuple(self.classes_removed)
+        return snapshot
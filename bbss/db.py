@@ -10,9 +10,12 @@ Created on Mon Feb  3 15:08:56 2014
 @author: Christian Wichmann
 """
 
+import os
 import sqlite3
+import pathlib
 import datetime
 import logging
+import collections
 
 from bbss import data
 from bbss import config
@@ -21,6 +24,10 @@ logger = logging.getLogger('bbss.db')
 
 DB_FILENAME = 'students.db'
 
+# seconds to wait for a lock held by another connection, e.g. of a session in
+# another thread or process, before an error is raised
+TIMEOUT = 30
+
 
 #
 # Technical notes on database schema:
@@ -43,19 +50,37 @@ DB_FILENAME = 'students.db'
 
 class StudentDatabase(object):
     """Connects to database and allows to store and get student data."""
-    def __init__(self):
-        """Initializes a new database to store student information."""
+    def __init__(self, filename=None, read_only=False, check_same_thread=True):
+        """
+        Initializes a new database to store student information.
+
+        :param filename: file name of the database, None for DB_FILENAME
+        :param read_only: whether to open an existing database only for
+                          reading, e.g. for searching in a worker thread
+                          beside the main connection
+        :param check_same_thread: whether the connection may only be used
+                                  by the thread that opened it, otherwise
+                                  the caller has to serialize all accesses
+        """
         logger.info('Initializing student database...')
         # register adapters for storing and getting UUID to/from database
         # source: https://stackoverflow.com/a/18842491
         #sqlite3.register_converter('GUID', lambda b: uuid.UUID(bytes_le=b))
         #sqlite3.register_adapter(uuid.UUID, lambda u: memoryview(u.bytes_le))
         # connecting to database
-        self.conn = sqlite3.connect(DB_FILENAME) #detect_types=sqlite3.PARSE_DECLTYPES
+        self.filename = filename or DB_FILENAME
+        if read_only:
+            # urllib.request is not used to build the URI, because importing it takes longer than everything else
+            uri = '{}?mode=ro'.format(pathlib.Path(os.path.abspath(self.filename)).as_uri())
+            self.conn = sqlite3.connect(uri, uri=True, timeout=TIMEOUT, check_same_thread=check_same_thread)
+        else:
+            self.conn = sqlite3.connect(self.filename, timeout=TIMEOUT,
+                                        check_same_thread=check_same_thread) #detect_types=sqlite3.PARSE_DECLTYPES
         # change the row factory to use Row to allow access via column name
         self.conn.row_factory = sqlite3.Row
         self.cur = self.conn.cursor()
-        self.create_tables()
+        if not read_only:
+            self.create_tables()
 
     def __del__(self):
         self.close_connection()
@@ -69,7 +94,11 @@ class StudentDatabase(object):
         Per default the version is "0" if a new database is created. In the first
         version the tables Imports, Students and StudentsInImports are created.
         The second version (September 2015) changed how the class information is
-        stored. (See technical note above!)
+        stored. (See technical note above!) Since version 7 the files from which
+        the students of an import were read, are stored in table ImportSources.
+        Version 8 adds the table ExportWatermarks with the last import that was
+        exported successfully for each export target. Version 9 adds the table
+        SsoJournal with all completed steps of an upload to the SSO server.
         """
         user_version = self.get_database_version()
         if user_version == 0:
@@ -108,6 +137,24 @@ class StudentDatabase(object):
             self.cur.execute("""ALTER TABLE Students ADD COLUMN initial_username TEXT DEFAULT ""; """)
             self.cur.execute("""ALTER TABLE Students ADD COLUMN initial_password TEXT DEFAULT ""; """)
             self.set_database_version(6)
+        if user_version <= 6:
+            self.cur.execute("""CREATE TABLE IF NOT EXISTS ImportSources (
+                                import_id INT NOT NULL, filename TEXT NOT NULL,
+                                student_count INT NOT NULL,
+                                FOREIGN KEY(import_id) REFERENCES Imports(id))""")
+            self.set_database_version(7)
+        if user_version <= 7:
+            self.cur.execute("""CREATE TABLE IF NOT EXISTS ExportWatermarks (
+                                target TEXT PRIMARY KEY, import_id INT NOT NULL,
+                                date DATE NOT NULL,
+                                FOREIGN KEY(import_id) REFERENCES Imports(id))""")
+            self.set_database_version(8)
+        if user_version <= 8:
+            self.cur.execute("""CREATE TABLE IF NOT EXISTS SsoJournal (
+                                username TEXT NOT NULL, step TEXT NOT NULL,
+                                data TEXT DEFAULT "", date DATE NOT NULL,
+                                PRIMARY KEY(username, step))""")
+            self.set_database_version(9)
         self.conn.commit()
 
     def set_database_version(self, new_version):
@@ -150,6 +197,10 @@ class StudentDatabase(object):
         self.cur.execute("INSERT INTO Imports VALUES(NULL,?,?)",
                          (importfile_name, datetime.date.today()))
         import_id = self.cur.lastrowid
+        # store from which files the students were read, if an import was merged from multiple files
+        student_count_per_file = collections.Counter(s.source_file for s in student_list if s.source_file)
+        self.cur.executemany('INSERT INTO ImportSources VALUES (?,?,?)',
+                             [(import_id, f, c) for f, c in student_count_per_file.items()])
         self.conn.commit()
 
         # storing all students in database
@@ -235,6 +286,79 @@ class StudentDatabase(object):
                                  (student_id, import_id, student.classname))
         self.conn.commit()
 
+    def get_import_sources(self, import_id):
+        """
+        Returns the names of all files from which the students of a given import
+        were read.
+
+        :param import_id: ID of the import
+        :return: list of tuples containing file name and number of students
+        """
+        self.cur.execute('SELECT filename, student_count FROM ImportSources WHERE import_id=?;', (import_id, ))
+        return [(r['filename'], r['student_count']) for r in self.cur.fetchall()]
+
+    def get_export_watermark(self, target):
+        """
+        Returns the ID of the last import that was exported successfully for a
+        given export target, e.g. "moodle" or "sso".
+
+        :param target: name of the export target
+        :return: import ID or 0 if nothing was exported for this target yet
+        """
+        self.cur.execute('SELECT import_id FROM ExportWatermarks WHERE target=?;', (target, ))
+        result_data = self.cur.fetchone()
+        return result_data['import_id'] if result_data else 0
+
+    def set_export_watermarks(self, targets, import_id):
+        """
+        Stores the ID of the last import that was exported successfully for all
+        given export targets. All targets are updated in a single transaction.
+
+        :param targets: list of names of export targets
+        :param import_id: ID of the import that was exported
+        """
+        with self.conn:
+            self.conn.executemany('INSERT OR REPLACE INTO ExportWatermarks VALUES (?,?,?);',
+                                  [(t, import_id, datetime.date.today()) for t in targets])
+        logger.debug('Export watermark for {} set to import {}.'.format(', '.join(targets), import_id))
+
+    def get_sso_journal(self):
+        """
+        Returns all completed steps of the last upload to the SSO server, that
+        was not finished.
+
+        :return: dictionary mapping user names to dictionaries of names of
+                 completed steps and the data stored with them
+        """
+        journal = collections.defaultdict(dict)
+        self.cur.execute('SELECT username, step, data FROM SsoJournal;')
+        for r in self.cur.fetchall():
+            journal[r['username']][r['step']] = r['data']
+        return dict(journal)
+
+    def add_sso_journal_entries(self, entries):
+        """
+        Stores completed steps of an upload to the SSO server in a single
+        transaction.
+
+        :param entries: list of tuples with user name, name of the step and data
+        """
+        with self.conn:
+            self.conn.executemany('INSERT OR REPLACE INTO SsoJournal VALUES (?,?,?,?);',
+                                  [(u, s, d, datetime.date.today()) for u, s, d in entries])
+
+    def clear_sso_journal(self, usernames=None):
+        """
+        Removes entries of the journal after an upload was finished.
+
+        :param usernames: user names to remove the entries of, None for all
+        """
+        with self.conn:
+            if usernames is None:
+                self.conn.execute('DELETE FROM SsoJournal;')
+            else:
+                self.conn.executemany('DELETE FROM SsoJournal WHERE username=?;', [(u,) for u in usernames])
+
     def print_statistics(self):
         # get statistics
         last_import_id = self.get_last_import_id()
@@ -324,20 +448,44 @@ class StudentDatabase(object):
         return entry_date, exit_date
 
     def search_for_student(self, search_string):
+        return list(self.iter_search_results(search_string))
+
+    def iter_search_results(self, search_string, batch_size=500, with_search_fields=False):
+        """
+        Searches for students whose name, class or birthday contains the given
+        string. The results are read in batches from a separate cursor and
+        Student objects are only built for the rows actually fetched, so that
+        the first results are available immediately even for large results.
+
+        :param search_string: string to search for
+        :param batch_size: number of rows read from the cursor at once
+        :param with_search_fields: whether to yield tuples of the searched
+                                   fields (surname, firstname, classname and
+                                   birthday as stored in table Students) and
+                                   the Student object instead
+        :return: generator yielding Student objects
+        """
         # TODO: Check whether this search gets last class, student is/was in?!
-        select_stmt = """SELECT id, surname, firstname, birthday, username, password, email, guid, courses, initial_username, initial_password, class_in_import, MAX(import_id)
+        select_stmt = """SELECT id, surname, firstname, classname, birthday, username, password, email, guid, courses, initial_username, initial_password, class_in_import, MAX(import_id)
                          FROM (SELECT * FROM Students
                          WHERE surname LIKE ? OR firstname LIKE ?
                          OR classname LIKE ? OR birthday LIKE ?
                          ) JOIN StudentsInImports ON student_id = id GROUP BY student_id"""
-        student_list = []
-        search_string = ('%{}%'.format(search_string), ) * 4
-        self.cur.execute(select_stmt, search_string)
-        result_data = self.cur.fetchall()
-        for student in result_data:
-            s = self.build_student(student)
-            student_list.append(s)
-        return student_list
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(select_stmt, ('%{}%'.format(search_string), ) * 4)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for student in rows:
+                    if with_search_fields:
+                        fields = (student['surname'], student['firstname'], student['classname'], student['birthday'])
+                        yield fields, self.build_student(student)
+                    else:
+                        yield self.build_student(student)
+        finally:
+            cursor.close()
 
     def get_imports_for_student(self, firstname, surname, birthday):
         """
@@ -457,9 +605,9 @@ class StudentDatabase(object):
                                SELECT * FROM (
                                  SELECT Students.id, Students.surname, Students.firstname, Students.classname, Students.birthday,
                                        Students.username, Students.password, Students.email, Students.guid, Students.courses,
-                                       Students.initial_username, Students.initial_password
+                                       Students.initial_username, Students.initial_password, old_class_name
                                  FROM (
-                                    SELECT student_id, import_id FROM ClassChanges WHERE import_id BETWEEN ? AND ?
+                                    SELECT student_id, import_id, old_class_name FROM ClassChanges WHERE import_id BETWEEN ? AND ?
                                  ) JOIN Students ON student_id = id
                                ) JOIN StudentsInImports ON StudentsInImports.import_id = import_id AND StudentsInImports.student_id = id
                                """ 
@@ -468,9 +616,12 @@ class StudentDatabase(object):
         logger.debug('Changed students are: ')
         for student in result_data:
             s = self.build_student(student, include_dates=include_dates)
+            s.old_classname = student['old_class_name']
             logger.debug('\t' + str(s))
             # skip student, if already in list, because that can happen, if students are associated with multiple classes
             if s in change_set.students_changed:
+                # keep the class name from before the first class change between both imports
+                s.old_classname = change_set.students_changed[change_set.students_changed.index(s)].old_classname
                 # delete student entry that is already in list and add new student entry
                 # (should pretend wrong class information in exports, because multiple entries
                 # are returned from database and only the last one has the correct class info!!!)
@@ -619,6 +770,31 @@ class StudentDatabase(object):
         cs = self.generate_changeset(old_import_id=0, new_import_id=0)
         return [(s.guid, s.user_id) for s in cs.students_added]
 
+    def get_table_in_batches(self, table_name, columns, batch_size=10000):
+        """
+        Reads all rows of a table in batches, so that even large tables can be
+        processed with constant memory. A separate cursor is used, so that
+        other queries can be executed while iterating over the batches.
+
+        :param table_name: name of the table, e.g. "Students"
+        :param columns: list of names of the columns to be read
+        :param batch_size: maximum number of rows in each batch
+        :return: generator yielding lists of tuples with the values of all columns
+        """
+        if table_name not in ('Imports', 'Students', 'StudentsInImports', 'ClassChanges', 'ImportSources',
+                              'ExportWatermarks', 'SsoJournal'):
+            raise ValueError('Unknown table: {}'.format(table_name))
+        cursor = self.conn.cursor()
+        # use plain tuples instead of Row objects, because they are converted into columns afterwards
+        cursor.row_factory = None
+        cursor.execute('SELECT {} FROM {} ORDER BY rowid;'.format(', '.join(columns), table_name))
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+        cursor.close()
+
     def close_connection(self):
         """Closes connection to database."""
         self.conn.close()
@@ -0,0 +1,385 @@
+
+"""
+bbss - BBS Student Management
+
+Export engine writing a change set into multiple file formats in a single
+pass. The students of the change set are sorted only once and all data
+derived from a student (user name, password, class identifier, names without
+illegal characters) is computed only once, before the student is handed to
+the writers of all requested export formats.
+
+Created on Mon Oct 19 13:20:41 2026
+
+@author: Christian Wichmann
+"""
+
+
+import os
+import abc
+import csv
+import time
+import heapq
+import logging
+import importlib
+import concurrent.futures
+from functools import cached_property
+
+from bbss import data
+from bbss import fileio
+
+
+__all__ = ['export_data', 'export_data_parallel', 'export_changeset', 'iter_records', 'get_writer',
+           'register_writer', 'available_formats', 'ExportRecord', 'Writer']
+
+
+logger = logging.getLogger('bbss.export')
+
+
+# types of changes a student record can belong to
+ADDED = 'added'
+CHANGED = 'changed'
+REMOVED = 'removed'
+
+# file name for writing to standard output instead of a file (only for some formats)
+STDOUT = '-'
+
+
+# map names of export formats to the writer classes, given as "module:class"
+# so that modules are only imported when their format is actually used
+_writers = {'logodidact': 'bbss.csv:CsvWriter',
+            'moodle': 'bbss.moodle:MoodleWriter',
+            'webuntis': 'bbss.webuntis:WebUntisWriter',
+            'iserv': 'bbss.iserv:IServWriter',
+            'labsoft': 'bbss.labsoft:LabSoftWriter',
+            'radius': 'bbss.radius:RadiusWriter',
+            'pdf': 'bbss.pdf:PdfWriter',
+            'parquet': 'bbss.analytics:ParquetWriter',
+            'arrow': 'bbss.analytics:ArrowWriter',
+            'jsonl': 'bbss.jsonl:JsonLinesWriter',
+            'ldif': 'bbss.ldif:LdifWriter',
+            'ldif-ad': 'bbss.ldif:ActiveDirectoryLdifWriter'}
+
+
+def register_writer(format_name, writer):
+    """
+    Registers a writer for an export format.
+
+    :param format_name: name of the export format, e.g. "moodle"
+    :param writer: writer class or string "module:class" naming the class
+    """
+    _writers[format_name] = writer
+
+
+def available_formats():
+    """Returns the names of all registered export formats."""
+    return sorted(_writers)
+
+
+def get_writer(format_name):
+    """
+    Returns the writer class for a given export format. If the writer was
+    registered by name, its module is imported on first use.
+
+    :param format_name: name of the export format
+    :return: writer class for the given format
+    """
+    try:
+        writer = _writers[format_name]
+    except KeyError:
+        raise ValueError('Unknown export format "{}" (available: {}).'.format(
+            format_name, ', '.join(available_formats())))
+    if isinstance(writer, str):
+        module_name, class_name = writer.split(':')
+        writer = getattr(importlib.import_module(module_name), class_name)
+        _writers[format_name] = writer
+    return writer
+
+
+class ExportRecord(object):
+    """
+    Holds a single student of a change set and the kind of change (added,
+    changed or removed). All values derived from the student, that are used by
+    more than one export format, are computed on first access and afterwards
+    reused by all writers.
+    """
+    def __init__(self, student, change):
+        self.student = student
+        self.change = change
+
+    def __str__(self):
+        return '<ExportRecord: {} ({})>'.format(self.student, self.change)
+
+    @cached_property
+    def user_id(self):
+        return self.student.generate_user_id()
+
+    @cached_property
+    def username(self):
+        """User name as lowercase string, as used by most of the export formats."""
+        return self.user_id.lower()
+
+    @cached_property
+    def password(self):
+        return self.student.generate_password()
+
+    @cached_property
+    def class_id(self):
+        return self.student.get_class_name_for_class_id()
+
+    @cached_property
+    def ascii_names(self):
+        """Class identifier, surname and firstname with all illegal characters replaced."""
+        names = tuple(map(data.replace_illegal_characters,
+                          (self.class_id, self.student.surname, self.student.firstname)))
+        # check for non ascii characters in string
+        try:
+            ''.join(names).encode('ascii')
+        except UnicodeEncodeError:
+            logger.warning('Non ascii characters in %s %s in %s' % (names[2], names[1], names[0]))
+        return names
+
+    def names(self, replace_illegal_characters):
+        """
+        Returns class identifier, surname and firstname of the student.
+
+        :param replace_illegal_characters: whether to replace illegal (non-ASCII)
+                                           characters in class and student names
+        """
+        if replace_illegal_characters:
+            return self.ascii_names
+        return self.class_id, self.student.surname, self.student.firstname
+
+
+class Writer(abc.ABC):
+    """
+    Base class for writing a change set into the files of one export format.
+
+    The export engine calls open() once, then write_class() for every added
+    and removed class, write() for every student of the change set (in sorted
+    order, added and changed students first, removed students last) and
+    finish() after the last student. Writers collecting data, e.g. for a PDF
+    file, write their files in finish(). After all writers were finished,
+    prepare() writes their files to disk and close() is called to commit
+    them. If an error occurs, abort() is called instead of close().
+
+    All files are written atomically. They appear under their final names only
+    after close() was called.
+    """
+    # file extension used by this format instead of the extension of the given file name
+    extension = None
+
+    def __init__(self, output_file, replace_illegal_characters=False):
+        self.output_file = output_file
+        self.replace_illegal_characters = replace_illegal_characters
+        self._files = []
+
+    def open(self):
+        pass
+
+    def write_class(self, class_name, change):
+        pass
+
+    @abc.abstractmethod
+    def write(self, record):
+        """Writes a single student of the change set, given as ExportRecord."""
+
+    def finish(self):
+        pass
+
+    def prepare(self):
+        """Writes all files completely to disk, so that committing them only renames them."""
+        for f in self._files:
+            f.prepare()
+
+    def close(self):
+        """Commits all files by renaming them to their final names."""
+        for f in self._files:
+            f.commit()
+        self._files = []
+
+    def abort(self):
+        for f in self._files:
+            f.discard()
+        self._files = []
+
+    def _get_filename(self, infix):
+        """Builds file name for additional output files, e.g. "students.added.csv"."""
+        return _insert_into_filename(self.output_file, infix)
+
+    def _open_file(self, filename, encoding='utf8', newline=''):
+        if os.path.exists(filename):
+            logger.warning('Output file already exists, will be overwritten...')
+        output = fileio.atomic_open(filename, 'w', newline=newline, encoding=encoding)
+        self._files.append(output)
+        return output
+
+    def _open_binary_file(self, filename):
+        if os.path.exists(filename):
+            logger.warning('Output file already exists, will be overwritten...')
+        output = fileio.atomic_open(filename, 'wb')
+        self._files.append(output)
+        return output
+
+    def _open_csv_file(self, filename, header, encoding='utf8', delimiter=';'):
+        output_file_writer = csv.writer(self._open_file(filename, encoding), delimiter=delimiter)
+        output_file_writer.writerow(header)
+        return output_file_writer
+
+
+def _insert_into_filename(filename, infix):
+    """Inserts a string before the extension of a file name."""
+    base, extension = os.path.splitext(filename)
+    return '{}.{}{}'.format(base, infix, extension)
+
+
+def iter_records(change_set):
+    """
+    Sorts the students of a change set and yields a record for each of them.
+    Added and changed students are merged into a single sorted sequence,
+    removed students follow afterwards.
+
+    :param change_set: object representing all changes between given imports
+    :return: generator yielding ExportRecord objects
+    """
+    added = (ExportRecord(s, ADDED) for s in sorted(change_set.students_added))
+    changed = (ExportRecord(s, CHANGED) for s in sorted(change_set.students_changed))
+    yield from heapq.merge(added, changed, key=lambda r: r.student)
+    for s in sorted(change_set.students_removed):
+        yield ExportRecord(s, REMOVED)
+
+
+def export_changeset(change_set, writers):
+    """
+    Writes a change set with all given writers in a single pass over its
+    students. The files of all writers are written to disk under temporary
+    names and only committed after all writers were finished successfully. If
+    one of them fails before, no files are written. Committing only renames
+    the files one writer after another. If renaming fails, the files of
+    writers committed before are kept and the files of all other writers are
+    removed.
+
+    :param change_set: object representing all changes between given imports
+    :param writers: list of writer objects for the requested export formats
+    """
+    committed = 0
+    try:
+        for writer in writers:
+            writer.open()
+        for change, classes in ((ADDED, change_set.classes_added), (REMOVED, change_set.classes_removed)):
+            for class_name in sorted(classes):
+                for writer in writers:
+                    writer.write_class(class_name, change)
+        count = 0
+        for record in iter_records(change_set):
+            for writer in writers:
+                writer.write(record)
+            count += 1
+        for writer in writers:
+            writer.finish()
+        for writer in writers:
+            writer.prepare()
+        for writer in writers:
+            writer.close()
+            committed += 1
+    except BaseException:
+        # remove all partially written files of writers that were not committed yet
+        for writer in writers[committed:]:
+            writer.abort()
+        raise
+    logger.debug('{0} students exported with {1} writers.'.format(count, len(writers)))
+
+
+def export_data(output_file, change_set, formats, replace_illegal_characters=None,
+                include_format_in_filename=None):
+    """
+    Exports a change set into multiple file formats at once. If more than one
+    format is given, the name of the format is included in the file names,
+    e.g. "export.moodle.csv" and "export.iserv.csv". Formats with their own
+    extension include it only, if it differs from their name, e.g.
+    "export.pdf", "export.ldif" and "export.ldif-ad.ldif".
+
+    :param output_file: file name to write data to
+    :param change_set: object representing all changes between given imports
+    :param formats: list of names of export formats
+    :param replace_illegal_characters: whether to replace illegal (non-ASCII)
+                                       characters in class and student names,
+                                       None to use the default of each format
+    :param include_format_in_filename: whether to include the name of the
+                                       format in the file names, None to include
+                                       it only if more than one format is given
+    """
+    if include_format_in_filename is None:
+        include_format_in_filename = len(formats) > 1
+    writers = [_create_writer(output_file, format_name, include_format_in_filename, replace_illegal_characters)
+               for format_name in formats]
+    export_changeset(change_set, writers)
+
+
+def export_data_parallel(output_file, change_set, formats, replace_illegal_characters=None,
+                         max_workers=None, use_processes=False, include_format_in_filename=None):
+    """
+    Exports a change set into multiple file formats concurrently. Each format
+    is written by its own task in a pool of threads or processes. All tasks
+    share a read-only snapshot of the change set. The file names are built the
+    same way as by export_data().
+
+    :param output_file: file name to write data to
+    :param change_set: object representing all changes between given imports
+    :param formats: list of names of export formats
+    :param replace_illegal_characters: whether to replace illegal (non-ASCII)
+                                       characters in class and student names,
+                                       None to use the default of each format
+    :param max_workers: maximum number of formats written at the same time
+    :param use_processes: whether to use a pool of processes instead of threads
+                          (for formats like PDF that need a lot of CPU time)
+    :param include_format_in_filename: whether to include the name of the
+                                       format in the file names, None to include
+                                       it only if more than one format is given
+    :return: dictionary with the duration in seconds for each export format
+    """
+    if include_format_in_filename is None:
+        include_format_in_filename = len(formats) > 1
+    snapshot = change_set.snapshot()
+    if use_processes:
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=max_workers)
+    else:
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+    timings = {}
+    first_error = None
+    with executor:
+        futures = {executor.submit(_run_export_task, output_file, snapshot, format_name, include_format_in_filename,
+                                   replace_illegal_characters): format_name
+                   for format_name in formats}
+        for future in concurrent.futures.as_completed(futures):
+            format_name = futures[future]
+            try:
+                timings[format_name] = future.result()
+                logger.info('Export for {} finished in {:.2f} seconds.'.format(format_name, timings[format_name]))
+            except Exception as e:
+                logger.error('Export for {} failed: {}'.format(format_name, e))
+                first_error = first_error or e
+    if first_error:
+        raise first_error
+    return timings
+
+
+def _run_export_task(output_file, change_set, format_name, include_format_in_filename, replace_illegal_characters):
+    """Writes a change set into a single export format and returns the needed time."""
+    start = time.perf_counter()
+    writer = _create_writer(output_file, format_name, include_format_in_filename, replace_illegal_characters)
+    export_changeset(change_set, [writer])
+    return time.perf_counter() - start
+
+
+def _create_writer(output_file, format_name, include_format_in_filename, replace_illegal_characters):
+    writer_class = get_writer(format_name)
+    filename = output_file
+    if output_file != STDOUT:
+        if writer_class.extension:
+            filename = os.path.splitext(output_file)[0] + writer_class.extension
+        # formats with the same extension, e.g. "ldif" and "ldif-ad", must not write the same file
+        if include_format_in_filename and writer_class.extension != '.' + format_name:
+            filename = _insert_into_filename(filename, format_name)
+    if replace_illegal_characters is None:
+        return writer_class(filename)
+    return writer_class(filename, replace_illegal_characters=replace_illegal_characters)
@@ -0,0 +1,174 @@
+
+"""
+bbss - BBS Student Management
+
+Helper functions for reading and writing data files. Compressed files and ZIP
+archives are decompressed transparently while reading. Output files can be
+written atomically, so that partially written files never appear.
+
+Created on Mon Oct 19 09:41:12 2026
+
+@author: Christian Wichmann
+"""
+
+
+import io
+import os
+import bz2
+import gzip
+import lzma
+import uuid
+import logging
+import zipfile
+import contextlib
+
+
+__all__ = ['open_import_file', 'is_compressed', 'strip_compression_extension', 'atomic_open', 'AtomicFile',
+           'private_directory']
+
+
+logger = logging.getLogger('bbss.fileio')
+
+
+# map file extensions of compressed files to functions opening them as stream
+COMPRESSION_EXTENSIONS = {'.gz': gzip.open,
+                          '.bz2': bz2.open,
+                          '.xz': lzma.open}
+
+ARCHIVE_EXTENSIONS = ('.zip', )
+
+
+def is_compressed(filename):
+    """Checks whether a file is compressed or archived by its extension."""
+    extension = os.path.splitext(filename)[1].lower()
+    return extension in COMPRESSION_EXTENSIONS or extension in ARCHIVE_EXTENSIONS
+
+
+def strip_compression_extension(filename):
+    """
+    Removes the extension of a compression format from a file name, e.g.
+    "students.csv.gz" becomes "students.csv". Other file names are returned
+    unchanged.
+    """
+    if is_compressed(filename):
+        return os.path.splitext(filename)[0]
+    return filename
+
+
+@contextlib.contextmanager
+def open_import_file(import_file, encoding='utf-8', newline=None):
+    """
+    Opens a file containing student data for reading as text stream.
+
+    Files compressed with gzip, bzip2 or xz and ZIP archives containing only a
+    single file are decompressed on the fly while reading. No temporary files
+    are written and the file is read only once, so that even large files can
+    be processed with constant memory.
+
+    :param import_file: name of the file to be opened
+    :param encoding: encoding of the (uncompressed) file content
+    :param newline: how line endings are handled, see built-in open()
+    :return: context manager yielding a text stream
+    """
+    extension = os.path.splitext(import_file)[1].lower()
+    if extension in COMPRESSION_EXTENSIONS:
+        logger.debug('Decompressing file while reading: {}'.format(import_file))
+        open_compressed = COMPRESSION_EXTENSIONS[extension]
+        with open_compressed(import_file, 'rt', encoding=encoding, newline=newline) as text_file:
+            yield text_file
+    elif extension in ARCHIVE_EXTENSIONS:
+        with zipfile.ZipFile(import_file) as archive:
+            # ignore directories and metadata stored by macOS when packing archives
+            members = [m for m in archive.infolist()
+                       if not m.is_dir() and not m.filename.startswith('__MACOSX/')]
+            if len(members) != 1:
+                raise ValueError('ZIP archive has to contain exactly one file: {}'.format(import_file))
+            logger.debug('Reading file "{}" from ZIP archive: {}'.format(members[0].filename, import_file))
+            with archive.open(members[0]) as binary_file:
+                with io.TextIOWrapper(binary_file, encoding=encoding, newline=newline) as text_file:
+                    yield text_file
+    else:
+        with open(import_file, 'r', encoding=encoding, newline=newline) as text_file:
+            yield text_file
+
+
+class AtomicFile(object):
+    """
+    File that is written under a temporary name in the directory of the target
+    file and only renamed to its final name after it was written completely.
+    If writing fails, the temporary file is removed and an already existing
+    file with the same name is left untouched. A file can be prepared before
+    it is committed, so that committing it only renames it.
+
+    All attributes of the underlying file object are accessible directly.
+    """
+    def __init__(self, filename, mode='w', **kwargs):
+        self.filename = filename
+        self.temp_filename = '{}.{}.tmp'.format(filename, uuid.uuid4().hex[:8])
+        # open in exclusive mode to never overwrite a file by accident
+        self.file = open(self.temp_filename, mode.replace('w', 'x'), **kwargs)
+        self._done = False
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.discard()
+
+    def close(self):
+        self.commit()
+
+    def prepare(self):
+        """Writes the content of the file to disk and closes it, but keeps its temporary name."""
+        if not self.file.closed:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.file.close()
+
+    def commit(self):
+        """Closes the file and renames it to its final name."""
+        if not self._done:
+            self._done = True
+            self.file.close()
+            os.replace(self.temp_filename, self.filename)
+
+    def discard(self):
+        """Closes the file and removes it without touching the target file."""
+        if not self._done:
+            self._done = True
+            self.file.close()
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(self.temp_filename)
+            logger.debug('Discarded incomplete output file: {}'.format(self.filename))
+
+
+def atomic_open(filename, mode='w', **kwargs):
+    """
+    Opens a file for writing atomically. The file is only visible under its
+    name after it was closed successfully, see AtomicFile.
+
+    :param filename: name of the file to be written
+    :param mode: mode for opening the file, see built-in open()
+    :return: AtomicFile object, which can be used as context manager
+    """
+    return AtomicFile(filename, mode, **kwargs)
+
+
+def private_directory(directory):
+    """
+    Creates a directory that only the current user can access, including all
+    missing parent directories. The permissions of an already existing
+    directory are restricted as well.
+
+    :param directory: name of the directory
+    :return: name of the directory
+    """
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    os.chmod(directory, 0o700)
+    return directory
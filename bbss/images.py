@@ -0,0 +1,310 @@
+
+"""
+bbss - BBS Student Management
+
+Builds ZIP archives with the photos of students, e.g. to upload them as
+profile pictures into Moodle. The photos are taken from the archive of all
+student photos, in which every photo is named after the GUID of the student.
+In the new archive the photos are named after the user names.
+
+The source archive is indexed once by the names of its entries. Photos are
+decompressed once and stored uncompressed in the new archive, because JPEG
+files can not be compressed any further.
+
+A manifest with the CRC of every exported photo can be stored next to the
+new archive. With it, only photos that were added or changed since the last
+export are included.
+
+Optionally the photos are normalized into small avatars of the same size,
+e.g. for Moodle and the SSO portal: every photo is decoded, rotated
+according to its EXIF orientation, cropped to a square and scaled down. JPEG
+files are decoded in draft mode, so that the decoder already scales them
+down by a power of two instead of decoding the full resolution. Photos are
+normalized in a pool of processes and the avatars are cached under the CRC
+and size of the photo and the size of the avatar, so that only new or
+changed photos are normalized again. The cache is stored in a private
+directory below config.CACHE_DIRECTORY. This requires the optional package
+Pillow.
+
+Created on Mon Oct 19 20:31:52 2026
+
+@author: Christian Wichmann
+"""
+
+
+import io
+import os
+import json
+import shutil
+import logging
+import zipfile
+import collections
+import concurrent.futures
+
+# Pillow is only necessary for normalizing photos into avatars
+try:
+    from PIL import Image
+    from PIL import ImageOps
+except ImportError:
+    Image = None
+
+from bbss import config
+from bbss import fileio
+
+
+__all__ = ['build_index', 'collect_images', 'normalize_image', 'select_students', 'CollectResult']
+
+
+logger = logging.getLogger('bbss.images')
+
+
+# file extensions of photos in the source archive
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+# file extension of photos in the new archive
+TARGET_EXTENSION = '.jpeg'
+
+# size of chunks when copying data between archives
+CHUNK_SIZE = 1024 * 1024
+
+# width and height of avatars in pixels
+AVATAR_SIZE = 512
+
+# JPEG quality of avatars
+AVATAR_QUALITY = 85
+
+# name of the directory below config.CACHE_DIRECTORY storing all normalized photos for later runs
+AVATAR_CACHE_DIRECTORY = 'avatars'
+
+# maximum number of photos read into memory while they are normalized
+NORMALIZE_WINDOW = 64
+
+
+CollectResult = collections.namedtuple('CollectResult', 'copied unchanged missing')
+
+
+def build_index(source_zip):
+    """
+    Builds an index of all photos in an archive by their names without
+    extension and directory, e.g. "photos/1234-abcd.JPG" can be found as
+    "1234-abcd".
+
+    :param source_zip: opened ZipFile
+    :return: dictionary mapping lowercase names to ZipInfo objects
+    """
+    index = {}
+    for info in source_zip.infolist():
+        if info.is_dir():
+            continue
+        name, extension = os.path.splitext(os.path.basename(info.filename))
+        if extension.lower() in IMAGE_EXTENSIONS:
+            index[name.lower()] = info
+    logger.debug('Indexed {} photos in archive.'.format(len(index)))
+    return index
+
+
+def select_students(students, classes=None):
+    """Returns all students with a GUID, that are in one of the given classes (all students if None)."""
+    classes = set(classes) if classes else None
+    return [s for s in students if s.guid and (classes is None or s.classname in classes)]
+
+
+def copy_entry(source_zip, info, target_zip, arcname):
+    """
+    Copies an entry of an archive into another archive under a new name. The
+    entry is stored uncompressed.
+
+    :param source_zip: ZipFile to read from
+    :param info: ZipInfo of the entry in the source archive
+    :param target_zip: ZipFile opened for writing
+    :param arcname: name of the entry in the target archive
+    """
+    zinfo = zipfile.ZipInfo(arcname, info.date_time)
+    zinfo.external_attr = 0o644 << 16
+    zinfo.compress_type = zipfile.ZIP_STORED
+    # the size is known in advance, so that ZIP64 extensions are only used when necessary
+    zinfo.file_size = info.file_size
+    with source_zip.open(info) as source, target_zip.open(zinfo, 'w') as target:
+        shutil.copyfileobj(source, target, CHUNK_SIZE)
+
+
+def _check_pillow():
+    if Image is None:
+        raise ImportError('Package Pillow is necessary to normalize photos.')
+
+
+def normalize_image(photo, size=AVATAR_SIZE, quality=AVATAR_QUALITY):
+    """
+    Normalizes a photo into a square avatar. The photo is rotated according
+    to its EXIF orientation, cropped around its center and scaled down. All
+    metadata is removed.
+
+    :param photo: content of an image file as bytes
+    :param size: width and height of the avatar in pixels
+    :param quality: JPEG quality of the avatar
+    :return: content of the avatar as JPEG file
+    """
+    with Image.open(io.BytesIO(photo)) as image:
+        # decode JPEG files scaled down to the smallest size not less than the avatar
+        image.draft('RGB', (size, size))
+        image = ImageOps.exif_transpose(image).convert('RGB')
+        avatar = ImageOps.fit(image, (size, size), Image.Resampling.LANCZOS)
+    output = io.BytesIO()
+    avatar.save(output, format='JPEG', quality=quality, optimize=True)
+    return output.getvalue()
+
+
+def _store_avatar(target_zip, arcname, info, cache_file, avatar):
+    with fileio.atomic_open(cache_file, 'wb') as f:
+        f.write(avatar)
+    zinfo = zipfile.ZipInfo(arcname, info.date_time)
+    zinfo.external_attr = 0o644 << 16
+    target_zip.writestr(zinfo, avatar, compress_type=zipfile.ZIP_STORED)
+
+
+def _write_avatars(source_zip, target_zip, entries, size=AVATAR_SIZE, max_workers=None, cache_directory=None):
+    """
+    Writes normalized photos into an archive. Avatars found in the cache are
+    copied from there. All other photos are read one after another and
+    normalized in a pool of processes while the next photos are read. At most
+    NORMALIZE_WINDOW photos are kept in memory at the same time.
+
+    :param source_zip: ZipFile to read photos from
+    :param target_zip: ZipFile opened for writing
+    :param entries: list of tuples with ZipInfo of a photo and name of the
+                    avatar in the target archive
+    :param size: width and height of the avatars in pixels
+    :param max_workers: maximum number of processes normalizing photos, 1 to
+                        normalize all photos in the current process
+    :param cache_directory: directory storing all normalized photos, None
+                            for AVATAR_CACHE_DIRECTORY below
+                            config.CACHE_DIRECTORY
+    :return: list of names of all avatars that could not be written
+    """
+    _check_pillow()
+    if cache_directory is None:
+        cache_directory = os.path.join(config.CACHE_DIRECTORY, AVATAR_CACHE_DIRECTORY)
+    pending = []
+    for info, arcname in entries:
+        cache_file = os.path.join(cache_directory, '{:08x}-{}-{}-{}.jpeg'.format(
+            info.CRC, info.file_size, size, AVATAR_QUALITY))
+        if os.path.exists(cache_file):
+            target_zip.write(cache_file, arcname, compress_type=zipfile.ZIP_STORED)
+        else:
+            pending.append((arcname, info, cache_file))
+    logger.debug('{} of {} avatars found in cache.'.format(len(entries) - len(pending), len(entries)))
+    if not pending:
+        return []
+    # avatars are personal data and must not be readable by other users
+    fileio.private_directory(cache_directory)
+    failed = []
+    window = collections.deque()
+
+    def store_next():
+        arcname, info, cache_file, result = window.popleft()
+        try:
+            avatar = result.result()
+        except (OSError, ValueError, SyntaxError, Image.DecompressionBombError) as e:
+            logger.warning('Could not normalize photo {}: {}'.format(info.filename, e))
+            failed.append(arcname)
+            return
+        _store_avatar(target_zip, arcname, info, cache_file, avatar)
+
+    if max_workers != 1 and len(pending) > 1:
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=max_workers)
+    else:
+        # a single thread still decodes while the next photo is read
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+    with executor:
+        for arcname, info, cache_file in pending:
+            window.append((arcname, info, cache_file, executor.submit(normalize_image, source_zip.read(info), size)))
+            if len(window) >= NORMALIZE_WINDOW:
+                store_next()
+        while window:
+            store_next()
+    return failed
+
+
+def _load_manifest(manifest_file):
+    if not manifest_file or not os.path.exists(manifest_file):
+        return {}
+    with open(manifest_file, encoding='utf8') as f:
+        return json.load(f)
+
+
+def _manifest_entry(info, avatar_size):
+    if avatar_size:
+        return [info.CRC, info.file_size, avatar_size]
+    return [info.CRC, info.file_size]
+
+
+def collect_images(source_archive, target_archive, students, manifest_file=None, avatar_size=None,
+                   max_workers=None, cache_directory=None):
+    """
+    Copies the photos of students from the archive of all photos into a new
+    archive named after their user names.
+
+    :param source_archive: file name of the archive with all photos
+    :param target_archive: file name of the new archive
+    :param students: list of students with GUID and user id
+    :param manifest_file: file name of a JSON file storing the CRC of all
+                          exported photos, if given only new and changed
+                          photos are copied and the manifest is updated
+    :param avatar_size: width and height in pixels to normalize all photos
+                        to, None to copy the photos unchanged
+    :param max_workers: maximum number of processes normalizing photos
+    :param cache_directory: directory storing all normalized photos, None
+                            for the default directory below
+                            config.CACHE_DIRECTORY
+    :return: CollectResult with the number of copied, unchanged and missing
+             photos, photos of students with the same user name as a former
+             student are regarded as missing
+    """
+    if avatar_size:
+        _check_pillow()
+    manifest = _load_manifest(manifest_file)
+    unchanged = missing = 0
+    selected = []
+    usernames = set()
+    with zipfile.ZipFile(source_archive) as source_zip:
+        index = build_index(source_zip)
+        for student in students:
+            info = index.get(str(student.guid).lower())
+            if info is None:
+                logger.warning('No photo found for {} {} ({}).'.format(
+                    student.firstname, student.surname, student.guid))
+                missing += 1
+                continue
+            username = student.user_id.lower()
+            if username in usernames:
+                # photos and manifest entries are named after the user name, so only one photo can be stored
+                logger.warning('Skipping photo of {} {} ({}), because user name {} is already used.'.format(
+                    student.firstname, student.surname, student.guid, username))
+                missing += 1
+                continue
+            usernames.add(username)
+            if manifest.get(username) == _manifest_entry(info, avatar_size):
+                unchanged += 1
+                continue
+            selected.append((username, info))
+        with fileio.atomic_open(target_archive, 'wb') as output:
+            with zipfile.ZipFile(output.file, 'w') as target_zip:
+                if avatar_size:
+                    entries = [(info, username + TARGET_EXTENSION) for username, info in selected]
+                    failed = _write_avatars(source_zip, target_zip, entries, avatar_size, max_workers,
+                                            cache_directory)
+                    # photos that could not be decoded are regarded as missing
+                    failed = {arcname[:-len(TARGET_EXTENSION)] for arcname in failed}
+                    selected = [(username, info) for username, info in selected if username not in failed]
+                    missing += len(failed)
+                else:
+                    for username, info in selected:
+                        copy_entry(source_zip, info, target_zip, username + TARGET_EXTENSION)
+    for username, info in selected:
+        manifest[username] = _manifest_entry(info, avatar_size)
+    if manifest_file:
+        with fileio.atomic_open(manifest_file, 'w', encoding='utf8') as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+    copied = len(selected)
+    logger.info('{} photos copied, {} unchanged and {} missing.'.format(copied, unchanged, missing))
+    return CollectResult(copied, unchanged, missing)
@@ -9,46 +9,68 @@ Created on Mon Jun  22 10:47:46 2026
 @author: Christian Wichmann
 """
 
-import os
-import csv
 import logging
-from datetime import datetime
 
+from bbss import export
 
-__all__ = ['export_data']
+
+__all__ = ['export_data', 'IServWriter']
 
 
 logger = logging.getLogger('bbss.iserv')
 
 
 def export_data(output_file, change_set):
-    _write_student_list_file(output_file, change_set)
-    _write_comparison_list_file(output_file, change_set)
+    export.export_changeset(change_set, [IServWriter(output_file)])
 
 
-def _write_student_list_file(output_file, change_set):
+class IServWriter(export.Writer):
     """
     Writes a file containing all data to import students into iServ. All
     students will be included. Each student no longer in the database, will
     not be included, so iServ can delete that user.
 
-    :param output_file: file name to write student list to
-    :param change_set: object representing all changes between given imports
-
     File format for importing users into iServ:
     Import-ID;Vorname;Nachname;Klasse/Information;Account;Passwort;Email;Geburtsdatum;Gruppen
     0075098C-A904-4F48-B6E8-29802C45A0AB;Tom;Jones;IFA51;tom.jones;verysecret;tommy@jones.com;01.02.1999;""
     0075098C-A904-4F48-B6E8-39802C45A0EC;Hans;Meyer;TG11B;hans.meyer;geheim;hand@gmail.com;05.05.2013;"Kurs En 1;AG Handarbeit"
     0075098C-A904-4F48-B6E8-49802C9820ED;Christian;Wichmann;WICHCHRI;christian.wichmann;12345678;wichmann@bbs-os-brinkstr.de;09.09.1980;"Kollegium"
+
+    Additionally a file containing the GUID of students and their old user-id
+    (ifa77.muelkai) and the new username based on their first and last name is
+    written. Only every tenth added student is included in this file.
+
+    File format:
+    Import-ID;OldAccount;Account
+    0075098C-A904-4F48-B6E8-29802C45A0AB;ifa77.jonetom;tom.jones
     """
-    # export file with all added students
-    with open(output_file, 'w', newline='', encoding='utf8') as csvfile:
-        count = 0
-        csvfile.write('Import-ID;Vorname;Nachname;Klasse/Information;Gruppen\r\n')
-        for student in sorted(change_set.students_added):
-            _write_student(student, csvfile)
-            count += 1
-        logger.debug('{0} students (added) exported to Moodle file format.'.format(count))
+    def __init__(self, output_file, replace_illegal_characters=False):
+        super().__init__(output_file, replace_illegal_characters)
+        self._count = 0
+        self._count_comparison = 0
+
+    def open(self):
+        self._csvfile = self._open_file(self.output_file)
+        self._csvfile.write('Import-ID;Vorname;Nachname;Klasse/Information;Gruppen\r\n')
+        self._comparison_writer = self._open_csv_file(self._get_filename('comparison'),
+                                                      ('Import-ID', 'OldAccount', 'Account'))
+
+    def write(self, record):
+        # export file with all added students
+        if record.change != export.ADDED:
+            return
+        student = record.student
+        _write_student(student, self._csvfile)
+        if self._count % 10 == 0:
+            self._comparison_writer.writerow((student.guid, record.username,
+                                              student.get_initial_username(regenerate=True)))
+            self._count_comparison += 1
+        self._count += 1
+
+    def close(self):
+        super().close()
+        logger.debug('{0} students (added) exported to iServ file format.'.format(self._count))
+        logger.debug('{0} students (added) exported to comparison file.'.format(self._count_comparison))
 
 
 def _write_student(student, csvfile):
@@ -79,31 +101,3 @@ def _format_courses_field(courses):
     else:
         text = [f'Kurs {c}' for c in str(courses).split(',')]
         return '"{}"'.format(';'.join(text))
-
-
-def _write_comparison_list_file(output_file, change_set):
-    """
-    Writes a file containing the GUID of all students and their old user-id
-    (ifa77.muelkai) and the new username based on their first and last name.
-    All students will be included. Each student no longer in the database, will
-    not be included.
-
-    :param output_file: file name to write student list to
-    :param change_set: object representing all changes between given imports
-
-    File format:
-    Import-ID;OldAccount;Account
-    0075098C-A904-4F48-B6E8-29802C45A0AB;ifa77.jonetom;tom.jones
-    """
-    output_file = os.path.splitext(output_file)
-    output_file_comparison = '{}.comparison{}'.format(*output_file)
-    if os.path.exists(output_file_comparison):
-        logger.warning('Output file already exists, will be overwritten...')
-    with open(output_file_comparison, 'w', newline='', encoding='utf8') as csvfile:
-        count = 0
-        output_file_writer = csv.writer(csvfile, delimiter=';')
-        output_file_writer.writerow(('Import-ID', 'OldAccount', 'Account'))
-        for student in sorted(change_set.students_added)[::10]:
-            output_file_writer.writerow((student.guid, student.generate_user_id().lower(), student.get_initial_username(regenerate=True)))
-            count += 1
-        logger.debug('{0} students (added) exported to comparison file.'.format(count))
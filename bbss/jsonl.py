@@ -0,0 +1,114 @@
+
+"""
+bbss - BBS Student Management
+
+Exports change sets as stream of events in JSON Lines format (one JSON
+object per line) to be consumed by other systems.
+
+Each line is an event with the following keys, that are always present:
+
+    schema   version of the event format (currently 1)
+    seq      running number of the event, starting at 1
+    entity   "class", "student" or "changeset"
+    change   "added", "changed" or "removed" (for entity "changeset" always
+             "complete" as last event of the stream)
+    data     object with the data of the class or student
+
+Example:
+    {"schema": 1, "seq": 1, "entity": "class", "change": "added", "data": {"classname": "IFA21"}}
+    {"schema": 1, "seq": 2, "entity": "student", "change": "added", "data": {"guid": "...", ...}}
+    {"schema": 1, "seq": 3, "entity": "changeset", "change": "complete", "data": {"classes": 1, "students": 1}}
+
+The data of a student always contains the keys guid, surname, firstname,
+classname, class_id, birthday, email, username, password, entry_date and
+exit_date. Missing values are null, dates are given as "YYYY-MM-DD". The
+password is only included for added students.
+
+Created on Mon Oct 19 16:48:09 2026
+
+@author: Christian Wichmann
+"""
+
+
+import sys
+import json
+import datetime
+import logging
+
+from bbss import export
+
+
+__all__ = ['export_data', 'JsonLinesWriter', 'SCHEMA_VERSION']
+
+
+logger = logging.getLogger('bbss.jsonl')
+
+
+SCHEMA_VERSION = 1
+
+
+def export_data(output_file, change_set):
+    export.export_changeset(change_set, [JsonLinesWriter(output_file)])
+
+
+def _format_date(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return value or None
+
+
+class JsonLinesWriter(export.Writer):
+    """
+    Writes an event for every added or removed class and every added, changed
+    or removed student. If the file name is "-", the events are written to
+    standard output and each event is flushed immediately, so that consumers
+    can process the stream while it is written.
+    """
+    extension = '.jsonl'
+
+    def open(self):
+        if self.output_file == export.STDOUT:
+            self._output = sys.stdout
+        else:
+            self._output = self._open_file(self.output_file, newline='\n')
+        self._sequence = 0
+        self._count_classes = 0
+        self._count_students = 0
+
+    def _write_event(self, entity, change, event_data):
+        self._sequence += 1
+        event = {'schema': SCHEMA_VERSION, 'seq': self._sequence, 'entity': entity, 'change': change,
+                 'data': event_data}
+        self._output.write(json.dumps(event, ensure_ascii=False))
+        self._output.write('\n')
+        if self._output is sys.stdout:
+            self._output.flush()
+
+    def write_class(self, class_name, change):
+        self._write_event('class', change, {'classname': class_name})
+        self._count_classes += 1
+
+    def write(self, record):
+        student = record.student
+        self._write_event('student', record.change, {
+            'guid': student.guid or None,
+            'surname': student.surname,
+            'firstname': student.firstname,
+            'classname': student.classname,
+            'class_id': record.class_id,
+            'birthday': _format_date(student.birthday),
+            'email': student.email or None,
+            'username': record.username,
+            'password': record.password if record.change == export.ADDED else None,
+            'entry_date': _format_date(getattr(student, 'entry_date', None)),
+            'exit_date': _format_date(getattr(student, 'exit_date', None))})
+        self._count_students += 1
+
+    def finish(self):
+        # mark end of stream, so that consumers know that the change set is complete
+        self._write_event('changeset', 'complete', {'classes': self._count_classes,
+                                                    'students': self._count_students})
+
+    def close(self):
+        super().close()
+        logger.debug('{} events written in JSON Lines format.'.format(self._sequence))
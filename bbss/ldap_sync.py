@@ -0,0 +1,324 @@
+
+"""
+bbss - BBS Student Management
+
+Synchronizes the user accounts of students in a directory service (OpenLDAP
+or Microsoft Active Directory) with a change set over LDAP.
+
+Instead of looking up and creating every account on its own, all existing
+accounts and organizational units below the user base are read once with a
+paged search into an index. From this index and the change set a minimal
+plan of operations (add, modify, move and delete) is computed without any
+access to the server. Finally the plan is applied in batches: all
+operations of a batch are sent without waiting for the single results, so
+that thousands of accounts can be synchronized in seconds.
+
+The package ldap3 is necessary to access the directory service. Plans can
+be computed and inspected without it.
+
+Created on Mon Oct 19 17:48:05 2026
+
+@author: Christian Wichmann
+"""
+
+
+import logging
+import collections
+
+# ldap3 is only necessary when synchronizing with a directory service
+try:
+    import ldap3
+except ImportError:
+    ldap3 = None
+
+from bbss import ad
+from bbss import data
+from bbss import ldif
+from bbss import export
+
+
+__all__ = ['connect', 'read_directory', 'plan_changes', 'apply_plan', 'sync_directory',
+           'DirectoryIndex', 'Operation', 'SyncResult']
+
+
+logger = logging.getLogger('bbss.ldap_sync')
+
+
+# number of entries read from the server with each page of a paged search
+PAGE_SIZE = 500
+
+# number of operations sent to the server before waiting for their results
+BATCH_SIZE = 200
+
+# attributes compared to find changed accounts (passwords can not be read and are never compared)
+SYNCED_ATTRIBUTES = ('displayName', 'givenName', 'sn', 'mail')
+
+# attribute holding the user name of an account for each directory service
+USERNAME_ATTRIBUTES = {'openldap': 'uid', 'ad': 'sAMAccountName'}
+
+# result code of the server when an entry exists already
+ENTRY_ALREADY_EXISTS = 68
+
+
+# single operation of a plan, "new_dn" is only used for moving and
+# "attributes" only for adding (list of tuples) and modifying (dictionary)
+Operation = collections.namedtuple('Operation', 'kind dn attributes new_dn', defaults=(None, None))
+
+SyncResult = collections.namedtuple('SyncResult', 'counts errors')
+
+
+def _check_ldap3():
+    if ldap3 is None:
+        raise ImportError('Package ldap3 is necessary to synchronize with a directory service.')
+
+
+class DirectoryIndex(object):
+    """
+    Holds all user accounts and organizational units below the user base as
+    read from the directory service. Accounts are stored by their lowercase
+    user name, DNs of units are stored in lowercase.
+    """
+    def __init__(self):
+        # map user names to DN and synchronized attributes of the account
+        self.accounts = {}
+        self.units = set()
+
+    def __len__(self):
+        return len(self.accounts)
+
+    def add_account(self, username, dn, attributes=None):
+        self.accounts[username.lower()] = (dn, attributes or {})
+
+    def add_unit(self, dn):
+        self.units.add(dn.lower())
+
+
+def connect(servers, user, password, pool_size=4):
+    """
+    Opens a connection to one or more directory servers. The connection keeps
+    a pool of bound connections to send operations concurrently. If a server
+    is not reachable, the next server of the list is used.
+
+    :param servers: list of server URLs, e.g. "ldaps://dc1.example.com"
+    :param user: DN of the user to bind with
+    :param password: password of the user to bind with
+    :param pool_size: number of connections in the pool
+    :return: ldap3 Connection object
+    """
+    _check_ldap3()
+    server_pool = ldap3.ServerPool([ldap3.Server(url, get_info=ldap3.NONE) for url in servers],
+                                   ldap3.FIRST, active=True, exhaust=True)
+    connection = ldap3.Connection(server_pool, user, password, client_strategy=ldap3.REUSABLE,
+                                  pool_size=pool_size, pool_name='bbss', auto_bind=True, raise_exceptions=False)
+    logger.debug('Connected to directory service with {} pooled connections.'.format(pool_size))
+    return connection
+
+
+def _first_value(value):
+    """Returns a single value of an attribute as string, the server returns lists or single values."""
+    if isinstance(value, (list, tuple)):
+        value = value[0] if value else ''
+    if isinstance(value, bytes):
+        value = value.decode('utf8')
+    return str(value) if value is not None else ''
+
+
+def _paged_search(connection, search_filter, attributes, base, page_size):
+    entries = connection.extend.standard.paged_search(base, search_filter, search_scope=ldap3.SUBTREE,
+                                                      attributes=attributes, paged_size=page_size,
+                                                      generator=True)
+    for entry in entries:
+        if entry.get('type', 'searchResEntry') == 'searchResEntry':
+            yield entry
+
+
+def read_directory(connection, flavor='openldap', base=ad.USER_BASE, page_size=PAGE_SIZE):
+    """
+    Reads all user accounts and organizational units below a base DN with a
+    paged search into an index.
+
+    :param connection: connection to the directory service
+    :param flavor: directory service ("openldap" or "ad")
+    :param base: DN below which all student accounts are stored
+    :param page_size: number of entries read with every request
+    :return: DirectoryIndex with all accounts and units
+    """
+    _check_ldap3()
+    username_attribute = USERNAME_ATTRIBUTES[flavor]
+    index = DirectoryIndex()
+    for entry in _paged_search(connection, '(objectClass=organizationalUnit)', ['ou'], base, page_size):
+        index.add_unit(entry['dn'])
+    search_filter = '(&(objectClass=person)({}=*))'.format(username_attribute)
+    for entry in _paged_search(connection, search_filter, [username_attribute] + list(SYNCED_ATTRIBUTES),
+                               base, page_size):
+        values = entry['attributes']
+        attributes = {name: _first_value(values[name]) for name in SYNCED_ATTRIBUTES if values.get(name)}
+        index.add_account(_first_value(values[username_attribute]), entry['dn'], attributes)
+    logger.info('Read {} accounts and {} units from directory service.'.format(len(index), len(index.units)))
+    return index
+
+
+def _is_below(dn, ou):
+    return dn.lower().endswith(',' + ou.lower())
+
+
+def plan_changes(change_set, index, flavor='openldap', replace_illegal_characters=False, remove_unknown=False):
+    """
+    Computes the minimal list of operations to bring the directory service in
+    line with a change set. Students missing in the directory are added,
+    accounts in the wrong unit are moved and accounts with outdated names or
+    mail addresses are modified. Accounts of removed students are deleted.
+    Passwords of existing accounts are never changed.
+
+    The operations are sorted in dependency order: units (parents first),
+    added, moved, modified and deleted accounts and units of removed classes
+    (children first), if they are empty afterwards.
+
+    :param change_set: object representing all changes between given imports
+    :param index: DirectoryIndex with the current content of the directory
+    :param flavor: directory service ("openldap" or "ad")
+    :param replace_illegal_characters: whether to replace illegal (non-ASCII)
+                                       characters in student names
+    :param remove_unknown: whether to delete all accounts that do not belong
+                           to an added or changed student (for a full sync)
+    :return: list of Operation objects
+    """
+    units, added, moved, modified, deleted = set(), [], [], [], []
+    remaining = {dn.lower() for dn, _ in index.accounts.values()}
+    kept = set()
+    for record in export.iter_records(change_set):
+        account = index.accounts.get(record.username)
+        if record.change == export.REMOVED:
+            if account and record.username not in kept:
+                deleted.append(Operation('delete', account[0]))
+                remaining.discard(account[0].lower())
+            continue
+        kept.add(record.username)
+        ou = record.student.generate_ou()
+        dn = ldif.user_dn(record.username, ou, flavor)
+        units.update(u for u in ldif.parent_units(ou) if u.lower() not in index.units)
+        attributes = ldif.user_attributes(record, flavor, replace_illegal_characters)
+        if account is None:
+            added.append(Operation('add', dn, attributes))
+            remaining.add(dn.lower())
+            continue
+        old_dn, old_attributes = account
+        if old_dn.lower() != dn.lower():
+            moved.append(Operation('move', old_dn, new_dn=dn))
+            remaining.discard(old_dn.lower())
+            remaining.add(dn.lower())
+        changes = {name: value for name, value in attributes
+                   if name in SYNCED_ATTRIBUTES and old_attributes.get(name) != value}
+        if changes:
+            modified.append(Operation('modify', dn, changes))
+    if remove_unknown:
+        for username, (dn, _) in sorted(index.accounts.items()):
+            if username not in kept and dn.lower() in remaining:
+                deleted.append(Operation('delete', dn))
+                remaining.discard(dn.lower())
+    # delete units of removed classes only when no account is left in them
+    removed_units = set()
+    for class_name in change_set.classes_removed:
+        student = data.Student('', '', class_name, '')
+        ou = student.generate_ou()
+        if (ou.lower() in index.units and not any(_is_below(dn, ou) for dn in remaining)
+                and not any(_is_below(u, ou) for u in units)):
+            removed_units.add(ou)
+    plan = [Operation('add_unit', ou) for ou in sorted(units, key=lambda ou: (len(ldif.split_dn(ou)), ou))]
+    plan += added + moved + modified + deleted
+    plan += [Operation('delete_unit', ou) for ou in sorted(removed_units, key=lambda ou: (-len(ldif.split_dn(ou)), ou))]
+    logger.info('Planned {} operations for directory service.'.format(len(plan)))
+    return plan
+
+
+def _stage(operation):
+    """Returns the stage of an operation, all operations of a stage are independent of each other."""
+    if operation.kind in ('add_unit', 'delete_unit'):
+        return operation.kind, len(ldif.split_dn(operation.dn))
+    return operation.kind, 0
+
+
+def _send(connection, operation):
+    if operation.kind == 'add_unit':
+        name = ldif.split_dn(operation.dn)[0].split('=', 1)[1]
+        return connection.add(operation.dn, ['top', 'organizationalUnit'], {'ou': name})
+    elif operation.kind == 'add':
+        attributes = collections.defaultdict(list)
+        for name, value in operation.attributes:
+            attributes[name].append(value)
+        object_classes = attributes.pop('objectClass')
+        return connection.add(operation.dn, object_classes, dict(attributes))
+    elif operation.kind == 'move':
+        rdns = ldif.split_dn(operation.new_dn)
+        return connection.modify_dn(operation.dn, rdns[0], delete_old_dn=True, new_superior=','.join(rdns[1:]))
+    elif operation.kind == 'modify':
+        return connection.modify(operation.dn, {name: [(ldap3.MODIFY_REPLACE, [value])]
+                                                for name, value in operation.attributes.items()})
+    elif operation.kind in ('delete', 'delete_unit'):
+        return connection.delete(operation.dn)
+    raise ValueError('Unknown operation: {}'.format(operation.kind))
+
+
+def _apply_batch(connection, batch):
+    """Sends all operations of a batch and afterwards waits for their results."""
+    if connection.strategy.sync:
+        results = []
+        for operation in batch:
+            _send(connection, operation)
+            results.append(connection.result)
+        return results
+    message_ids = [_send(connection, operation) for operation in batch]
+    return [connection.get_response(message_id)[1] for message_id in message_ids]
+
+
+def apply_plan(connection, plan, batch_size=BATCH_SIZE):
+    """
+    Applies a plan to the directory service. Operations of the same stage are
+    sent in batches without waiting for every single result. A stage is only
+    started after all operations of the previous stage were finished, so that
+    units exist before accounts are added into them.
+
+    Failed operations are logged and skipped, units that exist already are
+    not regarded as error.
+
+    :param connection: connection to the directory service
+    :param plan: list of Operation objects as returned by plan_changes()
+    :param batch_size: maximum number of operations sent at once
+    :return: SyncResult with number of successful operations for each kind
+             and a list of failed operations with the error message
+    """
+    _check_ldap3()
+    counts = collections.Counter()
+    errors = []
+    start = 0
+    while start < len(plan):
+        stage = _stage(plan[start])
+        end = start
+        while end < len(plan) and end - start < batch_size and _stage(plan[end]) == stage:
+            end += 1
+        batch = plan[start:end]
+        for operation, result in zip(batch, _apply_batch(connection, batch)):
+            if result['result'] == 0 or (operation.kind == 'add_unit' and result['result'] == ENTRY_ALREADY_EXISTS):
+                counts[operation.kind] += 1
+            else:
+                logger.warning('Could not {} {}: {}'.format(operation.kind, operation.dn, result['description']))
+                errors.append((operation, result['description']))
+        start = end
+    logger.info('Applied {} operations to directory service, {} failed.'.format(sum(counts.values()), len(errors)))
+    return SyncResult(counts, errors)
+
+
+def sync_directory(connection, change_set, flavor='openldap', base=ad.USER_BASE, replace_illegal_characters=False,
+                   remove_unknown=False, dry_run=False, batch_size=BATCH_SIZE):
+    """
+    Synchronizes the directory service with a change set: reads the directory,
+    computes the plan and applies it.
+
+    :param dry_run: only compute the plan without changing the directory
+    :return: tuple of plan and SyncResult (None for a dry run)
+    """
+    index = read_directory(connection, flavor, base)
+    plan = plan_changes(change_set, index, flavor, replace_illegal_characters, remove_unknown)
+    if dry_run:
+        return plan, None
+    return plan, apply_plan(connection, plan, batch_size)
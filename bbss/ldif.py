@@ -0,0 +1,242 @@
+
+"""
+bbss - BBS Student Management
+
+Exports change sets as LDIF file (RFC 2849) to provision user accounts for
+students in a directory service like OpenLDAP or Microsoft Active Directory.
+The file can be loaded in a single pass with "ldapmodify -c -f file.ldif" or
+"ldifde -i -k -f file.ldif".
+
+All changes are written in dependency order:
+
+ 1. organizational units for all classes of added and changed students
+    (parents before children, already existing units are reported as error
+    by the server and skipped because of the options -c or -k)
+ 2. added students
+ 3. students that changed classes are moved into the unit of their new class
+ 4. removed students
+ 5. units of removed classes (children before parents)
+
+Created on Mon Oct 19 17:12:44 2026
+
+@author: Christian Wichmann
+"""
+
+
+import re
+import base64
+import logging
+
+from bbss import ad
+from bbss import data
+from bbss import export
+
+
+__all__ = ['export_data', 'LdifWriter', 'ActiveDirectoryLdifWriter', 'format_attribute', 'user_dn',
+           'user_attributes', 'split_dn', 'parent_units']
+
+
+logger = logging.getLogger('bbss.ldif')
+
+
+# maximum length of lines in LDIF files, longer lines are folded
+MAX_LINE_LENGTH = 76
+
+# supported directory services, they differ in object classes and attributes of user entries
+FLAVORS = ('openldap', 'ad')
+
+# flags of user accounts in Active Directory: normal account, that is enabled
+AD_NORMAL_ACCOUNT = 512
+
+
+def _is_safe_string(value):
+    """Checks whether a value can be written as plain string (SAFE-STRING in RFC 2849)."""
+    if not value:
+        return True
+    if value[0] in ' :<' or value[-1] == ' ':
+        return False
+    return all(0 < ord(c) < 128 and c not in '\r\n' for c in value)
+
+
+def _fold_line(line):
+    """Folds a line longer than the maximum length into continuation lines starting with a space."""
+    if len(line) <= MAX_LINE_LENGTH:
+        return line
+    lines = [line[:MAX_LINE_LENGTH]]
+    for i in range(MAX_LINE_LENGTH, len(line), MAX_LINE_LENGTH - 1):
+        lines.append(' ' + line[i:i + MAX_LINE_LENGTH - 1])
+    return '\n'.join(lines)
+
+
+def format_attribute(name, value):
+    """
+    Formats a single attribute for an LDIF file. Values that are not plain
+    ASCII strings are encoded with base64.
+
+    :param name: name of the attribute
+    :param value: value as string or bytes
+    :return: line (possibly folded into multiple lines) for the LDIF file
+    """
+    if isinstance(value, bytes):
+        line = '{}:: {}'.format(name, base64.b64encode(value).decode('ascii'))
+    elif _is_safe_string(value):
+        line = '{}: {}'.format(name, value)
+    else:
+        line = '{}:: {}'.format(name, base64.b64encode(value.encode('utf8')).decode('ascii'))
+    return _fold_line(line)
+
+
+def _format_entry(attributes):
+    return '\n'.join(format_attribute(name, value) for name, value in attributes) + '\n\n'
+
+
+def split_dn(dn):
+    """Splits a DN into its RDNs, escaped commas inside of values are kept."""
+    return re.findall(r'(?:[^,\\]|\\.)+', dn)
+
+
+def parent_units(ou):
+    """Returns the DNs of an organizational unit and all its parents below the user base, outermost first."""
+    base = split_dn(ad.USER_BASE)
+    rdns = split_dn(ou)
+    if rdns[-len(base):] != base:
+        return [ou]
+    return [','.join(rdns[i:]) for i in reversed(range(len(rdns) - len(base)))]
+
+
+def user_dn(username, ou, flavor='openldap'):
+    """Returns the DN of a user account in a given organizational unit."""
+    rdn_attribute = 'CN' if flavor == 'ad' else 'uid'
+    return '{}={},{}'.format(rdn_attribute, ad.escape_dn_value(username), ou)
+
+
+def user_attributes(record, flavor='openldap', replace_illegal_characters=False):
+    """
+    Returns all attributes of a new user account for a student.
+
+    :param record: ExportRecord of the student
+    :param flavor: directory service ("openldap" or "ad")
+    :param replace_illegal_characters: whether to replace illegal (non-ASCII)
+                                       characters in student names
+    :return: list of tuples with name and value of each attribute
+    """
+    student = record.student
+    _, surname, firstname = record.names(replace_illegal_characters)
+    display_name = '{} {}'.format(firstname, surname)
+    if flavor == 'ad':
+        attributes = [('objectClass', 'top'), ('objectClass', 'person'),
+                      ('objectClass', 'organizationalPerson'), ('objectClass', 'user'),
+                      ('cn', record.username), ('sAMAccountName', record.username),
+                      ('userPrincipalName', '{}@{}'.format(record.username, ad.DOMAIN)),
+                      ('displayName', display_name), ('givenName', firstname), ('sn', surname),
+                      ('description', 'Schueler'),
+                      # password has to be enclosed in quotes and encoded as UTF-16
+                      ('unicodePwd', '"{}"'.format(record.password).encode('utf-16-le')),
+                      # without flags Active Directory creates disabled accounts
+                      ('userAccountControl', str(AD_NORMAL_ACCOUNT))]
+    else:
+        attributes = [('objectClass', 'top'), ('objectClass', 'person'),
+                      ('objectClass', 'organizationalPerson'), ('objectClass', 'inetOrgPerson'),
+                      ('uid', record.username), ('cn', display_name), ('displayName', display_name),
+                      ('givenName', firstname), ('sn', surname), ('description', 'Schueler'),
+                      ('userPassword', record.password)]
+    if student.email:
+        attributes.append(('mail', student.email))
+    if student.guid:
+        attributes.append(('employeeNumber', str(student.guid)))
+    return attributes
+
+
+def export_data(output_file, change_set, flavor='openldap'):
+    export.export_changeset(change_set, [LdifWriter(output_file, flavor=flavor)])
+
+
+class LdifWriter(export.Writer):
+    """
+    Writes an LDIF file with all changes of a change set for a directory
+    service. Because organizational units have to be created before the
+    students in them, all changes are collected while iterating over the
+    change set and written in dependency order when the writer is closed.
+
+    The flavor "openldap" writes users as inetOrgPerson with a uid, the
+    flavor "ad" writes users as user objects for Active Directory. Passwords
+    for Active Directory are written as unicodePwd, which can only be set
+    over an encrypted connection.
+    """
+    extension = '.ldif'
+
+    def __init__(self, output_file, replace_illegal_characters=False, flavor='openldap'):
+        super().__init__(output_file, replace_illegal_characters)
+        if flavor not in FLAVORS:
+            raise ValueError('Unknown LDIF flavor "{}" (available: {}).'.format(flavor, ', '.join(FLAVORS)))
+        self.flavor = flavor
+
+    def open(self):
+        self._units = set()
+        self._removed_units = set()
+        self._added = []
+        self._moved = []
+        self._removed = []
+
+    def _user_dn(self, username, ou):
+        return user_dn(username, ou, self.flavor)
+
+    def write_class(self, class_name, change):
+        if change == export.REMOVED:
+            student = data.Student('', '', class_name, '')
+            self._removed_units.add(student.generate_ou())
+
+    def write(self, record):
+        student = record.student
+        ou = student.generate_ou()
+        if record.change == export.ADDED:
+            self._units.update(parent_units(ou))
+            self._added.append(self._format_user(record, ou))
+        elif record.change == export.CHANGED:
+            # move user account into the unit of the new class
+            old_student = data.Student(student.surname, student.firstname, student.old_classname, '')
+            old_ou = old_student.generate_ou()
+            if not student.old_classname or old_ou == ou:
+                return
+            self._units.update(parent_units(ou))
+            rdn = split_dn(self._user_dn(record.username, ou))[0]
+            self._moved.append(_format_entry([('dn', self._user_dn(record.username, old_ou)),
+                                              ('changetype', 'modrdn'),
+                                              ('newrdn', rdn),
+                                              ('deleteoldrdn', '1'),
+                                              ('newsuperior', ou)]))
+        else:
+            self._removed.append(_format_entry([('dn', self._user_dn(record.username, ou)),
+                                                ('changetype', 'delete')]))
+
+    def _format_user(self, record, ou):
+        attributes = [('dn', self._user_dn(record.username, ou)), ('changetype', 'add')]
+        return _format_entry(attributes + user_attributes(record, self.flavor, self.replace_illegal_characters))
+
+    def _format_unit(self, ou, changetype):
+        attributes = [('dn', ou), ('changetype', changetype)]
+        if changetype == 'add':
+            name = split_dn(ou)[0].split('=', 1)[1]
+            attributes += [('objectClass', 'top'), ('objectClass', 'organizationalUnit'),
+                           ('ou', re.sub(r'\\(.)', r'\1', name))]
+        return _format_entry(attributes)
+
+    def finish(self):
+        output = self._open_file(self.output_file, newline='\n')
+        output.write('version: 1\n\n')
+        # create organizational units with parents before children
+        for ou in sorted(self._units, key=lambda ou: (len(split_dn(ou)), ou)):
+            output.write(self._format_unit(ou, 'add'))
+        for section in (self._added, self._moved, self._removed):
+            output.writelines(section)
+        # delete units of removed classes after all students in them were deleted or moved
+        for ou in sorted(self._removed_units - self._units, key=lambda ou: (-len(split_dn(ou)), ou)):
+            output.write(self._format_unit(ou, 'delete'))
+        logger.debug('{} added, {} moved and {} removed students written to LDIF file.'.format(
+            len(self._added), len(self._moved), len(self._removed)))
+
+
+class ActiveDirectoryLdifWriter(LdifWriter):
+    """Writes an LDIF file for Microsoft Active Directory to be imported with ldifde."""
+    def __init__(self, output_file, replace_illegal_characters=False):
+        super().__init__(output_file, replace_illegal_characters, flavor='ad')
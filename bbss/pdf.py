@@ -10,18 +10,32 @@ Created on Mon Apr 15 10:51:47 2019
 """
 
 
+import io
 import logging
+import zipfile
 import datetime
+import itertools
+import collections
+import concurrent.futures
 
-from reportlab.lib import colors
 from reportlab.lib.units import cm
 from reportlab.lib.pagesizes import A4
-from reportlab.lib.styles import ParagraphStyle
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-from reportlab.platypus.flowables import KeepTogether
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen import canvas as pdf_canvas
 
+# pypdf is only necessary to merge the documents of all classes into a single file
+try:
+    import pypdf
+except ImportError:
+    pypdf = None
 
-__all__ = ['export_data']
+from bbss import data
+from bbss import export
+from bbss import fileio
+
+
+__all__ = ['export_data', 'create_pdf_doc', 'render_cards', 'fit_font_size', 'draw_fitted_string', 'CardGrid',
+           'PdfWriter']
 
 
 logger = logging.getLogger('bbss.pdf')
@@ -34,70 +48,271 @@ TODAY = datetime.datetime.today().strftime('%d.%m.%Y')
 TITLE = 'Benutzerdaten für Logodidact und Moodle (Stand: {})'.format(TODAY)
 AUTHOR = 'bbss - BBS Student Management'
 INFO_TEXT = 'Bitte die Benutzerdaten an die Schülerinnen und Schüler weitergeben. Danke!'
+HEADING = 'Benutzerdaten für {} {} aus der {}:'
+
+
+# fixed size of the cards with account data of a single student
+CARD_WIDTH = PAGE_WIDTH - 2*BORDER_HORIZONTAL
+CARD_HEIGHT = 2.4*cm
+CARD_PADDING = 15
+# space on top of each page for title and info text
+HEADER_HEIGHT = 3.5*cm
+
+
+# account data of a single student as plain tuple, that can be sent to worker processes
+StudentRow = collections.namedtuple('StudentRow', 'classname surname firstname user_id password')
 
 
-def export_data(output_file, student_list):
+def export_data(output_file, student_list, max_workers=None, as_zip=False):
     # create a PDF file with students from list
-    create_pdf_doc(output_file, student_list)
+    return create_pdf_doc(output_file, student_list, max_workers, as_zip)
+
+
+class PdfWriter(export.Writer):
+    """
+    Writes a PDF file with the user account data of all added students to be
+    distributed to the students.
+    """
+    extension = '.pdf'
+
+    def open(self):
+        self._rows = []
+
+    def write(self, record):
+        if record.change == export.ADDED:
+            self._rows.append(StudentRow(record.student.classname, record.student.surname,
+                                         record.student.firstname, record.user_id, record.password))
+
+    def finish(self):
+        # the file is committed with the files of all other formats
+        as_zip = pypdf is None
+        output = self._open_binary_file(self.output_file + '.zip' if as_zip else self.output_file)
+        _write_pdf_doc(output, self._rows, as_zip=as_zip)
+
+
+class CardGrid(object):
+    """
+    Fixed geometry for placing cards of the same size in a grid on each page.
+    The positions of all cards on a page are computed only once, so that
+    drawing a card needs no layout at all.
+
+    :param card_width: width of a single card
+    :param card_height: height of a single card
+    :param columns: number of cards side by side
+    :param gap: space between neighbouring cards
+    :param top: space on top of each page that is left free for a header
+    :param bottom: space at the bottom of each page that is left free for a footer
+    """
+    def __init__(self, card_width, card_height, columns=1, gap=0.6*cm, top=HEADER_HEIGHT, bottom=2.5*cm):
+        self.card_width = card_width
+        self.card_height = card_height
+        rows = max(1, int((PAGE_HEIGHT - top - bottom + gap) // (card_height + gap)))
+        # center all columns horizontally on the page
+        left = (PAGE_WIDTH - columns * card_width - (columns - 1) * gap) / 2
+        # positions of the lower left corner of all cards, row by row from the top
+        self.positions = [(left + column * (card_width + gap), PAGE_HEIGHT - top - (row + 1) * card_height - row * gap)
+                          for row in range(rows) for column in range(columns)]
+
+    def __len__(self):
+        return len(self.positions)
+
+    def count_pages(self, card_count):
+        """Returns the number of pages needed for the given number of cards."""
+        return max(1, -(-card_count // len(self.positions)))
+
+
+def fit_font_size(text, font_name, font_size, max_width, min_font_size=6):
+    """
+    Returns the largest font size not greater than the given one, with which
+    the text fits into the given width. Long names are shrunk instead of
+    overflowing their card.
+    """
+    width = stringWidth(text, font_name, font_size)
+    if width <= max_width:
+        return font_size
+    return max(min_font_size, font_size * max_width / width)
+
+
+def draw_fitted_string(canvas, x, y, text, font_name, font_size, max_width, align='left'):
+    """Draws a single line of text and shrinks it if it does not fit into the given width."""
+    canvas.setFont(font_name, fit_font_size(text, font_name, font_size, max_width))
+    if align == 'right':
+        canvas.drawRightString(x, y, text)
+    else:
+        canvas.drawString(x, y, text)
+
+
+def render_cards(pdf_file, cards, draw_card, grid, title, draw_header=None, number_pages=True, first_page=1):
+    """
+    Draws cards of a fixed size directly on the canvas of a new PDF document.
+
+    Each page is compressed as soon as it is complete, so that only the
+    compressed content of finished pages is held in memory until the
+    document is written. Time and memory needed grow linearly with the number
+    of cards.
 
+    :param pdf_file: file name or binary file object to write the document to
+    :param cards: iterable with the data of all cards
+    :param draw_card: function drawing a single card, called with canvas,
+                      position (x, y), grid and the data of the card
+    :param grid: CardGrid object describing the positions of cards on a page
+    :param title: title of the document, printed in the footer of each page
+    :param draw_header: function called with the canvas for each new page
+    :param number_pages: whether to print the page number in the footer
+    :param first_page: page number of the first page, so that documents
+                       rendered separately can be numbered continuously
+    :return: number of pages of the document
+    """
+    canvas = pdf_canvas.Canvas(pdf_file, pagesize=A4, pageCompression=1)
+    canvas.setAuthor(AUTHOR)
+    canvas.setTitle(title)
+    page = first_page - 1
+    for index, card in enumerate(cards):
+        position = index % len(grid)
+        if position == 0:
+            if index:
+                canvas.showPage()
+            page += 1
+            _draw_page(canvas, page, title, draw_header, number_pages)
+        draw_card(canvas, *grid.positions[position], grid, card)
+    if page < first_page:
+        page += 1
+        _draw_page(canvas, page, title, draw_header, number_pages)
+    canvas.showPage()
+    canvas.save()
+    return page - first_page + 1
 
-def create_first_page(canvas, _):
-    canvas.saveState()
+
+def _draw_page(canvas, page, title, draw_header, number_pages):
+    if draw_header:
+        draw_header(canvas)
+    canvas.setFont('Helvetica', 10)
+    canvas.drawString(BORDER_HORIZONTAL, BORDER_VERTICAL, title)
+    if number_pages:
+        canvas.drawRightString(PAGE_WIDTH-BORDER_HORIZONTAL, BORDER_VERTICAL, 'Seite {}'.format(page))
+
+
+def _draw_header(canvas):
     canvas.setFont('Helvetica', 16)
     canvas.drawCentredString(PAGE_WIDTH/2.0, PAGE_HEIGHT-58, TITLE)
-    canvas.setFont('Helvetica', 10)
-    canvas.drawString(BORDER_HORIZONTAL, BORDER_VERTICAL, TITLE)
-    canvas.drawRightString(PAGE_WIDTH-BORDER_HORIZONTAL, BORDER_VERTICAL, "Seite 1")
-    canvas.restoreState()
+    canvas.setFont('Helvetica', 11)
+    canvas.drawString(BORDER_HORIZONTAL, PAGE_HEIGHT-HEADER_HEIGHT+0.6*cm, INFO_TEXT)
 
 
-def create_later_pages(canvas, doc):
-    canvas.saveState()
-    canvas.setFont('Helvetica', 10)
-    canvas.drawString(BORDER_HORIZONTAL, BORDER_VERTICAL, TITLE)
-    canvas.drawRightString(PAGE_WIDTH-BORDER_HORIZONTAL, BORDER_VERTICAL, "Seite {}".format(doc.page))
-    canvas.restoreState()
+def _draw_student_card(canvas, x, y, grid, row):
+    canvas.setLineWidth(0.25)
+    canvas.rect(x, y, grid.card_width, grid.card_height)
+    inner_width = grid.card_width - 2*CARD_PADDING
+    heading = HEADING.format(row.firstname, row.surname, row.classname)
+    draw_fitted_string(canvas, x + CARD_PADDING, y + grid.card_height - 22, heading, 'Helvetica', 11, inner_width)
+    # user name on the left and password on the right side of the card
+    # missing values are left empty instead of printing "None"
+    password = 'Passwort: {}'.format(row.password or '')
+    password_width = stringWidth(password, 'Courier', 12)
+    canvas.setFont('Courier', 12)
+    canvas.drawRightString(x + grid.card_width - 2*CARD_PADDING, y + 20, password)
+    user_name = 'Benutzername: {}'.format(row.user_id or '')
+    draw_fitted_string(canvas, x + 2*CARD_PADDING, y + 20, user_name, 'Courier', 12,
+                       inner_width - 2*CARD_PADDING - password_width - CARD_PADDING)
 
 
-def create_pdf_doc(output_file, students_added):
+def create_pdf_doc(output_file, students_added, max_workers=None, as_zip=False):
+    """
+    Creates a PDF file with the user account data of the given students.
+
+    The document of each class is rendered separately in a pool of processes.
+    Because all cards have the same size, the number of pages of each class
+    is known in advance and the pages can be numbered continuously while
+    rendering. Afterwards all documents are merged into a single file. If
+    pypdf is not available or as_zip is set, a ZIP archive containing one PDF
+    file per class is written instead, e.g. "export.pdf.zip".
+
+    :param output_file: file name to write data to
+    :param students_added: list of Student objects or StudentRow tuples
+    :param max_workers: maximum number of processes rendering classes, 1 to
+                        render all classes in the current process
+    :param as_zip: whether to write a ZIP archive with one file per class
+    :return: name of the written file
+    """
     logger.debug('Exporting students to PDF file...')
-    # create PDF file
-    link_paragraph_style = ParagraphStyle(name='Normal', fontSize=11)
-    doc = SimpleDocTemplate(output_file, author=AUTHOR, title=TITLE)
-    story = [Spacer(1, 0.5*cm)]
-    # add page header
-    story.append(Paragraph(INFO_TEXT, link_paragraph_style))
-    story.append(Spacer(1, 0.5*cm))
-    for s in sorted(students_added):
-        # build inner table with class specific user account information
-        inner_table_data = [['Benutzername: {}'.format(s.user_id), 'Passwort: {}'.format(s.password)]]
-        inner_table = Table(inner_table_data)
-        inner_table.setStyle(TableStyle([('FONT', (0, 0), (-1, -1), 'Courier'),
-                                         ('FONTSIZE', (0, 0), (-1, -1), 12),
-                                         ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-                                         ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                                         ('INNERGRID', (0, 0), (-1, -1), 0.25, colors.white),
-                                         ('BOX', (0, 0), (-1, -1), 0.25, colors.white),
-                                         ('LEFTPADDING', (0, 0), (-1, -1), 20),
-                                         ('RIGHTPADDING', (0, 0), (-1, -1), 20),
-                                         ('BOTTOMPADDING', (0, 0), (-1, -1), 5),
-                                         ('TOPPADDING', (0, 0), (-1, -1), 5)]))
-        # build paragraphs for outer table
-        heading = 'Benutzerdaten für {} {} aus der {}:'
-        data = [[Paragraph(heading.format(s.firstname, s.surname, s.classname), link_paragraph_style)],
-                [inner_table]]
-        outer_table = Table(data)
-        outer_table.setStyle(TableStyle([('FONT', (0, 0), (-1, -1), 'Helvetica'),
-                                         ('FONTSIZE', (0, 0), (-1, -1), 14),
-                                         ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                                         ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                                         ('INNERGRID', (0, 0), (-1, -1), 0.25, colors.white),
-                                         ('BOX', (0, 0), (-1, -1), 0.25, colors.black),
-                                         ('LEFTPADDING', (0, 0), (-1, -1), 15),
-                                         ('RIGHTPADDING', (0, 0), (-1, -1), 15),
-                                         ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-                                         ('TOPPADDING', (0, 0), (-1, -1), 8)]))
-        # append outer table for this class to document (without breaking table over multiple pages)
-        story.append(KeepTogether(outer_table))
-        story.append(Paragraph('<br/><br/>', ParagraphStyle(name='Normal')))
-    doc.build(story, onFirstPage=create_first_page, onLaterPages=create_later_pages)
+    if not as_zip and pypdf is None:
+        logger.warning('Package pypdf not available, writing ZIP archive with PDF files per class instead.')
+        as_zip = True
+    if as_zip:
+        output_file = output_file + '.zip'
+    with fileio.atomic_open(output_file, 'wb') as output:
+        count = _write_pdf_doc(output, students_added, max_workers, as_zip)
+    logger.debug('PDF documents for {} classes written to file: {}'.format(count, output_file))
+    return output_file
+
+
+def _create_row(student):
+    if isinstance(student, StudentRow):
+        return student
+    return StudentRow(student.classname, student.surname, student.firstname,
+                      student.generate_user_id(), student.generate_password())
+
+
+def _group_rows_by_class(students):
+    """Returns a list of tuples with class name and all rows of this class sorted by name."""
+    rows = sorted(map(_create_row, students))
+    return [(classname, list(class_rows))
+            for classname, class_rows in itertools.groupby(rows, key=lambda r: r.classname)]
+
+
+def _render_classes(classes, max_workers, continuous_page_numbers):
+    """Renders the documents of all classes and returns them in the order of the classes."""
+    grid = CardGrid(CARD_WIDTH, CARD_HEIGHT)
+    rows = [class_rows for _, class_rows in classes]
+    first_pages = [1] * len(rows)
+    if continuous_page_numbers:
+        page_counts = [grid.count_pages(len(class_rows)) for class_rows in rows]
+        first_pages = [1 + pages for pages in itertools.accumulate([0] + page_counts[:-1])]
+    if max_workers == 1 or len(classes) <= 1:
+        documents = list(map(_render_class, rows, first_pages))
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+            # executor.map() keeps the order of the classes
+            documents = list(executor.map(_render_class, rows, first_pages, chunksize=4))
+    return [(classname, document) for (classname, _), document in zip(classes, documents)]
+
+
+def _render_class(rows, first_page):
+    """Renders a PDF document for all students of a class, is called in worker processes."""
+    buffer = io.BytesIO()
+    render_cards(buffer, rows, _draw_student_card, CardGrid(CARD_WIDTH, CARD_HEIGHT), TITLE,
+                 draw_header=_draw_header, first_page=first_page)
+    return buffer.getvalue()
+
+
+def _write_pdf_doc(output, students_added, max_workers=None, as_zip=False):
+    """Renders the documents of all classes, writes them into an open binary file and returns their number."""
+    # write at least an empty document, even if no students were given
+    classes = _group_rows_by_class(students_added) or [('', [])]
+    documents = _render_classes(classes, max_workers, continuous_page_numbers=not as_zip)
+    if as_zip:
+        _write_zip_archive(output, documents)
+    else:
+        _write_merged_document(output, documents)
+    return len(documents)
+
+
+def _write_merged_document(pdf_file, documents):
+    writer = pypdf.PdfWriter()
+    for classname, document in documents:
+        first_page = len(writer.pages)
+        for page in pypdf.PdfReader(io.BytesIO(document)).pages:
+            writer.add_page(page)
+        if classname:
+            writer.add_outline_item(classname, first_page)
+    # fonts are embedded once per class document, keep only a single copy of them
+    writer.compress_identical_objects()
+    writer.add_metadata({'/Author': AUTHOR, '/Title': TITLE})
+    writer.write(pdf_file)
+
+
+def _write_zip_archive(zip_file, documents):
+    # PDF files are already compressed internally
+    with zipfile.ZipFile(zip_file, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for classname, document in documents:
+            archive.writestr('{}.pdf'.format(data.replace_illegal_characters(classname) or 'Benutzerdaten'), document)
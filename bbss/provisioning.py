@@ -0,0 +1,238 @@
+
+"""
+bbss - BBS Student Management
+
+Engine for provisioning user accounts of many students concurrently on a
+remote server, e.g. the SSO server. Every student is handled by a task in a
+bounded pool of threads. A task runs a list of steps (create user, set
+password, ...) for its student in order. All requests to a host are limited
+by a shared rate limiter and failed requests are retried with exponential
+backoff, if the error is temporary. An error for a student only stops the
+steps of this student, all others are provisioned nonetheless. The results
+for each student are collected into a summary.
+
+Created on Mon Oct 19 19:14:26 2026
+
+@author: Christian Wichmann
+"""
+
+
+import time
+import queue
+import random
+import logging
+import threading
+import concurrent.futures
+
+
+__all__ = ['provision', 'call_with_retries', 'get_rate_limiter', 'RateLimiter', 'StudentResult', 'Summary']
+
+
+logger = logging.getLogger('bbss.provisioning')
+
+
+# number of students provisioned at the same time
+MAX_WORKERS = 8
+
+# maximum number of requests per second sent to a single host
+REQUESTS_PER_SECOND = 20
+
+# number of retries for a request that failed with a temporary error
+RETRIES = 4
+
+# delay in seconds before the first retry, doubled for every further retry
+BASE_DELAY = 0.5
+
+# maximum delay in seconds between two retries
+MAX_DELAY = 30
+
+# interval in seconds for writing all completed steps to the journal at once
+JOURNAL_INTERVAL = 1.0
+
+
+class RateLimiter(object):
+    """
+    Token bucket limiting the number of requests per second. A limiter can be
+    shared by many threads, acquire() blocks until a request may be sent.
+    """
+    def __init__(self, rate=REQUESTS_PER_SECOND, burst=None):
+        self.rate = rate
+        self.burst = burst or rate
+        self._tokens = self.burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+# rate limiters for all hosts, shared by all connections to the same host
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(host, rate=REQUESTS_PER_SECOND):
+    """Returns the rate limiter for a host, it is created on first use."""
+    with _rate_limiters_lock:
+        if host not in _rate_limiters:
+            _rate_limiters[host] = RateLimiter(rate)
+        return _rate_limiters[host]
+
+
+def call_with_retries(func, *args, rate_limiter=None, retries=RETRIES, is_retryable=None,
+                      base_delay=None, sleep=time.sleep, **kwargs):
+    """
+    Calls a function and retries it with exponential backoff, if it raises an
+    exception that is regarded as temporary.
+
+    :param func: function sending a request
+    :param rate_limiter: RateLimiter to acquire before every call or None
+    :param retries: maximum number of retries
+    :param is_retryable: function getting the exception and returning whether
+                         to retry, None to never retry
+    :param base_delay: delay in seconds before the first retry, None for the
+                       default delay (BASE_DELAY)
+    :param sleep: function for waiting between retries
+    :return: return value of the function
+    """
+    if base_delay is None:
+        base_delay = BASE_DELAY
+    attempt = 0
+    while True:
+        if rate_limiter:
+            rate_limiter.acquire()
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            if attempt >= retries or not is_retryable or not is_retryable(e):
+                raise
+            # random jitter prevents all threads from retrying at the same time
+            delay = min(MAX_DELAY, base_delay * 2 ** attempt) * random.uniform(0.5, 1.5)
+            logger.debug('Request failed ({}), retrying in {:.1f} seconds...'.format(e, delay))
+            sleep(delay)
+            attempt += 1
+
+
+class StudentResult(object):
+    """Result of provisioning a single student: all completed steps and the error, if a step failed."""
+    def __init__(self, student):
+        self.student = student
+        self.completed_steps = []
+        self.failed_step = None
+        self.error = None
+        # values stored by the steps for later steps, e.g. the id of the created user
+        self.values = {}
+
+    def __str__(self):
+        if self.ok:
+            return '<StudentResult: {} ok>'.format(self.student)
+        return '<StudentResult: {} failed at {}: {}>'.format(self.student, self.failed_step, self.error)
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+class Summary(object):
+    """Results of provisioning a list of students."""
+    def __init__(self, results, duration=0.0):
+        self.results = results
+        self.duration = duration
+
+    @property
+    def succeeded(self):
+        return [r for r in self.results if r.ok]
+
+    @property
+    def failed(self):
+        return [r for r in self.results if not r.ok]
+
+    def report(self):
+        """Returns a short report as text with one line for every failed student."""
+        lines = ['{} of {} students provisioned in {:.1f} seconds, {} failed.'.format(
+            len(self.succeeded), len(self.results), self.duration, len(self.failed))]
+        for r in self.failed:
+            lines.append('  {} {} ({}): {} failed: {}'.format(r.student.firstname, r.student.surname,
+                                                             r.student.classname, r.failed_step, r.error))
+        return '\n'.join(lines)
+
+
+def _provision_student(student, steps, rate_limiter, retries, is_retryable, previous_steps, completed):
+    result = StudentResult(student)
+    for name, step in steps:
+        # skip steps that were completed before, e.g. by an upload that was aborted
+        if name in previous_steps:
+            result.values.update(previous_steps[name])
+            result.completed_steps.append(name)
+            continue
+        try:
+            call_with_retries(step, student, result.values, rate_limiter=rate_limiter, retries=retries,
+                              is_retryable=is_retryable)
+        except Exception as e:
+            logger.warning('Could not provision {} {} ({}): {}'.format(student.firstname, student.surname, name, e))
+            result.failed_step = name
+            result.error = e
+            break
+        result.completed_steps.append(name)
+        completed.put((student, name, dict(result.values)))
+    return result
+
+
+def _drain(completed):
+    entries = []
+    while True:
+        try:
+            entries.append(completed.get_nowait())
+        except queue.Empty:
+            return entries
+
+
+def provision(students, steps, max_workers=MAX_WORKERS, rate_limiter=None, retries=RETRIES, is_retryable=None,
+              journal=None):
+    """
+    Provisions a list of students concurrently. For each student all steps
+    are executed in order until one of them fails.
+
+    If a journal is given, all steps already completed for a student are
+    skipped and all newly completed steps are written to the journal. The
+    journal is only written from the calling thread and in batches.
+
+    :param students: list of students
+    :param steps: list of tuples with name and function of each step, the
+                  function gets the student and a dictionary to store values
+                  for later steps of the same student
+    :param max_workers: maximum number of students provisioned at the same time
+    :param rate_limiter: RateLimiter shared by all requests or None
+    :param retries: maximum number of retries for every step
+    :param is_retryable: function deciding whether an exception is temporary
+    :param journal: object with methods get(student), returning a dictionary
+                    of names of completed steps to the values stored by them,
+                    and write(entries), storing a list of tuples of student,
+                    name of the completed step and values
+    :return: Summary with a StudentResult for each student in the given order
+    """
+    start = time.perf_counter()
+    completed = queue.Queue()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(_provision_student, s, steps, rate_limiter, retries, is_retryable,
+                                   journal.get(s) if journal else {}, completed)
+                   for s in students]
+        pending = futures
+        while pending:
+            _, pending = concurrent.futures.wait(pending, timeout=JOURNAL_INTERVAL)
+            entries = _drain(completed)
+            if journal and entries:
+                journal.write(entries)
+        results = [f.result() for f in futures]
+    summary = Summary(results, time.perf_counter() - start)
+    logger.info(summary.report())
+    return summary
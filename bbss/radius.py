@@ -11,11 +11,12 @@ Created on Mon Feb  26 15:08:56 2014
 
 
 import logging
-import os
-from itertools import chain
+import collections
 
+from bbss import export
 
-__all__ = ['export_data']
+
+__all__ = ['export_data', 'RadiusWriter']
 
 
 logger = logging.getLogger('bbss.radius')
@@ -25,23 +26,37 @@ def export_data(output_file, change_set):
     """
     Exports a given change set into a configuration file for a Radius authentication server.
     """
-    if os.path.exists(output_file):
-        logger.warning('Output file already exists, will be overwritten...')
-    with open(output_file, 'w') as export_file:
+    export.export_changeset(change_set, [RadiusWriter(output_file)])
+
+
+class RadiusWriter(export.Writer):
+    """
+    Writes all added and changed students into a configuration file for a
+    Radius authentication server. The students are grouped by their class, so
+    all lines are collected and written after the last student.
+    """
+    def __init__(self, output_file, replace_illegal_characters=False):
+        super().__init__(output_file, replace_illegal_characters)
+        self._students_per_class = collections.defaultdict(list)
+
+    def open(self):
+        self._export_file = self._open_file(self.output_file, encoding=None, newline=None)
+
+    def write(self, record):
+        if record.change != export.REMOVED:
+            self._students_per_class[record.student.classname].append(record)
+
+    def finish(self):
         count = 0
-        class_of_student = ''
         line = '{:20}\t\tCleartext-Password := "{}"\n'
         last_exported_student = None
-        for student in sorted(chain(change_set.students_added, change_set.students_changed),  key=lambda s: s.classname):
-            if student == last_exported_student:
-                continue
-            last_exported_student = student
-            count += 1
-            if class_of_student != student.classname:
-                export_file.write('# {}\n'.format(student.classname))
-                class_of_student = student.classname
-            formatted_line = line.format(student.generate_user_id().lower(),
-                                         student.generate_password())
-            export_file.write(formatted_line)
+        for class_of_student in sorted(self._students_per_class):
+            self._export_file.write('# {}\n'.format(class_of_student))
+            for record in self._students_per_class[class_of_student]:
+                if record.student == last_exported_student:
+                    continue
+                last_exported_student = record.student
+                count += 1
+                self._export_file.write(line.format(record.username, record.password))
         logger.debug('{0} students exported to radius file format.'
                      .format(count))
@@ -0,0 +1,229 @@
+
+"""
+bbss - BBS Student Management
+
+Searches students in the database while the search string is typed. A search
+uses its own read-only connection to the database, so that it can run in a
+worker thread beside the main connection. Searches can be cancelled while the
+database is queried.
+
+The results of recent searches are cached. If a search string contains the
+string of a cached search, e.g. "Müll" after "Mü", the new result is a subset
+of the cached one and is filtered from it in memory instead of querying the
+database again. The filter compares the same fields in the same way as the
+LIKE operator of SQLite, which ignores case only for ASCII characters.
+
+Lists of students already in memory, e.g. the preview of an import, are
+filtered with a StudentIndex. It stores a lowercase key of surname, first
+name and class for every student and an index of all trigrams (substrings of
+three characters) of these keys. Only students containing all trigrams of the
+filter string have to be compared with it.
+
+Created on Tue Oct 20 13:26:40 2026
+
+@author: Christian Wichmann
+"""
+
+
+import re
+import time
+import sqlite3
+import logging
+import collections
+
+from bbss import db
+
+
+__all__ = ['StudentSearch', 'SearchResult', 'StudentIndex']
+
+
+logger = logging.getLogger('bbss.search')
+
+
+# number of search results kept in the cache
+CACHE_SIZE = 32
+
+# number of SQLite instructions between checks whether a search was cancelled
+PROGRESS_INTERVAL = 10000
+
+# characters with a special meaning for the LIKE operator, strings containing them are never filtered in memory
+WILDCARDS = ('%', '_')
+
+# wildcards for filtering lists of students: any number of characters and a single character
+FILTER_WILDCARDS = ('*', '?')
+
+# separates the fields of a student in its key, so that no trigram spans two fields
+KEY_SEPARATOR = '\x00'
+
+# SQLite compares only ASCII characters case-insensitively
+_ASCII_LOWER = str.maketrans('ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz')
+
+
+SearchResult = collections.namedtuple('SearchResult', 'search_string students duration cached')
+
+
+class SearchCancelled(Exception):
+    pass
+
+
+def _matches(fields, search_string):
+    """Returns whether one of the fields contains the search string, like the LIKE operator does."""
+    return any(field is not None and search_string in str(field).translate(_ASCII_LOWER) for field in fields)
+
+
+class StudentSearch(object):
+    """
+    Searches students with a read-only connection to the database. All
+    methods have to be called from the same thread, because the connection
+    is bound to the thread that opened it.
+    """
+    def __init__(self, db_filename=None, cache_size=CACHE_SIZE):
+        self.db_filename = db_filename
+        self.cache_size = cache_size
+        self._database = None
+        # search strings mapped to lists of tuples of searched fields and student
+        self._cache = collections.OrderedDict()
+
+    def _find_cached(self, search_string):
+        """Returns the longest cached search string contained in the given string or None."""
+        if any(c in search_string for c in WILDCARDS):
+            return None
+        candidates = [s for s in self._cache if s in search_string]
+        return max(candidates, key=len) if candidates else None
+
+    def _query(self, search_string, is_cancelled):
+        if self._database is None:
+            self._database = db.StudentDatabase(self.db_filename, read_only=True)
+        # abort the running query as soon as the search was cancelled
+        self._database.conn.set_progress_handler(is_cancelled, PROGRESS_INTERVAL)
+        try:
+            results = []
+            for result in self._database.iter_search_results(search_string, with_search_fields=True):
+                results.append(result)
+                if is_cancelled():
+                    raise SearchCancelled()
+            return results
+        except sqlite3.OperationalError:
+            if is_cancelled():
+                raise SearchCancelled()
+            raise
+        finally:
+            self._database.conn.set_progress_handler(None, PROGRESS_INTERVAL)
+
+    def search(self, search_string, is_cancelled=lambda: False):
+        """
+        Searches for students whose name, class or birthday contains the
+        given string.
+
+        :param search_string: string to search for
+        :param is_cancelled: function returning whether the search is no
+                             longer needed, it is called regularly while the
+                             database is queried
+        :return: SearchResult or None, if the search was cancelled
+        """
+        start = time.perf_counter()
+        key = search_string.translate(_ASCII_LOWER)
+        cached = self._find_cached(key)
+        try:
+            if cached == key:
+                results = self._cache[cached]
+            elif cached is not None:
+                results = [r for r in self._cache[cached] if _matches(r[0], key)]
+            else:
+                results = self._query(search_string, is_cancelled)
+        except SearchCancelled:
+            logger.debug('Search for "{}" cancelled.'.format(search_string))
+            return None
+        self._cache[key] = results
+        self._cache.move_to_end(key)
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        duration = time.perf_counter() - start
+        logger.debug('Found {} students for "{}" in {:.1f} ms{}.'.format(
+            len(results), search_string, duration * 1000, ' (cached)' if cached is not None else ''))
+        return SearchResult(search_string, [student for _, student in results], duration, cached is not None)
+
+    def reset(self):
+        """Clears the cache and closes the connection, e.g. after the database was changed."""
+        self._cache.clear()
+        if self._database is not None:
+            self._database.close_connection()
+            self._database = None
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class StudentIndex(object):
+    """
+    Index for filtering a list of students by surname, first name and class.
+    A filter string matches a student, if one of these fields contains it
+    ignoring case. The wildcards "*" and "?" match any number of characters
+    and a single character within a field.
+    """
+    def __init__(self, students, fields=('surname', 'firstname', 'classname')):
+        self.fields = fields
+        # lowercase key for every student with all fields separated
+        self.keys = [KEY_SEPARATOR.join(str(getattr(s, f) or '') for f in fields).lower() for s in students]
+        # sorted lists of the positions of all students containing a trigram
+        self.trigrams = collections.defaultdict(list)
+        for row, key in enumerate(self.keys):
+            for trigram in _trigrams(key):
+                if KEY_SEPARATOR not in trigram:
+                    self.trigrams[trigram].append(row)
+        self._last_filter = None
+        self._last_rows = None
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _candidates(self, fragments):
+        """Returns the positions of all students containing all trigrams of the given fragments or None."""
+        trigrams = set()
+        for fragment in fragments:
+            trigrams |= _trigrams(fragment)
+        if not trigrams:
+            return None
+        postings = sorted((self.trigrams.get(t, ()) for t in trigrams), key=len)
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            if not candidates:
+                break
+            candidates.intersection_update(posting)
+        return sorted(candidates)
+
+    def filter(self, filter_string):
+        """
+        Returns the positions of all students matching the filter string in
+        ascending order or None, if the filter string is empty.
+
+        :param filter_string: string to filter for, may contain wildcards
+        :return: list of positions in the list of students or None
+        """
+        filter_string = filter_string.lower()
+        if not filter_string.strip('*'):
+            return None
+        if any(c in filter_string for c in FILTER_WILDCARDS):
+            fragments = [f for f in re.split(r'[*?]', filter_string) if f]
+            pattern = re.compile('.*?'.join('.'.join(re.escape(c) for c in p.split('?'))
+                                            for p in filter_string.split('*')))
+            # compare with the pattern only when all fragments are found,
+            # wildcards never match the separator, so that a match does not span two fields
+            matches = lambda key: (all(f in key for f in fragments)
+                                   and any(pattern.search(field) for field in key.split(KEY_SEPARATOR)))
+        else:
+            fragments = [filter_string]
+            matches = lambda key: filter_string in key
+        # a filter string containing the last one matches a subset of its students
+        if self._last_filter is not None and fragments == [filter_string] and self._last_filter in filter_string:
+            candidates = self._last_rows
+        else:
+            candidates = self._candidates(fragments)
+        if candidates is None:
+            candidates = range(len(self.keys))
+        keys = self.keys
+        rows = [row for row in candidates if matches(keys[row])]
+        if fragments == [filter_string]:
+            self._last_filter, self._last_rows = filter_string, rows
+        return rows
@@ -10,95 +10,508 @@ Created on Fri Jan 31 08:43:12 2025
 """
 
 
+import json
+import time
+import socket
 import logging
+import threading
 import logging.handlers
+from collections import defaultdict, namedtuple
 
+import urllib3
+import concurrent.futures
 import authentik_client
 from authentik_client.rest import ApiException
 
 from bbss import data
+from bbss import config
+from bbss import provisioning
 
 
-__all__ = ['upload_data']
+__all__ = ['upload_data', 'plan_reconciliation', 'ReconcilePlan', 'UploadJournal', 'ResponseCache']
 
 
 logger = logging.getLogger('bbss.sso')
 
 
+# group containing all students, groups for classes are created below it
+STUDENT_GROUP = 'Schülerinnen und Schüler'
+
+# number of users or groups read from the API with each request
+PAGE_SIZE = 500
+
+# HTTP status codes for temporary errors, requests are retried after them
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# HTTP status codes returned when a user with the same name already exists
+CONFLICT_STATUS_CODES = (400, 409)
+
+
+def _is_retryable(e):
+    """Checks whether a request failed because of a temporary error (rate limit, server or network)."""
+    if isinstance(e, ApiException):
+        return e.status in RETRY_STATUS_CODES
+    return isinstance(e, (urllib3.exceptions.HTTPError, ConnectionError, TimeoutError))
+
+
+# all changes necessary to bring the users on the server in line with the students of an import:
+#  - new_groups: names of classes without group
+#  - creates: students without user
+#  - updates: tuples of student, user id and dictionary with changed fields
+#  - group_changes: map of group names to sets of user ids to be added and removed
+#  - deactivations: ids of users of students that are no longer in school
+ReconcilePlan = namedtuple('ReconcilePlan', 'new_groups creates updates group_changes deactivations')
+
+
 def upload_data(student_list):
-    userManagement = UserManagement('auth.xxx.com', '')
-    userManagement.import_users(student_list)
+    """
+    Uploads students to the SSO server configured in bbss.config. The user
+    management of the default session is used, so that open connections and
+    cached lists of users and groups are reused by all uploads.
+    """
+    from bbss import bbss
+    return bbss.get_default_session().upload_students_to_school_server(student_list)
+
+
+class ResponseCache:
+    """
+    Cache for responses of read-only requests like lists of users and groups.
+    A response is reused without any request for a given time. Afterwards it
+    is revalidated with its ETag, so that an unchanged list is not transferred
+    again. Requests changing data on the server invalidate all responses of
+    the same kind.
+    """
+    def __init__(self, ttl=config.SSO_CACHE_TTL):
+        self._ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def lookup(self, key):
+        """Returns the cached value, its ETag and whether it is still fresh (None, None, False if not cached)."""
+        with self._lock:
+            if key not in self._entries:
+                return None, None, False
+            timestamp, etag, value = self._entries[key]
+            return value, etag, time.monotonic() - timestamp < self._ttl
+
+    def put(self, key, value, etag=None):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), etag, value)
+
+    def touch(self, key):
+        """Marks a cached value as fresh again after the server confirmed that it did not change."""
+        with self._lock:
+            _, etag, value = self._entries[key]
+            self._entries[key] = (time.monotonic(), etag, value)
+
+    def invalidate(self, kind):
+        """Removes all cached responses of a kind, e.g. "users" or "groups"."""
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == kind]:
+                del self._entries[key]
+
+
+class UploadJournal:
+    """
+    Journal of all completed steps (user, password, group) for each student
+    of an upload, stored in the student database. If an upload was aborted,
+    e.g. because of network errors, the next upload continues where the last
+    one stopped.
+    """
+    def __init__(self, database):
+        self._database = database
+        self._entries = {username: {step: json.loads(value) for step, value in steps.items()}
+                         for username, steps in database.get_sso_journal().items()}
+        if self._entries:
+            logger.info(f'Continuing aborted upload, {len(self._entries)} students were uploaded partially.')
+
+    def get(self, student):
+        return self._entries.get(student.user_id.casefold(), {})
+
+    def write(self, entries):
+        for student, step, values in entries:
+            self._entries.setdefault(student.user_id.casefold(), {})[step] = values
+        self._database.add_sso_journal_entries([(student.user_id.casefold(), step, json.dumps(values))
+                                                for student, step, values in entries])
+
+    def clear(self, students=None):
+        """Removes the entries of the given students or of all students, if None is given."""
+        if students is None:
+            self._entries = {}
+            self._database.clear_sso_journal()
+            return
+        usernames = [s.user_id.casefold() for s in students]
+        for username in usernames:
+            self._entries.pop(username, None)
+        self._database.clear_sso_journal(usernames)
+
+
+def plan_reconciliation(student_list, users, group_ids, class_group_ids, deactivate_unknown=True):
+    """
+    Compares all students of an import with the users on the server and
+    returns the minimal list of changes.
+
+    :param student_list: all students of the current import
+    :param users: all users in the group of students with fields pk,
+                  username, name, email, is_active and groups (ids of groups)
+    :param group_ids: map of names of all groups to their ids
+    :param class_group_ids: ids of all groups for classes
+    :param deactivate_unknown: deactivate all users without student in the
+                               list, False if only some students are given
+    :return: ReconcilePlan
+    """
+    users_by_name = {u.username: u for u in users}
+    usernames = set()
+    new_groups = set()
+    creates, updates, deactivations = [], [], []
+    group_changes = defaultdict(lambda: (set(), set()))
+    for student in student_list:
+        username = student.user_id.casefold()
+        usernames.add(username)
+        if student.classname not in group_ids:
+            new_groups.add(student.classname)
+        user = users_by_name.get(username)
+        if user is None:
+            creates.append(student)
+            continue
+        wanted = {'name': f'{student.firstname} {student.surname}', 'email': student.email, 'is_active': True}
+        changes = {k: v for k, v in wanted.items() if getattr(user, k) != v}
+        if changes:
+            updates.append((student, user.pk, changes))
+        # move user into the group of its current class
+        class_group = group_ids.get(student.classname)
+        user_groups = set(user.groups or [])
+        if class_group not in user_groups:
+            group_changes[student.classname][0].add(user.pk)
+        for name, pk in group_ids.items():
+            if pk in class_group_ids and pk in user_groups and pk != class_group:
+                group_changes[name][1].add(user.pk)
+    for user in users:
+        if deactivate_unknown and user.username not in usernames and user.is_active:
+            deactivations.append(user.pk)
+    return ReconcilePlan(sorted(new_groups), creates, updates, dict(group_changes), deactivations)
 
 
 class UserManagement:
     def __init__(self, authentik_domain: str, token: str):
-        self._host = f'https://{authentik_domain}/api/v3'
+        # a complete URL can be given instead of a domain, e.g. for a local test server
+        if authentik_domain.startswith(('http://', 'https://')):
+            self._host = f'{authentik_domain}/api/v3'
+        else:
+            self._host = f'https://{authentik_domain}/api/v3'
+        self._rate_limiter = provisioning.get_rate_limiter(self._host)
         self._token = token
         configuration = authentik_client.Configuration(
             host=self._host,
             access_token=self._token
         )
+        # keep connections open and reuse them for all requests to avoid TLS handshakes
+        configuration.connection_pool_maxsize = config.SSO_POOL_SIZE
+        configuration.socket_options = (urllib3.connection.HTTPConnection.default_socket_options
+                                        + [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)])
+        self._timeout = (config.SSO_CONNECT_TIMEOUT, config.SSO_READ_TIMEOUT)
+        self._cache = ResponseCache(config.SSO_CACHE_TTL)
         self._api_client = authentik_client.ApiClient(configuration)
         self._core_api = authentik_client.CoreApi(self._api_client)
+        # map group names to ids and ids to the ids of all members, filled on first use
+        self._group_ids = None
+        self._groups_read = 0
+        self._group_members = {}
+        self._class_group_ids = set()
 
-    def _list_users(self):
-        api_response = self._core_api.core_users_list()
+    def _list_users(self, group_name=None):
+        """Returns all users or all members of a group, the API is read page by page."""
         result = []
-        for u in api_response.results:
-            result.append((u.username, u.name, u.email))
+        page = 1
+        groups_by_name = [group_name] if group_name else None
+        while page:
+            api_response = self._cached_call(('users', group_name, page), self._core_api.core_users_list_with_http_info,
+                                             page=page, page_size=PAGE_SIZE, groups_by_name=groups_by_name,
+                                             include_groups=False)
+            result.extend(api_response.results)
+            page = api_response.pagination.next
+        logger.debug(f'Read {len(result)} users from server.')
         return result
 
     def _list_groups(self):
-        api_response = self._core_api.core_groups_list()
-        for g in api_response.results:
-            logger.debug(f'Group "{g.name}" has {len(g.users_obj)} users.')
-        return api_response.results
+        """Returns all groups, the API is read page by page."""
+        result = []
+        page = 1
+        while page:
+            api_response = self._cached_call(('groups', page), self._core_api.core_groups_list_with_http_info,
+                                             page=page, page_size=PAGE_SIZE, include_users=False)
+            result.extend(api_response.results)
+            page = api_response.pagination.next
+        logger.debug(f'Read {len(result)} groups from server.')
+        return result
+
+    def _get_groups(self):
+        """
+        Returns the cached map of group names to ids. All groups are read on
+        first use and again, when the map is older than the cache TTL.
+        """
+        if self._group_ids is None or time.monotonic() - self._groups_read > config.SSO_CACHE_TTL:
+            self._groups_read = time.monotonic()
+            self._group_ids = {}
+            self._group_members = {}
+            groups = self._list_groups()
+            for g in groups:
+                self._group_ids[g.name] = g.pk
+                self._group_members[g.pk] = set(g.users or [])
+            # groups for classes are created below the group of all students
+            student_group = self._group_ids.get(STUDENT_GROUP)
+            self._class_group_ids = {g.pk for g in groups
+                                     if student_group in (getattr(g, 'parents', None) or [getattr(g, 'parent', None)])}
+        return self._group_ids
 
     def _create_user(self, name, username, email):
         logger.info(f'Creating user {username}...')
         api_response = self._core_api.core_users_create(
-            user_request={'name': name, 'username': username, 'email': email}
+            user_request={'name': name, 'username': username, 'email': email}, _request_timeout=self._timeout
         )
+        self._cache.invalidate('users')
         logger.info(f'Created user {api_response.username} with email {api_response.email} and assigned user id {api_response.pk}')
         return api_response.pk
 
+    def _find_user(self, username):
+        """Returns the user with the given name or None, the user is always looked up on the server."""
+        api_response = self._core_api.core_users_list(username=username, include_groups=False,
+                                                      _request_timeout=self._timeout)
+        return next((u for u in api_response.results if u.username == username), None)
+
     def _find_group_id(self, group_name: str):
-        return [g for g in self._list_groups() if g.name == group_name][0].pk
+        return self._get_groups()[group_name]
 
     def _create_group_for_class(self, group_name):
         logger.info(f'Creating group {group_name}...')
-        parent_group = self._find_group_id('Schülerinnen und Schüler')
+        parent_group = self._find_group_id(STUDENT_GROUP)
         api_response = self._core_api.core_groups_create(
-            user_request={'name': group_name, "is_superuser": False, 'parent': parent_group}
-            # "users": [ 0 ],
+            group_request={'name': group_name, "is_superuser": False, 'parents': [parent_group]},
+            _request_timeout=self._timeout
         )
+        self._cache.invalidate('groups')
         logger.info(f'Created group {api_response.name} with id {api_response.pk}')
+        self._add_class_group(api_response)
         return api_response.pk
 
+    def _find_class_group(self, group_name):
+        """Returns the id of the group with the given name or None, the group is always looked up on the server."""
+        self._cache.invalidate('groups')
+        api_response = self._core_api.core_groups_list(name=group_name, include_users=False,
+                                                       _request_timeout=self._timeout)
+        group = next((g for g in api_response.results if g.name == group_name), None)
+        if group is None:
+            return None
+        self._add_class_group(group)
+        return group.pk
+
+    def _add_class_group(self, group):
+        """Adds a group for a class to the cached map of groups."""
+        self._get_groups()[group.name] = group.pk
+        self._group_members[group.pk] = set(group.users or [])
+        self._class_group_ids.add(group.pk)
+
+    def _create_group_step(self, group_name, values):
+        # creating a group is not idempotent, the same as creating a user (see _create_user_step)
+        if values.pop('create_attempted', False):
+            group_id = self._find_class_group(group_name)
+            if group_id:
+                logger.info(f'Group {group_name} was created by a former attempt with id {group_id}')
+                return group_id
+        values['create_attempted'] = True
+        try:
+            group_id = self._create_group_for_class(group_name)
+        except ApiException as e:
+            group_id = self._find_class_group(group_name) if e.status in CONFLICT_STATUS_CODES else None
+            if not group_id:
+                raise
+            logger.info(f'Group {group_name} already exists with id {group_id}')
+        values.pop('create_attempted')
+        return group_id
+
     def _set_user_password(self, userid, password):
         logger.info(f'Setting password for user no. {userid}...')
         api_response = self._core_api.core_users_set_password_create(
-            id=userid, user_password_set_request={'password': password}
+            id=userid, user_password_set_request={'password': password}, _request_timeout=self._timeout
         )
         #logger.debug(api_response)
 
     def _add_user_to_group(self, userid, group_name):
-        logger.info(f'Adding user no. {userid} to group "{group_name}"...')
+        self._add_users_to_group([userid], group_name)
+
+    def _add_users_to_group(self, userids, group_name):
+        """Adds multiple users to a group with a single request by updating the list of members."""
+        return self._change_group_members(group_name, userids, ())
+
+    def _change_group_members(self, group_name, added_userids, removed_userids):
+        """
+        Adds and removes multiple users of a group with a single request by
+        updating the list of members. The current members are read again just
+        before, so that members added by others since the groups were cached
+        are not removed.
+        """
+        logger.info(f'Adding {len(added_userids)} and removing {len(removed_userids)} users of group "{group_name}"...')
         try:
             group_id = self._find_group_id(group_name)
-            api_response = self._core_api.core_groups_add_user_create(
-                group_uuid=group_id, user_account_request={'pk': userid}
-            )
-            #logger.debug(api_response)
+            group = self._call(self._core_api.core_groups_retrieve, group_uuid=group_id, include_users=False,
+                               _request_timeout=self._timeout)
+            members = (set(group.users or []) | set(added_userids)) - set(removed_userids)
+            api_response = self._call(self._core_api.core_groups_partial_update,
+                                      group_uuid=group_id, patched_group_request={'users': sorted(members)},
+                                      _request_timeout=self._timeout)
+            # memberships are part of the lists of users and groups
+            self._cache.invalidate('groups')
+            self._cache.invalidate('users')
+            self._group_members[group_id] = set(api_response.users or members)
+            return True
         except ApiException as e:
-            print('Exception while adding user to group: %s\n' % e)
+            logger.error(f'Exception while changing members of group: {e}')
+            return False
+
+    def _update_user(self, userid, changes):
+        logger.info(f'Updating user no. {userid}: {", ".join(changes)}...')
+        self._call(self._core_api.core_users_partial_update, id=userid, patched_user_request=changes,
+                   _request_timeout=self._timeout)
+        self._cache.invalidate('users')
 
-    def import_users(self, student_list):
+    def _update_users(self, updates, max_workers=provisioning.MAX_WORKERS):
+        """Updates multiple users concurrently and returns the ids of all users that could not be updated."""
+        failed = []
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(self._update_user, userid, changes): userid for userid, changes in updates}
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    future.result()
+                except ApiException as e:
+                    logger.error(f'Exception while updating user no. {futures[future]}: {e}')
+                    failed.append(futures[future])
+        return failed
+
+    def _call(self, func, *args, **kwargs):
+        """Calls the API with the rate limit of the host and retries on temporary errors."""
+        return provisioning.call_with_retries(func, *args, rate_limiter=self._rate_limiter,
+                                              is_retryable=_is_retryable, **kwargs)
+
+    def _cached_call(self, key, func, **kwargs):
+        """
+        Calls a listing function of the API (with HTTP info) and caches its
+        result. Stale results are revalidated with their ETag.
+        """
+        value, etag, fresh = self._cache.lookup(key)
+        if fresh:
+            return value
+        headers = {'If-None-Match': etag} if etag else None
+        try:
+            api_response = self._call(func, _headers=headers, _request_timeout=self._timeout, **kwargs)
+        except ApiException as e:
+            if e.status == 304 and value is not None:
+                self._cache.touch(key)
+                return value
+            raise
+        self._cache.put(key, api_response.data, (api_response.headers or {}).get('ETag'))
+        return api_response.data
+
+    def _create_user_step(self, student, values):
+        logger.debug(f'Uploading: {student.firstname} {student.surname}, {student.user_id}, {student.email}')
+        username = student.user_id.casefold()
+        # creating a user is not idempotent: a failed attempt, e.g. with a timeout, may
+        # have created the user on the server although no response was received
+        if values.pop('create_attempted', False):
+            user = self._find_user(username)
+            if user:
+                logger.info(f'User {username} was created by a former attempt with user id {user.pk}')
+                values['userid'] = user.pk
+                return
+        values['create_attempted'] = True
         try:
-            for student in student_list:
-                logger.debug(f'Uploading: {student.firstname} {student.surname}, {student.user_id}, {student.email}')
-                userid = self._create_user(f'{student.firstname} {student.surname}', student.user_id.casefold(), student.email)
-                self._set_user_password(userid, student.password)
-                self._add_user_to_group(userid, 'Schülerinnen und Schüler')
+            values['userid'] = self._create_user(f'{student.firstname} {student.surname}', username, student.email)
         except ApiException as e:
-            print('Exception while importing users: %s\n' % e)
+            user = self._find_user(username) if e.status in CONFLICT_STATUS_CODES else None
+            if not user:
+                raise
+            logger.info(f'User {username} already exists with user id {user.pk}')
+            values['userid'] = user.pk
+            # the user may have changed the initial password already
+            values['existing_user'] = True
+        values.pop('create_attempted')
+
+    def _set_password_step(self, student, values):
+        if values.get('existing_user'):
+            logger.info(f'Keeping password of existing user no. {values["userid"]}')
+            return
+        self._set_user_password(values['userid'], student.password)
+
+    def import_users(self, student_list, max_workers=provisioning.MAX_WORKERS, journal=None):
+        """
+        Creates users for all students and sets their passwords concurrently.
+        Afterwards all new users are added to the group of students at once.
+        Errors for a single student do not stop the upload of the others.
+
+        If a journal is given, all steps completed by a previous upload are
+        skipped and all completed steps are stored in the journal.
+
+        :return: Summary with results for each student
+        """
+        steps = [('user', self._create_user_step), ('password', self._set_password_step)]
+        summary = provisioning.provision(student_list, steps, max_workers, self._rate_limiter,
+                                         is_retryable=_is_retryable, journal=journal)
+        # collect new users for each group to add them all at once
+        new_members = defaultdict(list)
+        for result in summary.succeeded:
+            if journal and 'group' in journal.get(result.student):
+                result.completed_steps.append('group')
+                continue
+            new_members[STUDENT_GROUP].append(result)
+        for group_name, results in new_members.items():
+            if self._add_users_to_group([r.values['userid'] for r in results], group_name):
+                for r in results:
+                    r.completed_steps.append('group')
+                if journal:
+                    journal.write([(r.student, 'group', r.values) for r in results])
+            else:
+                for r in results:
+                    r.failed_step, r.error = 'group', 'Could not add user to group.'
+        return summary
+
+    def reconcile(self, student_list, dry_run=False, deactivate_unknown=True):
+        """
+        Brings the users on the server in line with all students of the
+        current import. All users and groups are read once and compared with
+        the students, afterwards only the necessary changes are sent: new
+        users are created, changed names and email addresses are updated,
+        users are moved into the group of their current class and users of
+        students no longer in school are deactivated. Passwords of existing
+        users are never changed.
+
+        :param student_list: all students of the current import
+        :param dry_run: only compute the changes without sending them
+        :param deactivate_unknown: deactivate users of all students not in
+                                   the list, False to update only the users
+                                   of the given students
+        :return: tuple of ReconcilePlan and Summary for the created users
+                 (None for a dry run)
+        """
+        group_ids = self._get_groups()
+        users = self._list_users(STUDENT_GROUP)
+        plan = plan_reconciliation(student_list, users, group_ids, self._class_group_ids, deactivate_unknown)
+        logger.info(f'Reconciling: {len(plan.creates)} new users, {len(plan.updates)} updates, '
+                    f'{len(plan.group_changes)} changed groups, {len(plan.deactivations)} deactivations')
+        if dry_run:
+            return plan, None
+        for class_name in plan.new_groups:
+            self._call(self._create_group_step, class_name, {})
+        summary = self.import_users(plan.creates)
+        group_changes = defaultdict(lambda: (set(), set()))
+        for name, (added, removed) in plan.group_changes.items():
+            group_changes[name][0].update(added)
+            group_changes[name][1].update(removed)
+        for result in summary.succeeded:
+            group_changes[result.student.classname][0].add(result.values['userid'])
+        for group_name, (added, removed) in sorted(group_changes.items()):
+            self._change_group_members(group_name, added, removed)
+        updates = [(userid, changes) for _, userid, changes in plan.updates]
+        updates += [(userid, {'is_active': False}) for userid in plan.deactivations]
+        failed = self._update_users(updates)
+        if failed:
+            logger.error(f'{len(failed)} users could not be updated.')
+        return plan, summary
@@ -0,0 +1,84 @@
+
+"""
+bbss - BBS Student Management
+
+Unit tests for exporting student data for analytics.
+
+Created on Mon Oct 19 16:31:40 2026
+
+@author: Christian Wichmann
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from bbss import db
+from bbss import export
+from bbss import analytics
+from bbss import bbs_verwaltung
+
+
+TEST_DATA_DIRECTORY = os.path.join(os.path.dirname(__file__), '..', 'testdata')
+
+
+@unittest.skipIf(analytics.pyarrow is None, 'Package pyarrow not available.')
+class TestAnalytics(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.old_db_filename = db.DB_FILENAME
+        db.DB_FILENAME = os.path.join(self.directory, 'students.db')
+        self.database = db.StudentDatabase()
+        for f in ('test_data_1.csv', 'test_data_2.csv'):
+            import_file = os.path.join(TEST_DATA_DIRECTORY, f)
+            self.database.store_students_db(import_file, bbs_verwaltung.import_data(import_file), None)
+
+    def tearDown(self):
+        self.database.close_connection()
+        db.DB_FILENAME = self.old_db_filename
+        shutil.rmtree(self.directory)
+
+    def test_export_database_in_batches(self):
+        import pyarrow
+        import pyarrow.parquet
+        output_directory = os.path.join(self.directory, 'analytics')
+        for file_format in ('parquet', 'arrow'):
+            analytics.export_database(output_directory, self.database, file_format, batch_size=7)
+        self.database.cur.execute('SELECT classname, birthday FROM Students ORDER BY id')
+        expected = [tuple(r) for r in self.database.cur.fetchall()]
+        students = pyarrow.parquet.read_table(os.path.join(output_directory, 'Students.parquet'))
+        with pyarrow.ipc.open_file(os.path.join(output_directory, 'Students.arrow')) as reader:
+            self.assertEqual(reader.read_all().to_pylist(), students.to_pylist())
+        self.assertEqual(students.schema.field('classname').type,
+                         pyarrow.dictionary(pyarrow.int32(), pyarrow.string()))
+        self.assertEqual(students.schema.field('birthday').type, pyarrow.date32())
+        self.assertNotIn('password', students.schema.names)
+        actual = [(r['classname'], r['birthday'].isoformat()) for r in students.to_pylist()]
+        self.assertEqual(actual, expected)
+
+    def test_export_changeset(self):
+        import pyarrow
+        import pyarrow.parquet
+        change_set = self.database.generate_changeset(old_import_id=1, new_import_id=2)
+        output_file = os.path.join(self.directory, 'changes')
+        writers = [analytics.ParquetWriter(output_file + analytics.ParquetWriter.extension),
+                   analytics.ArrowWriter(output_file + analytics.ArrowWriter.extension)]
+        # students are written in more than one batch
+        with mock.patch.object(analytics, 'BATCH_SIZE', 5):
+            export.export_changeset(change_set, writers)
+        changes = pyarrow.parquet.read_table(output_file + '.parquet')
+        with pyarrow.ipc.open_file(output_file + '.arrow') as reader:
+            self.assertEqual(reader.read_all().to_pylist(), changes.to_pylist())
+        self.assertEqual(changes.schema, analytics._create_schema(analytics.CHANGESET_COLUMNS))
+        expected = {export.ADDED: len(change_set.students_added), export.CHANGED: len(change_set.students_changed),
+                    export.REMOVED: len(change_set.students_removed)}
+        self.assertEqual(changes.num_rows, sum(expected.values()))
+        kinds = changes.column('change').to_pylist()
+        self.assertEqual({kind: kinds.count(kind) for kind in expected}, expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+
+"""
+bbss - BBS Student Management
+
+Unit tests for sessions with their own student list and database.
+
+Created on Tue Oct 20 16:04:51 2026
+
+@author: Christian Wichmann
+"""
+
+import os
+import pickle
+import shutil
+import zipfile
+import tempfile
+import warnings
+import unittest
+import concurrent.futures
+
+from bbss import bbss
+
+
+TEST_DATA_DIRECTORY = os.path.join(os.path.dirname(__file__), '..', 'testdata')
+
+
+def _import_and_count(session, import_file):
+    session.import_bbs_verwaltung_csv_file(import_file)
+    session.store_students_db(import_file)
+    count = len(session.generate_changeset(old_import_id=0).students_added)
+    session.close()
+    return count
+
+
+class TestBBSSSession(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.import_files = [os.path.join(TEST_DATA_DIRECTORY, f) for f in ('test_data_1.csv', 'test_data_2.csv')]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _create_sessions(self, count):
+        return [bbss.BBSSSession(os.path.join(self.directory, 'students{}.db'.format(i))) for i in range(count)]
+
+    def test_sessions_in_threads(self):
+        sessions = self._create_sessions(2)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+            counts = list(executor.map(_import_and_count, sessions, self.import_files))
+        # every session has its own students and database
+        for session, count in zip(sessions, counts):
+            self.assertEqual(len(session.student_list), count)
+            self.assertEqual(session.database.get_last_import_id(), 1)
+            session.close()
+        self.assertNotEqual(sessions[0].student_list, sessions[1].student_list)
+
+    def test_shared_session_in_threads(self):
+        session = self._create_sessions(1)[0]
+        session.import_bbs_verwaltung_csv_file(self.import_files[0])
+        session.store_students_db(self.import_files[0])
+        # the connection is opened in the main thread and used by all threads
+        with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+            counts = list(executor.map(lambda _: len(session.search_student_in_database('e')), range(20)))
+        self.assertEqual(len(set(counts)), 1)
+        session.close()
+
+    def test_sessions_in_processes(self):
+        sessions = self._create_sessions(2)
+        with concurrent.futures.ProcessPoolExecutor(max_workers=2) as executor:
+            counts = list(executor.map(_import_and_count, sessions, self.import_files))
+        # the database files were written by the other processes
+        for session, count in zip(sessions, counts):
+            self.assertEqual(len(session.generate_changeset(old_import_id=0).students_added), count)
+            session.close()
+        # copies of a session get the student list, but open their own connection
+        session = sessions[0]
+        session.import_bbs_verwaltung_csv_file(self.import_files[0])
+        copy = pickle.loads(pickle.dumps(session))
+        self.assertEqual(len(copy.student_list), len(session.student_list))
+        self.assertIsNone(copy._database)
+        session.clear_database()
+        self.assertFalse(os.path.exists(session.database_file))
+
+    def test_export_changed_user_images(self):
+        session = self._create_sessions(1)[0]
+        for import_file in self.import_files:
+            session.import_bbs_verwaltung_csv_file(import_file)
+            session.store_students_db(import_file)
+        image_archive = os.path.join(self.directory, 'photos.zip')
+        with zipfile.ZipFile(image_archive, 'w') as image_zip:
+            for student in session.student_list:
+                image_zip.writestr('{}.jpg'.format(student.guid), bytes(100))
+        output_file = os.path.join(self.directory, 'moodle.zip')
+        with warnings.catch_warnings():
+            # duplicate entries in the archive are reported as warnings by zipfile
+            warnings.simplefilter('error')
+            all_students = sum(session.export_user_images(image_archive, output_file))
+            changes = session.generate_changeset(old_import_id=-1)
+            changed_students = sum(session.export_user_images(image_archive, output_file, changes_only=True))
+        self.assertEqual(changed_students, len(changes.students_added) + len(changes.students_changed))
+        self.assertLess(changed_students, all_students)
+        with zipfile.ZipFile(output_file) as output_zip:
+            self.assertEqual(len(output_zip.namelist()), len(set(output_zip.namelist())))
+        session.close()
+
+    def test_default_session(self):
+        session = bbss.get_default_session()
+        self.assertIs(bbss.get_default_session(), session)
+        self.assertIs(bbss.student_list, session.student_list)
+        with self.assertRaises(AttributeError):
+            bbss.no_such_attribute
+
+
+if __name__ == '__main__':
+    unittest.main()
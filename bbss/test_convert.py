@@ -0,0 +1,82 @@
+
+"""
+bbss - BBS Student Management
+
+Unit tests for converting user lists exported from iServ.
+
+Created on Tue Oct 20 10:41:19 2026
+
+@author: Christian Wichmann
+"""
+
+import os
+import csv
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from bbss import convert
+
+
+class TestConvert(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.input_file = os.path.join(self.directory, 'users.csv')
+        self.output_file = os.path.join(self.directory, 'users.converted.csv')
+        with open(self.input_file, 'w', encoding='utf-8-sig', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(('Account', 'Vorname', 'Nachname', 'Klasse/Information', 'Passwort'))
+            for i in range(25):
+                writer.writerow(('user{}'.format(i), 'Vorname', 'Näme; {}'.format(i), 'IFA21',
+                                 'geheim' if i % 2 else ''))
+            # short row without password and class
+            writer.writerow(('', 'Ohne', 'Account'))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_generate_passwords(self):
+        passwords = convert.generate_passwords(1000, 24)
+        self.assertEqual(len(passwords), 1000)
+        self.assertEqual(len(set(passwords)), 1000)
+        self.assertTrue(all(len(p) == 24 for p in passwords))
+        self.assertEqual(set(''.join(passwords)), set(convert.PASSWORD_ALPHABET))
+        self.assertEqual(convert.generate_passwords(0), [])
+
+    def _convert(self, max_workers):
+        progress = []
+        count = convert.convert_user_list(self.input_file, self.output_file, 'example.com', 12, max_workers,
+                                          lambda position, size: progress.append((position, size)))
+        self.assertEqual(count, 26)
+        self.assertEqual(progress[-1], (os.path.getsize(self.input_file),) * 2)
+        with open(self.output_file, encoding='utf-8', newline='') as f:
+            rows = list(csv.reader(f, delimiter=';'))
+        self.assertEqual(tuple(rows[0]), convert.OUTPUT_HEADER)
+        self.assertEqual(rows[2], ['Näme; 1', 'Vorname', 'IFA21', 'user1', 'user1@example.com', 'geheim',
+                                   'iServ', 'oauth2'])
+        self.assertEqual(len(rows[1][5]), 12)
+        self.assertEqual(rows[-1][:5], ['Account', 'Ohne', '', '', ''])
+        self.assertEqual(len(rows[-1][5]), 12)
+
+    @mock.patch.object(convert, 'CHUNK_SIZE', 10)
+    def test_convert_user_list(self):
+        self._convert(max_workers=1)
+
+    @mock.patch.object(convert, 'CHUNK_SIZE', 10)
+    def test_convert_user_list_parallel(self):
+        self._convert(max_workers=2)
+
+    def test_skip_blank_lines(self):
+        with open(self.input_file, 'w', encoding='utf-8-sig', newline='') as f:
+            f.write('Account,Vorname,Nachname,Klasse/Information,Passwort\r\n\r\n'
+                    'user1,Vorname,Name,IFA21,\r\n\r\n , ,,,\r\nuser2,Vorname,Name,IFA21,geheim\r\n\r\n')
+        self.assertEqual(convert.convert_user_list(self.input_file, self.output_file), 2)
+        with open(self.output_file, encoding='utf-8', newline='') as f:
+            rows = list(csv.reader(f, delimiter=';'))
+        self.assertEqual([row[3] for row in rows[1:]], ['user1', 'user2'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+
+"""
+bbss - BBS Student Management
+
+Unit tests for storing student data in the database.
+
+Created on Mon Oct 19 11:15:08 2026
+
+@author: Christian Wichmann
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from bbss import db
+from bbss import bbs_verwaltung
+
+
+TEST_DATA_DIRECTORY = os.path.join(os.path.dirname(__file__), '..', 'testdata')
+
+
+class TestStudentDatabase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.old_db_filename = db.DB_FILENAME
+        db.DB_FILENAME = os.path.join(self.directory, 'students.db')
+        self.database = db.StudentDatabase()
+
+    def tearDown(self):
+        self.database.close_connection()
+        db.DB_FILENAME = self.old_db_filename
+        shutil.rmtree(self.directory)
+
+    def test_merge_multiple_files_into_single_import(self):
+        import_files = [os.path.join(TEST_DATA_DIRECTORY, f) for f in ('test_data_1.csv', 'test_data_2.csv')]
+        single_lists = [bbs_verwaltung.import_data(f) for f in import_files]
+        student_list = bbs_verwaltung.import_data_from_files(import_files)
+        # students contained in both files are only imported once
+        guids = [s.guid for s in student_list]
+        self.assertEqual(len(guids), len(set(guids)))
+        self.assertEqual(set(guids), set(s.guid for l in single_lists for s in l))
+        self.database.store_students_db(', '.join(import_files), student_list, None)
+        self.assertEqual(self.database.get_last_import_id(), 1)
+        sources = dict(self.database.get_import_sources(1))
+        self.assertEqual(set(sources), set(import_files))
+        self.assertEqual(sum(sources.values()), len(student_list))
+        self.assertEqual(len(self.database.generate_changeset(old_import_id=0).students_added), len(student_list))
+
+    def test_merge_students_without_guid(self):
+        import_files = []
+        for i in range(2):
+            import_files.append(os.path.join(self.directory, 'students{}.csv'.format(i)))
+            with open(import_files[-1], 'w', encoding='utf-8') as f:
+                # same student without valid GUID in both files
+                f.write('ungültig;;;Meier;Lisa;IFA91;;01.02.2004;;0;0;0;\n')
+                f.write('{{0000000{}-0000-0000-0000-000000000000}};;;Schulz;Paul;IFA91;;03.04.2004;;0;0;0;\n'.format(i))
+        student_list = bbs_verwaltung.import_data_from_files(import_files)
+        self.assertEqual(sorted(s.surname for s in student_list), ['Meier', 'Schulz', 'Schulz'])
+        self.assertTrue(all(s.guid for s in student_list))
+
+    def test_export_watermarks(self):
+        self.assertEqual(self.database.get_export_watermark('moodle'), 0)
+        for i, f in enumerate(('test_data_1.csv', 'test_data_2.csv'), 1):
+            import_file = os.path.join(TEST_DATA_DIRECTORY, f)
+            self.database.store_students_db(import_file, bbs_verwaltung.import_data(import_file), None)
+            self.database.set_export_watermarks(['moodle', 'iserv'], i)
+        self.assertEqual(self.database.get_export_watermark('moodle'), 2)
+        self.assertEqual(self.database.get_export_watermark('iserv'), 2)
+        self.assertEqual(self.database.get_export_watermark('webuntis'), 0)
+        # watermarks are kept when the database is opened again
+        self.database.close_connection()
+        self.database = db.StudentDatabase()
+        self.assertEqual(self.database.get_export_watermark('moodle'), 2)
+
+    def test_iterate_search_results(self):
+        import_file = os.path.join(TEST_DATA_DIRECTORY, 'test_data_1.csv')
+        self.database.store_students_db(import_file, bbs_verwaltung.import_data(import_file), None)
+        results = self.database.iter_search_results('e', batch_size=2)
+        first = next(results)
+        # other queries can be executed while the results are read
+        self.assertEqual(self.database.get_last_import_id(), 1)
+        students = [first] + list(results)
+        self.assertTrue(students)
+        self.assertEqual([s.guid for s in students], [s.guid for s in self.database.search_for_student('e')])
+
+
+if __name__ == '__main__':
+    unittest.main()
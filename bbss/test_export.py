@@ -0,0 +1,195 @@
+
+"""
+bbss - BBS Student Management
+
+Unit tests for the export engine writing multiple formats in a single pass.
+
+Created on Mon Oct 19 15:02:37 2026
+
+@author: Christian Wichmann
+"""
+
+import io
+import os
+import json
+import shutil
+import tempfile
+import unittest
+import unittest.mock
+
+from bbss import data
+from bbss import export
+from bbss import moodle
+from bbss import iserv
+from bbss import labsoft
+from bbss import jsonl
+
+
+def _create_change_set():
+    change_set = data.ChangeSet()
+    for i, classname in enumerate(('KFZ81', 'IFA91', 'KZM22', 'BGT11A') * 5):
+        student = data.Student('Müller', 'Anna{}'.format(chr(ord('a') + i)), classname, '2001-01-01')
+        student.guid = '{:032x}'.format(i * 7919)
+        student.courses = 'En1,De2' if i % 4 == 0 else ''
+        if i < 12:
+            change_set.students_added.append(student)
+        elif i < 16:
+            change_set.students_changed.append(student)
+        else:
+            change_set.students_removed.append(student)
+    return change_set
+
+
+def _insert(filename, infix):
+    return export._insert_into_filename(filename, infix)
+
+
+class TestExport(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.change_set = _create_change_set()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _read(self, filename):
+        with open(os.path.join(self.directory, filename), encoding='cp1252' if 'labsoft' in filename else 'utf8') as f:
+            return f.read()
+
+    def test_single_pass_equals_separate_exports(self):
+        output_file = os.path.join(self.directory, 'export.csv')
+        export.export_data(output_file, self.change_set, ['moodle', 'iserv', 'labsoft'])
+        moodle.export_data(os.path.join(self.directory, 'moodle.csv'), self.change_set)
+        iserv.export_data(os.path.join(self.directory, 'iserv.csv'), self.change_set)
+        labsoft.export_data(os.path.join(self.directory, 'labsoft.csv'), self.change_set)
+        for single_file, combined_file in (('moodle.added.csv', 'export.moodle.added.csv'),
+                                           ('moodle.removed.csv', 'export.moodle.removed.csv'),
+                                           ('moodle.cohorts.csv', 'export.moodle.cohorts.csv'),
+                                           ('iserv.csv', 'export.iserv.csv'),
+                                           ('iserv.comparison.csv', 'export.iserv.comparison.csv'),
+                                           ('labsoft.csv', 'export.labsoft.csv')):
+            self.assertEqual(self._read(single_file), self._read(combined_file))
+        # removed students are written into separate file for Moodle
+        self.assertEqual(len(self._read('moodle.removed.csv').splitlines()), 5)
+        self.assertEqual(len(self._read('moodle.added.csv').splitlines()), 17)
+
+    def test_records_are_sorted_once(self):
+        records = list(export.iter_records(self.change_set))
+        self.assertEqual(len(records), 20)
+        self.assertEqual([r.change for r in records[-4:]], [export.REMOVED] * 4)
+        added_and_changed = [r.student for r in records[:16]]
+        self.assertEqual(added_and_changed, sorted(added_and_changed))
+
+    def test_parallel_export_equals_single_pass(self):
+        formats = ['moodle', 'iserv', 'labsoft', 'radius', 'logodidact']
+        export.export_data(os.path.join(self.directory, 'single.csv'), self.change_set, formats)
+        for use_processes in (False, True):
+            output_file = os.path.join(self.directory, 'parallel{}.csv'.format(int(use_processes)))
+            timings = export.export_data_parallel(output_file, self.change_set, formats,
+                                                  max_workers=2, use_processes=use_processes)
+            self.assertEqual(set(timings), set(formats))
+            for filename in os.listdir(self.directory):
+                if filename.startswith('single.'):
+                    parallel_filename = filename.replace('single.', 'parallel{}.'.format(int(use_processes)))
+                    self.assertEqual(self._read(filename), self._read(parallel_filename))
+
+    def test_no_partial_files_on_error(self):
+        class FailingWriter(export.Writer):
+            def write(self, record):
+                raise RuntimeError('Writing failed.')
+        output_file = os.path.join(self.directory, 'export.csv')
+        with self.assertRaises(RuntimeError):
+            export.export_changeset(self.change_set, [moodle.MoodleWriter(output_file), FailingWriter(output_file)])
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_no_files_if_finishing_fails(self):
+        class FailingWriter(export.Writer):
+            def write(self, record):
+                pass
+
+            def finish(self):
+                self._open_file(self.output_file).write('incomplete')
+                raise RuntimeError('Writing failed.')
+        output_file = os.path.join(self.directory, 'export.csv')
+        writers = [moodle.MoodleWriter(_insert(output_file, 'moodle')), FailingWriter(output_file),
+                   iserv.IServWriter(_insert(output_file, 'iserv'))]
+        with self.assertRaises(RuntimeError):
+            export.export_changeset(self.change_set, writers)
+        # files are only committed after all writers were finished
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_no_temporary_files_if_commit_fails(self):
+        class FailingWriter(export.Writer):
+            def write(self, record):
+                pass
+
+            def close(self):
+                raise OSError('Renaming failed.')
+        output_file = os.path.join(self.directory, 'export.csv')
+        writers = [moodle.MoodleWriter(_insert(output_file, 'moodle')), FailingWriter(output_file),
+                   iserv.IServWriter(_insert(output_file, 'iserv'))]
+        with self.assertRaises(OSError):
+            export.export_changeset(self.change_set, writers)
+        self.assertFalse([f for f in os.listdir(self.directory) if f.endswith('.tmp')])
+        self.assertFalse([f for f in os.listdir(self.directory) if 'iserv' in f])
+        # files of the first writer were already committed
+        self.assertEqual(sorted(os.listdir(self.directory)),
+                         ['export.moodle.added.csv', 'export.moodle.cohorts.csv', 'export.moodle.log.csv',
+                          'export.moodle.removed.csv'])
+
+    def test_files_are_prepared_before_commit(self):
+        calls = []
+
+        class PreparingWriter(export.Writer):
+            def write(self, record):
+                pass
+
+            def finish(self):
+                self._open_file(self.output_file).write('complete')
+
+            def prepare(self):
+                super().prepare()
+                # content is on disk under the temporary name
+                calls.append(('prepare', all(f.closed for f in self._files)))
+
+            def close(self):
+                calls.append(('close', os.path.exists(self.output_file)))
+                super().close()
+
+        output_file = os.path.join(self.directory, 'export.csv')
+        writers = [PreparingWriter(_insert(output_file, str(i))) for i in range(2)]
+        export.export_changeset(self.change_set, writers)
+        self.assertEqual(calls, [('prepare', True), ('prepare', True), ('close', False), ('close', False)])
+        self.assertEqual(sorted(os.listdir(self.directory)), ['export.0.csv', 'export.1.csv'])
+
+    def test_jsonl_event_stream(self):
+        self.change_set.classes_added = ['KFZ81', 'BGT11A']
+        self.change_set.classes_removed = ['OLD01']
+        with unittest.mock.patch('sys.stdout', new_callable=io.StringIO) as stdout:
+            jsonl.export_data(export.STDOUT, self.change_set)
+        events = [json.loads(line) for line in stdout.getvalue().splitlines()]
+        self.assertEqual([e['seq'] for e in events], list(range(1, len(events) + 1)))
+        self.assertEqual([(e['entity'], e['change']) for e in events[:3]],
+                         [('class', 'added'), ('class', 'added'), ('class', 'removed')])
+        student_events = [e for e in events if e['entity'] == 'student']
+        self.assertEqual(len(student_events), 20)
+        # all student events have the same keys, passwords only for added students
+        self.assertEqual(len(set(tuple(e['data']) for e in student_events)), 1)
+        self.assertTrue(all((e['data']['password'] is None) == (e['change'] != export.ADDED) for e in student_events))
+        self.assertEqual(events[-1], {'schema': jsonl.SCHEMA_VERSION, 'seq': len(events), 'entity': 'changeset',
+                                      'change': 'complete', 'data': {'classes': 3, 'students': 20}})
+
+    def test_writers_have_to_write_records(self):
+        class IncompleteWriter(export.Writer):
+            pass
+        with self.assertRaises(TypeError):
+            IncompleteWriter(os.path.join(self.directory, 'export.csv'))
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            export.get_writer('unknown')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+
+"""
+bbss - BBS Student Management
+
+Unit tests for reading compressed and archived import files.
+
+Created on Mon Oct 19 10:02:45 2026
+
+@author: Christian Wichmann
+"""
+
+import os
+import bz2
+import gzip
+import lzma
+import shutil
+import zipfile
+import tempfile
+import unittest
+
+from bbss import fileio
+from bbss import bbs_verwaltung
+
+
+TEST_DATA = os.path.join(os.path.dirname(__file__), '..', 'testdata', 'test_data_1.csv')
+
+
+class TestFileIO(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        with open(TEST_DATA, 'rb') as f:
+            self.content = f.read()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _compress(self, filename, open_function):
+        path = os.path.join(self.directory, filename)
+        with open_function(path, 'wb') as f:
+            f.write(self.content)
+        return path
+
+    def _students(self, import_file):
+        return [(s.guid, s.surname, s.firstname, s.classname, s.birthday)
+                for s in bbs_verwaltung.import_data(import_file)]
+
+    def test_import_compressed_files(self):
+        expected = self._students(TEST_DATA)
+        self.assertTrue(expected)
+        for filename, open_function in (('students.csv.gz', gzip.open),
+                                        ('students.csv.bz2', bz2.open),
+                                        ('students.csv.xz', lzma.open)):
+            path = self._compress(filename, open_function)
+            self.assertEqual(self._students(path), expected)
+
+    def test_import_zip_archive(self):
+        path = os.path.join(self.directory, 'students.zip')
+        with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr('export/students.csv', self.content)
+        self.assertEqual(self._students(path), self._students(TEST_DATA))
+
+    def test_zip_archive_with_multiple_files(self):
+        path = os.path.join(self.directory, 'students.zip')
+        with zipfile.ZipFile(path, 'w') as archive:
+            archive.writestr('first.csv', self.content)
+            archive.writestr('second.csv', self.content)
+        with self.assertRaises(ValueError):
+            bbs_verwaltung.import_data(path)
+
+    def test_strip_compression_extension(self):
+        self.assertEqual(fileio.strip_compression_extension('students.csv.gz'), 'students.csv')
+        self.assertEqual(fileio.strip_compression_extension('students.csv'), 'students.csv')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,163 @@
+
+"""
+bbss - BBS Student Management
+
+Unit tests for building archives with photos of students.
+
+Created on Mon Oct 19 20:58:14 2026
+
+@author: Christian Wichmann
+"""
+
+import io
+import os
+import uuid
+import shutil
+import zipfile
+import tempfile
+import warnings
+import unittest
+from unittest import mock
+
+from bbss import data
+from bbss import config
+from bbss import images
+
+
+class TestImages(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.source_archive = os.path.join(self.directory, 'photos.zip')
+        self.target_archive = os.path.join(self.directory, 'moodle.zip')
+        self.students = []
+        with zipfile.ZipFile(self.source_archive, 'w') as source_zip:
+            for i, classname in enumerate(('IFA21', 'IFA21', 'KFZ81', 'KFZ81')):
+                student = data.Student(chr(65 + i) + 'name', 'Vorname', classname, '2000-01-01')
+                student.guid = uuid.uuid4()
+                student.generate_user_id()
+                self.students.append(student)
+                # stored and deflated entries, names in upper and lower case
+                compression = zipfile.ZIP_STORED if i % 2 else zipfile.ZIP_DEFLATED
+                name = 'fotos/{}.{}'.format(student.guid, 'JPG' if i == 3 else 'jpg')
+                source_zip.writestr(name, os.urandom(1000) + bytes(1000), compress_type=compression)
+        self.students.append(data.Student('Ohne', 'Foto', 'IFA21', '2000-01-01'))
+        self.students[-1].guid = uuid.uuid4()
+        self.students[-1].generate_user_id()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_collect_images(self):
+        result = images.collect_images(self.source_archive, self.target_archive,
+                                       images.select_students(self.students, ['IFA21', 'KFZ81']))
+        self.assertEqual(result, (4, 0, 1))
+        with zipfile.ZipFile(self.source_archive) as source_zip, zipfile.ZipFile(self.target_archive) as target_zip:
+            self.assertIsNone(target_zip.testzip())
+            index = images.build_index(source_zip)
+            for student in self.students[:4]:
+                info = target_zip.getinfo(student.user_id.lower() + '.jpeg')
+                self.assertEqual(info.compress_type, zipfile.ZIP_STORED)
+                self.assertEqual(target_zip.read(info), source_zip.read(index[str(student.guid)]))
+
+    def test_skip_duplicate_user_names(self):
+        duplicate = data.Student(self.students[0].surname, self.students[0].firstname, 'IFA21', '2001-01-01')
+        duplicate.guid = self.students[1].guid
+        duplicate.user_id = self.students[0].user_id
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            result = images.collect_images(self.source_archive, self.target_archive, self.students[:2] + [duplicate])
+        self.assertEqual(result, (2, 0, 1))
+        with zipfile.ZipFile(self.target_archive) as target_zip:
+            self.assertEqual(len(target_zip.namelist()), 2)
+
+    def test_skip_unchanged_images(self):
+        manifest_file = os.path.join(self.directory, 'moodle.json')
+        ifa21 = images.select_students(self.students, ['IFA21'])
+        self.assertEqual(images.collect_images(self.source_archive, self.target_archive, ifa21, manifest_file),
+                         (2, 0, 1))
+        result = images.collect_images(self.source_archive, self.target_archive, self.students, manifest_file)
+        self.assertEqual(result, (2, 2, 1))
+        with zipfile.ZipFile(self.target_archive) as target_zip:
+            self.assertEqual(sorted(target_zip.namelist()),
+                             sorted(s.user_id.lower() + '.jpeg' for s in self.students[2:4]))
+
+
+def _create_photo(width, height, orientation=1):
+    """Returns a JPEG file whose left half is white and right half is black."""
+    image = images.Image.new('RGB', (width, height))
+    image.paste((255, 255, 255), (0, 0, width // 2, height))
+    exif = images.Image.Exif()
+    exif[0x0112] = orientation
+    output = io.BytesIO()
+    image.save(output, format='JPEG', exif=exif)
+    return output.getvalue()
+
+
+@unittest.skipIf(images.Image is None, 'Package Pillow not available.')
+class TestAvatars(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache_directory = os.path.join(self.directory, 'avatars')
+        self.source_archive = os.path.join(self.directory, 'photos.zip')
+        self.target_archive = os.path.join(self.directory, 'moodle.zip')
+        self.students = []
+        with zipfile.ZipFile(self.source_archive, 'w') as source_zip:
+            for i in range(4):
+                student = data.Student(chr(65 + i) + 'name', 'Vorname', 'IFA21', '2000-01-01')
+                student.guid = uuid.uuid4()
+                student.generate_user_id()
+                self.students.append(student)
+                # last photo is broken
+                photo = _create_photo(400 + i, 300, orientation=6) if i < 3 else b'no photo'
+                source_zip.writestr('{}.jpg'.format(student.guid), photo)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_normalize_image(self):
+        with images.Image.open(io.BytesIO(images.normalize_image(_create_photo(400, 300, 6), 64))) as avatar:
+            self.assertEqual(avatar.size, (64, 64))
+            self.assertNotIn(0x0112, avatar.getexif())
+            # left half of the photo is at the top after rotating it
+            self.assertGreater(avatar.getpixel((32, 4))[0], 200)
+            self.assertLess(avatar.getpixel((32, 60))[0], 50)
+
+    def test_collect_avatars(self):
+        manifest_file = os.path.join(self.directory, 'moodle.json')
+        result = images.collect_images(self.source_archive, self.target_archive, self.students, manifest_file,
+                                       avatar_size=32, cache_directory=self.cache_directory)
+        self.assertEqual(result, (3, 0, 1))
+        with zipfile.ZipFile(self.target_archive) as target_zip:
+            self.assertEqual(len(target_zip.namelist()), 3)
+            with images.Image.open(target_zip.open(self.students[0].user_id.lower() + '.jpeg')) as avatar:
+                self.assertEqual(avatar.size, (32, 32))
+        # without manifest all photos are included again, but taken from the cache
+        cache_files = sorted(os.listdir(self.cache_directory))
+        self.assertEqual(len(cache_files), 3)
+        with open(os.path.join(self.cache_directory, cache_files[0]), 'wb') as f:
+            f.write(b'cached')
+        result = images.collect_images(self.source_archive, self.target_archive, self.students, manifest_file,
+                                       avatar_size=32, max_workers=1, cache_directory=self.cache_directory)
+        self.assertEqual(result, (0, 3, 1))
+        result = images.collect_images(self.source_archive, self.target_archive, self.students,
+                                       avatar_size=32, max_workers=1, cache_directory=self.cache_directory)
+        self.assertEqual(result, (3, 0, 1))
+        with zipfile.ZipFile(self.target_archive) as target_zip:
+            self.assertEqual(sorted(target_zip.read(name) == b'cached' for name in target_zip.namelist()),
+                             [False, False, True])
+
+    def test_private_avatar_cache(self):
+        with mock.patch.object(config, 'CACHE_DIRECTORY', os.path.join(self.directory, 'cache')):
+            result = images.collect_images(self.source_archive, self.target_archive, self.students,
+                                           avatar_size=32, max_workers=1)
+        self.assertEqual(result, (3, 0, 1))
+        cache_directory = os.path.join(self.directory, 'cache', images.AVATAR_CACHE_DIRECTORY)
+        self.assertEqual(len(os.listdir(cache_directory)), 3)
+        if os.name == 'posix':
+            self.assertEqual(os.stat(cache_directory).st_mode & 0o777, 0o700)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+
+"""
+bbss - BBS Student Management
+
+Unit tests for synchronizing accounts with a directory service.
+
+Created on Mon Oct 19 18:20:13 2026
+
+@author: Christian Wichmann
+"""
+
+import unittest
+
+from bbss import ad
+from bbss import data
+from bbss import ldap_sync
+
+
+BIND_USER = 'cn=admin,DC=SN,DC=BBSBS,DC=LOCAL'
+
+
+def _create_change_set():
+    change_set = data.ChangeSet()
+    change_set.students_added.append(data.Student('Schmidt', 'Ben', 'IFA21', '2001-01-01'))
+    moved = data.Student('Meyer', 'Dana', 'IFA22', '2000-01-01')
+    moved.user_id = 'IFA21.MEYEDANA'
+    renamed = data.Student('Schulze', 'Frieda', 'IFA21', '2000-01-01')
+    renamed.user_id = 'IFA21.SCHUFRIE'
+    change_set.students_changed.extend([moved, renamed])
+    change_set.students_removed.append(data.Student('Klein', 'Emil', 'ELH99', '1999-01-01'))
+    change_set.classes_removed = ['ELH99']
+    return change_set
+
+
+def _create_index():
+    index = ldap_sync.DirectoryIndex()
+    ifa21 = data.Student('', '', 'IFA21', '').generate_ou()
+    for ou in ldap_sync.ldif.parent_units(ifa21) + [data.Student('', '', 'ELH99', '').generate_ou()]:
+        index.add_unit(ou)
+    index.add_account('ifa21.meyedana', 'uid=ifa21.meyedana,' + ifa21,
+                      {'displayName': 'Dana Meyer', 'givenName': 'Dana', 'sn': 'Meyer'})
+    index.add_account('ifa21.schufrie', 'uid=ifa21.schufrie,' + ifa21,
+                      {'displayName': 'Frieda Schulz', 'givenName': 'Frieda', 'sn': 'Schulz'})
+    index.add_account('elh99.kleiemil', 'uid=elh99.kleiemil,' + data.Student('', '', 'ELH99', '').generate_ou())
+    return index
+
+
+class TestPlan(unittest.TestCase):
+
+    def test_minimal_plan(self):
+        plan = ldap_sync.plan_changes(_create_change_set(), _create_index())
+        kinds = [operation.kind for operation in plan]
+        self.assertEqual(kinds, ['add_unit', 'add', 'move', 'modify', 'delete', 'delete_unit'])
+        self.assertEqual(plan[0].dn, data.Student('', '', 'IFA22', '').generate_ou())
+        self.assertTrue(plan[2].new_dn.startswith('uid=ifa21.meyedana,ou=IFA22,'))
+        self.assertEqual(plan[3].attributes, {'displayName': 'Frieda Schulze', 'sn': 'Schulze'})
+        self.assertEqual(plan[5].dn, data.Student('', '', 'ELH99', '').generate_ou())
+
+    def test_plan_is_empty_for_synchronized_directory(self):
+        index = _create_index()
+        change_set = _create_change_set()
+        change_set.students_added = []
+        change_set.students_changed = change_set.students_changed[1:]
+        change_set.students_changed[0].surname = 'Schulz'
+        change_set.students_removed = []
+        change_set.classes_removed = []
+        self.assertEqual(ldap_sync.plan_changes(change_set, index), [])
+        # accounts of unknown students are only removed when requested
+        plan = ldap_sync.plan_changes(change_set, index, remove_unknown=True)
+        self.assertEqual(sorted(operation.dn.split(',')[0] for operation in plan),
+                         ['uid=elh99.kleiemil', 'uid=ifa21.meyedana'])
+
+
+@unittest.skipIf(ldap_sync.ldap3 is None, 'Package ldap3 not available.')
+class TestSync(unittest.TestCase):
+
+    def _connect(self, strategy):
+        connection = ldap_sync.ldap3.Connection(ldap_sync.ldap3.Server('mock'), BIND_USER, 'secret',
+                                                client_strategy=strategy)
+        connection.strategy.add_entry(BIND_USER, {'userPassword': 'secret'})
+        for dn in reversed(ldap_sync.ldif.parent_units(data.Student('', '', 'IFA21', '').generate_ou())):
+            connection.strategy.add_entry(dn, {'objectClass': ['top', 'organizationalUnit'],
+                                               'ou': dn.split(',')[0][3:]})
+        connection.strategy.add_entry(ad.USER_BASE, {'objectClass': ['top', 'organizationalUnit']})
+        for username, surname in (('ifa21.meyedana', 'Meyer'), ('ifa21.schufrie', 'Schulz')):
+            dn = 'uid={},{}'.format(username, data.Student('', '', 'IFA21', '').generate_ou())
+            connection.strategy.add_entry(dn, {'objectClass': ['top', 'person', 'inetOrgPerson'],
+                                               'uid': username, 'sn': surname})
+        connection.bind()
+        return connection
+
+    def _sync(self, strategy):
+        connection = self._connect(strategy)
+        plan, result = ldap_sync.sync_directory(connection, _create_change_set(), batch_size=2)
+        self.assertFalse(result.errors)
+        self.assertEqual(result.counts['add'], 1)
+        self.assertEqual(result.counts['move'], 1)
+        # second sync finds nothing to do except the deleted class
+        index = ldap_sync.read_directory(connection, page_size=2)
+        self.assertEqual(len(index), 3)
+        change_set = _create_change_set()
+        change_set.students_removed = []
+        self.assertEqual(ldap_sync.plan_changes(change_set, index), [])
+
+    def test_sync(self):
+        self._sync(ldap_sync.ldap3.MOCK_SYNC)
+
+    def test_sync_async(self):
+        self._sync(ldap_sync.ldap3.MOCK_ASYNC)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+
+"""
+bbss - BBS Student Management
+
+Unit tests for exporting change sets as LDIF file.
+
+Created on Mon Oct 19 17:40:26 2026
+
+@author: Christian Wichmann
+"""
+
+import os
+import base64
+import shutil
+import tempfile
+import unittest
+
+from bbss import ad
+from bbss import data
+from bbss import ldif
+from bbss import export
+
+
+def _parse_ldif(text):
+    """Parses an LDIF file into a list of entries, each a list of (attribute, value) tuples."""
+    entries = []
+    for block in text.replace('\n ', '').split('\n\n'):
+        entry = []
+        for line in block.splitlines():
+            name, value = line.split(':', 1)
+            if value.startswith(':'):
+                value = base64.b64decode(value[1:].strip())
+                value = value.decode('utf-16-le' if name == 'unicodePwd' else 'utf8')
+            entry.append((name, value.strip()))
+        if entry:
+            entries.append(entry)
+    return entries
+
+
+class TestLdif(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.output_file = os.path.join(self.directory, 'export.ldif')
+        self.change_set = data.ChangeSet()
+        for surname, firstname, classname in (('Müller', 'Anna', 'IFA21'), ('Schmidt', 'Ben', 'IFA21'),
+                                              ('Weber', 'Carla' * 20, 'KFZ81')):
+            self.change_set.students_added.append(data.Student(surname, firstname, classname, '2001-01-01'))
+        student = data.Student('Meyer', 'Dana', 'IFA22', '2000-01-01')
+        student.old_classname = 'IFA21'
+        # user ids stored in the database are kept when the class changes
+        student.user_id = 'IFA21.MEYEDANA'
+        self.change_set.students_changed.append(student)
+        self.change_set.students_removed.append(data.Student('Klein', 'Emil', 'ELH99', '1999-01-01'))
+        self.change_set.classes_removed = ['ELH99']
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _export(self, flavor):
+        ldif.export_data(self.output_file, self.change_set, flavor)
+        with open(self.output_file, encoding='ascii') as f:
+            text = f.read()
+        self.assertTrue(all(len(line) <= ldif.MAX_LINE_LENGTH for line in text.splitlines()))
+        return _parse_ldif(text)
+
+    def test_dependency_order(self):
+        entries = self._export('openldap')
+        self.assertEqual(entries[0], [('version', '1')])
+        changes = [(dict(e)['changetype'], dict(e)['dn']) for e in entries[1:]]
+        types = [c[0] for c in changes]
+        # units first, then added, moved and removed students, units of removed classes last
+        self.assertEqual(types, sorted(types, key=['add', 'modrdn', 'delete'].index))
+        added_dns = [dn for t, dn in changes if t == 'add']
+        for i, dn in enumerate(added_dns):
+            parent = dn.split(',', 1)[1]
+            if parent != ad.USER_BASE:
+                self.assertIn(parent, added_dns[:i])
+        self.assertEqual(changes[-1], ('delete', data.Student('', '', 'ELH99', '').generate_ou()))
+        moved = [dict(e) for e in entries[1:] if dict(e)['changetype'] == 'modrdn'][0]
+        self.assertTrue(moved['dn'].startswith('uid=ifa21.meyedana,ou=IFA21,'))
+        self.assertEqual(moved['newsuperior'], self.change_set.students_changed[0].generate_ou())
+        # values with non-ASCII characters are encoded, long values folded
+        users = [dict(e) for e in entries if 'inetOrgPerson' in [v for _, v in e]]
+        self.assertEqual([u['sn'] for u in users], ['Müller', 'Schmidt', 'Weber'])
+        self.assertEqual(users[2]['givenName'], 'Carla' * 20)
+
+    def test_active_directory(self):
+        entries = self._export('ad')
+        users = [dict(e) for e in entries if ('objectClass', 'user') in e]
+        self.assertEqual(len(users), 3)
+        student = self.change_set.students_added[0]
+        self.assertEqual(users[0]['unicodePwd'], '"{}"'.format(student.password))
+        self.assertTrue(users[0]['dn'].startswith('CN=ifa21.muelanna,'))
+        # accounts are enabled and can log in with their principal name
+        self.assertEqual(users[0]['userAccountControl'], '512')
+        self.assertEqual(users[0]['userPrincipalName'], 'ifa21.muelanna@{}'.format(ad.DOMAIN))
+
+    def test_export_both_flavors(self):
+        output_file = os.path.join(self.directory, 'export.csv')
+        export.export_data(output_file, self.change_set, ['ldif', 'ldif-ad'])
+        self.assertEqual(sorted(os.listdir(self.directory)), ['export.ldif', 'export.ldif-ad.ldif'])
+        with open(os.path.join(self.directory, 'export.ldif-ad.ldif'), encoding='ascii') as f:
+            self.assertTrue(any(('objectClass', 'user') in e for e in _parse_ldif(f.read())))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+"""
+bbss - BBS Student Management
+
+Unit tests for exporting user account data as PDF files.
+
+Created on Wed Oct 21 09:12:36 2026
+
+@author: Christian Wichmann
+"""
+
+import io
+import os
+import shutil
+import zipfile
+import tempfile
+import unittest
+import unittest.mock
+
+from bbss import pdf
+
+
+def _create_rows(classname, count):
+    return [pdf.StudentRow(classname, 'Müller', 'Anna{:03d}'.format(i), '{}.muelanna{}'.format(classname, i).lower(),
+                           'geheim{}'.format(i)) for i in range(count)]
+
+
+def _page_texts(document):
+    return [page.extract_text() for page in pdf.pypdf.PdfReader(document).pages]
+
+
+@unittest.skipIf(pdf.pypdf is None, 'Package pypdf not available.')
+class TestPdf(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.output_file = os.path.join(self.directory, 'export.pdf')
+        self.cards_per_page = len(pdf.CardGrid(pdf.CARD_WIDTH, pdf.CARD_HEIGHT))
+        # first class needs two pages, second class a single page
+        self.rows = _create_rows('KFZ81', self.cards_per_page + 1) + _create_rows('IFA91', 2)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_continuous_page_numbers(self):
+        self.assertEqual(pdf.create_pdf_doc(self.output_file, self.rows, max_workers=2), self.output_file)
+        texts = _page_texts(self.output_file)
+        self.assertEqual(len(texts), 3)
+        for number, text in enumerate(texts, 1):
+            self.assertIn('Seite {}'.format(number), text)
+        # classes are sorted by name and get a bookmark
+        self.assertIn('IFA91', texts[0])
+        self.assertIn('KFZ81', texts[1])
+        reader = pdf.pypdf.PdfReader(self.output_file)
+        self.assertEqual([(item.title, reader.get_destination_page_number(item)) for item in reader.outline],
+                         [('IFA91', 0), ('KFZ81', 1)])
+
+    def test_zip_archive_without_pypdf(self):
+        with unittest.mock.patch.object(pdf, 'pypdf', None):
+            output_file = pdf.create_pdf_doc(self.output_file, self.rows, max_workers=1)
+        self.assertEqual(output_file, self.output_file + '.zip')
+        self.assertFalse(os.path.exists(self.output_file))
+        with zipfile.ZipFile(output_file) as archive:
+            self.assertEqual(archive.namelist(), ['IFA91.pdf', 'KFZ81.pdf'])
+            # every class starts with the first page
+            for name, pages in (('IFA91.pdf', 1), ('KFZ81.pdf', 2)):
+                texts = _page_texts(io.BytesIO(archive.read(name)))
+                self.assertEqual(len(texts), pages)
+                self.assertIn('Seite 1', texts[0])
+
+    def test_empty_change_set(self):
+        pdf.create_pdf_doc(self.output_file, [])
+        texts = _page_texts(self.output_file)
+        self.assertEqual(len(texts), 1)
+        self.assertIn('Seite 1', texts[0])
+        self.assertNotIn('Benutzername', texts[0])
+
+
+class TestCardGrid(unittest.TestCase):
+
+    def test_cards_fit_on_page(self):
+        grid = pdf.CardGrid(5*pdf.cm, 3*pdf.cm, columns=3)
+        self.assertEqual(len(grid) % 3, 0)
+        for x, y in grid.positions:
+            self.assertGreaterEqual(x, 0)
+            self.assertLessEqual(x + grid.card_width, pdf.PAGE_WIDTH)
+            self.assertGreaterEqual(y, 0)
+            self.assertLessEqual(y + grid.card_height, pdf.PAGE_HEIGHT - pdf.HEADER_HEIGHT)
+        self.assertEqual(grid.count_pages(0), 1)
+        self.assertEqual(grid.count_pages(len(grid)), 1)
+        self.assertEqual(grid.count_pages(len(grid) + 1), 2)
+
+    @unittest.skipIf(pdf.pypdf is None, 'Package pypdf not available.')
+    def test_render_cards(self):
+        grid = pdf.CardGrid(pdf.CARD_WIDTH, pdf.CARD_HEIGHT)
+        rows = _create_rows('KFZ81', 2 * len(grid) + 1)
+        # rows with missing fields are drawn as well
+        rows[-1] = pdf.StudentRow('KFZ81', '', 'Anna', '', None)
+        drawn = []
+
+        def draw_card(canvas, x, y, grid, row):
+            drawn.append((canvas.getPageNumber(), row))
+            pdf._draw_student_card(canvas, x, y, grid, row)
+
+        output = io.BytesIO()
+        pages = pdf.render_cards(output, rows, draw_card, grid, 'Titel', first_page=4)
+        self.assertEqual(pages, 3)
+        self.assertEqual([page for page, _ in drawn], [1] * len(grid) + [2] * len(grid) + [3])
+        texts = _page_texts(output)
+        self.assertEqual(len(texts), 3)
+        self.assertIn('Seite 6', texts[2])
+        self.assertIn('Passwort:', texts[2])
+        self.assertNotIn('None', texts[2])
+
+
+if __name__ == '__main__':
+    unittest.main()
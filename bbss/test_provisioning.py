@@ -0,0 +1,81 @@
+
+"""
+bbss - BBS Student Management
+
+Unit tests for provisioning user accounts concurrently.
+
+Created on Mon Oct 19 19:40:08 2026
+
+@author: Christian Wichmann
+"""
+
+import time
+import threading
+import unittest
+
+from bbss import data
+from bbss import provisioning
+
+
+class TemporaryError(Exception):
+    pass
+
+
+class TestProvisioning(unittest.TestCase):
+
+    def test_retries(self):
+        calls = []
+
+        def flaky():
+            calls.append(1)
+            if len(calls) < 3:
+                raise TemporaryError()
+            return 'ok'
+        delays = []
+        result = provisioning.call_with_retries(flaky, is_retryable=lambda e: isinstance(e, TemporaryError),
+                                                base_delay=1, sleep=delays.append)
+        self.assertEqual(result, 'ok')
+        self.assertEqual(len(delays), 2)
+        self.assertTrue(0.5 <= delays[0] <= 1.5 and 1 <= delays[1] <= 3)
+        # other errors are raised immediately
+        with self.assertRaises(ValueError):
+            provisioning.call_with_retries(int, 'x', is_retryable=lambda e: isinstance(e, TemporaryError))
+
+    def test_rate_limiter(self):
+        limiter = provisioning.RateLimiter(rate=50, burst=5)
+        start = time.monotonic()
+        for _ in range(15):
+            limiter.acquire()
+        # five requests at once, ten more at 50 requests per second
+        self.assertGreaterEqual(time.monotonic() - start, 0.18)
+
+    def test_errors_only_stop_single_student(self):
+        students = [data.Student(chr(65 + i) + 'name', 'Vorname', 'IFA21', '2000-01-01') for i in range(20)]
+        active = []
+        lock = threading.Lock()
+        max_active = [0]
+
+        def create(student, values):
+            with lock:
+                active.append(student)
+                max_active[0] = max(max_active[0], len(active))
+            time.sleep(0.01)
+            with lock:
+                active.remove(student)
+            if student.surname == 'Hname':
+                raise ValueError('user exists')
+            values['userid'] = student.surname
+
+        def set_password(student, values):
+            values['password'] = True
+        summary = provisioning.provision(students, [('user', create), ('password', set_password)], max_workers=4)
+        self.assertEqual(len(summary.succeeded), 19)
+        self.assertLessEqual(max_active[0], 4)
+        failed = summary.failed[0]
+        self.assertEqual((failed.student.surname, failed.failed_step, failed.completed_steps), ('Hname', 'user', []))
+        self.assertEqual(summary.results[0].completed_steps, ['user', 'password'])
+        self.assertIn('Hname', summary.report())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+
+"""
+bbss - BBS Student Management
+
+Unit tests for searching students in the database.
+
+Created on Tue Oct 20 14:02:51 2026
+
+@author: Christian Wichmann
+"""
+
+import os
+import re
+import fnmatch
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from bbss import db
+from bbss import data
+from bbss import search
+from bbss import bbs_verwaltung
+
+
+TEST_DATA_DIRECTORY = os.path.join(os.path.dirname(__file__), '..', 'testdata')
+
+
+class TestStudentSearch(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.old_db_filename = db.DB_FILENAME
+        db.DB_FILENAME = os.path.join(self.directory, 'students.db')
+        self.database = db.StudentDatabase()
+        import_file = os.path.join(TEST_DATA_DIRECTORY, 'test_data_1.csv')
+        self.database.store_students_db(import_file, bbs_verwaltung.import_data(import_file), None)
+        self.student_search = search.StudentSearch()
+
+    def tearDown(self):
+        self.student_search.reset()
+        self.database.close_connection()
+        db.DB_FILENAME = self.old_db_filename
+        shutil.rmtree(self.directory)
+
+    def _guids(self, students):
+        return sorted(str(s.guid) for s in students)
+
+    def test_refinements_are_filtered_from_cache(self):
+        search_strings = ('Er', 'er', 'mer', 'ERM')
+        expected = [self._guids(self.database.search_for_student(s)) for s in search_strings]
+        self.assertTrue(expected[-1])
+        self.assertFalse(self.student_search.search('E').cached)
+        with mock.patch.object(db.StudentDatabase, 'iter_search_results') as iter_search_results:
+            for search_string, guids in zip(search_strings, expected):
+                result = self.student_search.search(search_string)
+                self.assertTrue(result.cached)
+                self.assertEqual(self._guids(result.students), guids)
+            iter_search_results.assert_not_called()
+        # wildcards are only handled by the database
+        self.assertFalse(self.student_search.search('e_').cached)
+
+    def test_cancel_search(self):
+        self.assertIsNone(self.student_search.search('e', is_cancelled=lambda: True))
+        self.assertFalse(self.student_search.search('e').cached)
+
+    def test_read_only_connection(self):
+        self.student_search.search('e')
+        with self.assertRaises(db.sqlite3.OperationalError):
+            self.student_search._database.conn.execute('DELETE FROM Students;')
+
+
+class TestStudentIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.students = [data.Student(surname, firstname, classname, '2000-01-01')
+                         for surname, firstname, classname in (('Müller', 'Anna', 'IFA21'), ('Meyer', 'Ben', 'IFA22'),
+                                                               ('Schulze', 'Müsli', 'KFZ81'), ('Maier', 'Emil', 'ELH99'),
+                                                               ('Mueller', 'Frieda', 'IFA21'))]
+        self.index = search.StudentIndex(self.students)
+
+    def _brute_force(self, filter_string):
+        pattern = re.compile(fnmatch.translate('*{}*'.format(filter_string.lower())), re.DOTALL)
+        return [i for i, s in enumerate(self.students)
+                if any(pattern.match(f.lower()) for f in (s.surname, s.firstname, s.classname))]
+
+    def test_filter(self):
+        self.assertIsNone(self.index.filter(''))
+        for filter_string in ('m', 'MÜ', 'mül', 'müller', 'ifa2', 'ifa21', 'er', 'ma*r', 'm?er', '*81', 'x', 'ranna'):
+            self.assertEqual(self.index.filter(filter_string), self._brute_force(filter_string), filter_string)
+        # no match across fields
+        self.assertEqual(self.index.filter('r*ann'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
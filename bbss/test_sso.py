@@ -0,0 +1,387 @@
+
+"""
+bbss - BBS Student Management
+
+Unit tests for uploading students to the school server for Single SignOn.
+
+Created on Mon Oct 19 18:52:37 2026
+
+@author: Christian Wichmann
+"""
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+import threading
+import http.server
+from unittest import mock
+from types import SimpleNamespace
+
+try:
+    from bbss import sso
+except ImportError:
+    sso = None
+from bbss import db
+from bbss import data
+from bbss import provisioning
+from bbss import bbss
+
+
+TEST_DATA_DIRECTORY = os.path.join(os.path.dirname(__file__), '..', 'testdata')
+
+class FakeCoreApi(object):
+    """Stands in for the authentik core API and counts all calls."""
+    def __getattr__(self, name):
+        # methods returning HTTP info wrap the plain methods
+        if name.endswith('_with_http_info'):
+            func = getattr(self, name[:-len('_with_http_info')])
+            return lambda **kwargs: SimpleNamespace(data=func(**kwargs), headers={})
+        raise AttributeError(name)
+
+    def __init__(self, group_count=3, page_size=2):
+        self.calls = []
+        self.page_size = page_size
+        self.groups = [SimpleNamespace(pk='g{}'.format(i), name='Group {}'.format(i), users=[]) for i in range(group_count)]
+        self.groups.append(SimpleNamespace(pk='students', name=sso.STUDENT_GROUP, users=[1]))
+        self.users = {}
+        # users already on the server with their groups
+        self.server_users = []
+        self.lock = threading.Lock()
+        # user names answered with an error once (temporary) or always (permanent)
+        self.temporary_errors = set()
+        self.permanent_errors = set()
+        # user and group names created on the server, but answered with an error once (lost response)
+        self.lost_responses = set()
+        self.password_errors = set()
+        # ids of all users whose password was set
+        self.passwords_set = []
+
+    def core_groups_list(self, page=1, page_size=None, include_users=None, name=None, **options):
+        self.calls.append('core_groups_list')
+        if name:
+            groups = [g for g in self.groups if g.name == name]
+            return SimpleNamespace(results=groups, pagination=SimpleNamespace(next=0))
+        start = (page - 1) * self.page_size
+        next_page = page + 1 if start + self.page_size < len(self.groups) else 0
+        return SimpleNamespace(results=self.groups[start:start + self.page_size],
+                               pagination=SimpleNamespace(next=next_page))
+
+    def core_groups_retrieve(self, group_uuid, **options):
+        self.calls.append('core_groups_retrieve')
+        return [g for g in self.groups if g.pk == group_uuid][0]
+
+    def core_groups_partial_update(self, group_uuid, patched_group_request, **options):
+        self.calls.append('core_groups_partial_update')
+        group = [g for g in self.groups if g.pk == group_uuid][0]
+        group.users = patched_group_request['users']
+        return group
+
+    def core_users_create(self, user_request, **options):
+        with self.lock:
+            self.calls.append('core_users_create')
+            username = user_request['username']
+            if username in self.temporary_errors:
+                self.temporary_errors.remove(username)
+                raise sso.ApiException(status=429, reason='Too Many Requests')
+            if username in self.permanent_errors:
+                raise sso.ApiException(status=400, reason='Bad Request')
+            if any(u['username'] == username for u in self.users.values()):
+                raise sso.ApiException(status=400, reason='Bad Request')
+            pk = len(self.users) + 2
+            self.users[pk] = user_request
+            self.server_users.append(SimpleNamespace(pk=pk, is_active=True, groups=[], **user_request))
+            if username in self.lost_responses:
+                self.lost_responses.remove(username)
+                raise sso.ApiException(status=504, reason='Gateway Timeout')
+        return SimpleNamespace(pk=pk, **user_request)
+
+    def core_users_set_password_create(self, id, user_password_set_request, **options):
+        self.calls.append('core_users_set_password_create')
+        self.passwords_set.append(id)
+        if self.users[id]['username'] in self.password_errors:
+            raise sso.ApiException(status=401, reason='Unauthorized')
+
+    def core_users_list(self, page=1, page_size=None, groups_by_name=None, include_groups=None, username=None,
+                        **options):
+        self.calls.append('core_users_list')
+        if username:
+            users = [SimpleNamespace(pk=pk, **u) for pk, u in self.users.items() if u['username'] == username]
+            return SimpleNamespace(results=users, pagination=SimpleNamespace(next=0))
+        # memberships are taken from the groups
+        for user in self.server_users:
+            user.groups = [g.pk for g in self.groups if user.pk in g.users]
+        start = (page - 1) * self.page_size
+        next_page = page + 1 if start + self.page_size < len(self.server_users) else 0
+        return SimpleNamespace(results=self.server_users[start:start + self.page_size],
+                               pagination=SimpleNamespace(next=next_page))
+
+    def core_users_partial_update(self, id, patched_user_request, **options):
+        with self.lock:
+            self.calls.append('core_users_partial_update')
+            user = [u for u in self.server_users if u.pk == id][0]
+            user.__dict__.update(patched_user_request)
+
+    def core_groups_create(self, group_request, **options):
+        self.calls.append('core_groups_create')
+        if any(g.name == group_request['name'] for g in self.groups):
+            raise sso.ApiException(status=400, reason='Bad Request')
+        group = SimpleNamespace(pk='g' + group_request['name'], users=[], **group_request)
+        self.groups.append(group)
+        if group.name in self.lost_responses:
+            self.lost_responses.remove(group.name)
+            raise sso.ApiException(status=504, reason='Gateway Timeout')
+        return group
+
+
+class GroupListHandler(http.server.BaseHTTPRequestHandler):
+    """Answers requests for the list of groups like the authentik API, supporting ETags."""
+    protocol_version = 'HTTP/1.1'
+    ETAG = '"groups-1"'
+
+    def do_GET(self):
+        self.server.requests.append((self.path, self.client_address, self.headers.get('If-None-Match')))
+        if self.headers.get('If-None-Match') == self.ETAG:
+            self.send_response(304)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        group = {'pk': '5e5fa3e6-8e6e-4a3b-9b1e-2b8a4f6d9c10', 'num_pk': 1, 'name': 'Schülerinnen und Schüler',
+                 'parents_obj': [], 'users_obj': [], 'roles_obj': [], 'inherited_roles_obj': [],
+                 'children': [], 'children_obj': [], 'users': [1, 2]}
+        pagination = {'next': 0, 'previous': 0, 'count': 1, 'current': 1, 'total_pages': 1,
+                      'start_index': 1, 'end_index': 1}
+        body = json.dumps({'pagination': pagination, 'results': [group], 'autocomplete': {}}).encode('utf8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', self.ETAG)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@unittest.skipIf(sso is None, 'Package authentik_client not available.')
+class TestHttpClient(unittest.TestCase):
+
+    def setUp(self):
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), GroupListHandler)
+        self.server.requests = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_connection_reuse_and_etag(self):
+        user_management = sso.UserManagement('http://127.0.0.1:{}'.format(self.server.server_port), 'token')
+        user_management._rate_limiter = None
+        for _ in range(3):
+            self.assertEqual(user_management._list_groups()[0].name, sso.STUDENT_GROUP)
+        # cached list is fresh, no request at all
+        self.assertEqual(len(self.server.requests), 1)
+        # stale list is revalidated with its ETag
+        user_management._cache = sso.ResponseCache(ttl=0)
+        for _ in range(3):
+            self.assertEqual(user_management._list_groups()[0].users, [1, 2])
+        self.assertEqual([r[2] for r in self.server.requests], [None, None, GroupListHandler.ETAG,
+                                                                GroupListHandler.ETAG])
+        # all requests are sent over a single connection
+        self.assertEqual(len({r[1] for r in self.server.requests}), 1)
+
+
+@unittest.skipIf(sso is None, 'Package authentik_client not available.')
+class TestUserManagement(unittest.TestCase):
+
+    def setUp(self):
+        self.user_management = sso.UserManagement('localhost', '')
+        self.core_api = FakeCoreApi()
+        self.user_management._core_api = self.core_api
+        self.user_management._rate_limiter = provisioning.RateLimiter(rate=1000)
+        self.students = [data.Student(chr(65 + i) + 'name', 'Vorname', 'IFA21', '2000-01-01') for i in range(30)]
+        for s in self.students:
+            s.generate_user_id()
+
+    def test_groups_are_listed_once(self):
+        self.user_management.import_users(self.students)
+        # two pages of groups and a single update of the group members
+        self.assertEqual(self.core_api.calls.count('core_groups_list'), 2)
+        self.assertEqual(self.core_api.calls.count('core_groups_partial_update'), 1)
+        self.assertEqual(self.core_api.groups[-1].users, list(range(1, 32)))
+
+    def test_keep_members_added_by_others(self):
+        self.user_management.import_users(self.students[:10])
+        # another client adds a member while the list of groups is cached
+        self.core_api.groups[-1].users.append(500)
+        self.user_management.import_users(self.students[10:])
+        self.assertEqual(self.core_api.calls.count('core_groups_list'), 2)
+        self.assertIn(500, self.core_api.groups[-1].users)
+        self.assertEqual(len(self.core_api.groups[-1].users), 32)
+
+    @mock.patch.object(provisioning, 'BASE_DELAY', 0.001)
+    def test_errors_do_not_abort_upload(self):
+        self.core_api.temporary_errors.add(self.students[3].user_id.casefold())
+        self.core_api.permanent_errors.add(self.students[5].user_id.casefold())
+        summary = self.user_management.import_users(self.students)
+        self.assertEqual([r.student for r in summary.failed], [self.students[5]])
+        self.assertEqual(summary.results[3].completed_steps, ['user', 'password', 'group'])
+        self.assertEqual(len(self.core_api.groups[-1].users), 30)
+
+    @mock.patch.object(provisioning, 'BASE_DELAY', 0.001)
+    def test_create_is_not_repeated(self):
+        # the user is created, but the response is lost and the step retried
+        self.core_api.lost_responses.add(self.students[3].user_id.casefold())
+        # the user already exists on the server
+        existing = self.students[5].user_id.casefold()
+        self.core_api.users[100] = {'name': 'Vorname Fname', 'username': existing, 'email': ''}
+        summary = self.user_management.import_users(self.students)
+        self.assertFalse(summary.failed)
+        self.assertEqual(len(self.core_api.users), 30)
+        self.assertEqual(len({u['username'] for u in self.core_api.users.values()}), 30)
+        self.assertEqual(summary.results[5].values['userid'], 100)
+        # the password of the existing user is kept, the other users get their initial password
+        self.assertNotIn(100, self.core_api.passwords_set)
+        self.assertEqual(len(self.core_api.passwords_set), 29)
+        self.assertNotIn('create_attempted', summary.results[3].values)
+
+    def test_resume_upload_with_journal(self):
+        directory = tempfile.mkdtemp()
+        old_db_filename = db.DB_FILENAME
+        db.DB_FILENAME = os.path.join(directory, 'students.db')
+        try:
+            database = db.StudentDatabase()
+            # first upload fails for some students after their user was created
+            failing = {s.user_id.casefold() for s in self.students[10:]}
+            self.core_api.password_errors.update(failing)
+            summary = self.user_management.import_users(self.students, journal=sso.UploadJournal(database))
+            self.assertEqual(len(summary.failed), 20)
+            self.assertEqual(self.core_api.calls.count('core_users_create'), 30)
+            # second upload continues with the password for failed students
+            self.core_api.password_errors.clear()
+            self.core_api.calls.clear()
+            journal = sso.UploadJournal(database)
+            self.assertEqual(set(journal.get(self.students[0])), {'user', 'password', 'group'})
+            self.assertEqual(set(journal.get(self.students[10])), {'user'})
+            summary = self.user_management.import_users(self.students, journal=journal)
+            self.assertFalse(summary.failed)
+            self.assertEqual(self.core_api.calls.count('core_users_create'), 0)
+            self.assertEqual(self.core_api.calls.count('core_users_set_password_create'), 20)
+            self.assertEqual(len(self.core_api.groups[-1].users), 31)
+            journal.clear()
+            self.assertEqual(database.get_sso_journal(), {})
+            database.close_connection()
+        finally:
+            db.DB_FILENAME = old_db_filename
+            shutil.rmtree(directory)
+
+    def test_resume_session_upload(self):
+        directory = tempfile.mkdtemp()
+        session = bbss.BBSSSession(os.path.join(directory, 'students.db'))
+        session._user_management = self.user_management
+        try:
+            # entry of another upload that must be kept
+            session.database.add_sso_journal_entries([('other.user', 'user', '{"pk": 99}')])
+            self.core_api.password_errors.update(s.user_id.casefold() for s in self.students[20:])
+            summary = session.upload_students_to_school_server(self.students)
+            self.assertEqual(len(summary.failed), 10)
+            self.core_api.password_errors.clear()
+            self.core_api.calls.clear()
+            summary = session.upload_students_to_school_server(self.students)
+            self.assertFalse(summary.failed)
+            self.assertEqual(self.core_api.calls.count('core_users_create'), 0)
+            self.assertEqual(self.core_api.calls.count('core_users_set_password_create'), 10)
+            self.assertEqual(list(session.database.get_sso_journal()), ['other.user'])
+        finally:
+            session.close()
+            shutil.rmtree(directory)
+
+    def test_incremental_session_upload(self):
+        directory = tempfile.mkdtemp()
+        session = bbss.BBSSSession(os.path.join(directory, 'students.db'))
+        session._user_management = self.user_management
+        import_files = [os.path.join(TEST_DATA_DIRECTORY, f) for f in ('test_data_1.csv', 'test_data_2.csv')]
+        try:
+            session.import_bbs_verwaltung_csv_file(import_files[0])
+            session.store_students_db(import_files[0])
+            summary = session.upload_students_to_school_server_since_last()
+            self.assertFalse(summary.failed)
+            session.import_bbs_verwaltung_csv_file(import_files[1])
+            session.store_students_db(import_files[1])
+            changes = session.generate_changeset(old_import_id=1, new_import_id=2)
+            self.assertTrue(changes.students_changed)
+            existing_users = {u.pk for u in self.core_api.server_users}
+            self.core_api.passwords_set.clear()
+            summary = session.upload_students_to_school_server_since_last()
+            self.assertFalse(summary.failed)
+            # only new users get their initial password
+            new_users = {u.pk for u in self.core_api.server_users} - existing_users
+            self.assertTrue(new_users)
+            self.assertEqual(set(self.core_api.passwords_set), new_users)
+            # changed students are moved into the group of their new class
+            groups = {g.name: g.users for g in self.core_api.groups}
+            for student in changes.students_changed:
+                user = [u for u in self.core_api.server_users if u.username == student.user_id.casefold()][0]
+                self.assertIn(user.pk, groups[student.classname])
+                self.assertNotIn(user.pk, self.core_api.passwords_set)
+        finally:
+            session.close()
+            shutil.rmtree(directory)
+
+    def _add_server_user(self, pk, student, class_group, **fields):
+        user = SimpleNamespace(pk=pk, username=student.generate_user_id().casefold(), email=student.email, is_active=True,
+                               name=f'{student.firstname} {student.surname}', groups=['students', class_group])
+        user.__dict__.update(fields)
+        self.core_api.server_users.append(user)
+        for g in self.core_api.groups:
+            if g.pk in user.groups:
+                g.users.append(pk)
+
+    def test_reconcile(self):
+        self.core_api.groups.append(SimpleNamespace(pk='gIFA21', name='IFA21', users=[], parents=['students']))
+        self.core_api.groups.append(SimpleNamespace(pk='gIFA20', name='IFA20', users=[], parents=['students']))
+        unchanged, renamed, moved, new = self.students[:4]
+        new.classname = moved.classname = 'IFA22'
+        self._add_server_user(100, unchanged, 'gIFA21')
+        self._add_server_user(101, renamed, 'gIFA21', name='Old Name')
+        self._add_server_user(102, moved, 'gIFA20')
+        self._add_server_user(103, data.Student('Weg', 'Willi', 'IFA20', ''), 'gIFA20')
+        self._add_server_user(104, data.Student('Schon', 'Weg', 'IFA20', ''), 'gIFA20', is_active=False)
+        plan, summary = self.user_management.reconcile([unchanged, renamed, moved, new], dry_run=True)
+        self.assertIsNone(summary)
+        self.assertEqual(plan.new_groups, ['IFA22'])
+        self.assertEqual(plan.creates, [new])
+        self.assertEqual([(pk, changes) for _, pk, changes in plan.updates], [(101, {'name': 'Vorname Bname'})])
+        self.assertEqual(plan.group_changes, {'IFA22': ({102}, set()), 'IFA20': (set(), {102})})
+        self.assertEqual(plan.deactivations, [103])
+        # apply plan
+        self.core_api.calls.clear()
+        plan, summary = self.user_management.reconcile([unchanged, renamed, moved, new])
+        self.assertFalse(summary.failed)
+        self.assertEqual(self.core_api.calls.count('core_users_create'), 1)
+        self.assertEqual(self.core_api.calls.count('core_users_partial_update'), 2)
+        groups = {g.name: set(g.users) for g in self.core_api.groups}
+        self.assertEqual(groups['IFA22'], {102, 2})
+        self.assertEqual(groups['IFA20'], {103, 104})
+        self.assertFalse(self.core_api.server_users[3].is_active)
+
+    @mock.patch.object(provisioning, 'BASE_DELAY', 0.001)
+    def test_reconcile_creates_groups_once(self):
+        self.students[0].classname = 'IFA22'
+        self.students[1].classname = 'IFA23'
+        # the first group is created, but the response is lost and the creation retried
+        self.core_api.lost_responses.add('IFA22')
+        plan, summary = self.user_management.reconcile(self.students[:2])
+        self.assertFalse(summary.failed)
+        self.assertEqual(plan.new_groups, ['IFA22', 'IFA23'])
+        self.assertEqual(self.core_api.calls.count('core_groups_create'), 2)
+        groups = {g.name: set(g.users) for g in self.core_api.groups}
+        self.assertEqual(len([g for g in self.core_api.groups if g.name == 'IFA22']), 1)
+        self.assertEqual(groups['IFA22'], {2})
+        self.assertEqual(groups['IFA23'], {3})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+"""
+bbss - BBS Student Management
+
+Unit tests for the cache of QR codes for the WebUntis app.
+
+Created on Wed Oct 21 10:05:18 2026
+
+@author: Christian Wichmann
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from bbss import config
+try:
+    from bbss import webuntis
+except ImportError:
+    webuntis = None
+
+
+@unittest.skipIf(webuntis is None, 'Packages qrcode and reportlab not available.')
+class TestQrCodeCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        patcher = mock.patch.object(config, 'CACHE_DIRECTORY', os.path.join(self.directory, 'cache'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cache_directory = os.path.join(config.CACHE_DIRECTORY, webuntis.QR_CODE_CACHE_DIRECTORY)
+        self.passwords = {'IFA91': 'geheim1', 'KFZ81': 'geheim2'}
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_private_cache_directory(self):
+        webuntis.create_qr_codes(self.passwords, max_workers=1)
+        self.assertEqual(len(os.listdir(self.cache_directory)), 2)
+        if os.name == 'posix':
+            self.assertEqual(os.stat(self.cache_directory).st_mode & 0o777, 0o700)
+
+    def test_cached_qr_codes_are_reused(self):
+        webuntis.create_qr_codes(self.passwords, max_workers=1)
+        files = {name: os.stat(os.path.join(self.cache_directory, name)).st_mtime_ns
+                 for name in os.listdir(self.cache_directory)}
+        with mock.patch.object(webuntis.qrcode, 'make') as make:
+            webuntis.create_qr_codes(self.passwords, max_workers=1)
+            make.assert_not_called()
+        self.assertEqual({name: os.stat(os.path.join(self.cache_directory, name)).st_mtime_ns
+                          for name in os.listdir(self.cache_directory)}, files)
+
+    def test_remove_unused_qr_codes(self):
+        webuntis.create_qr_codes(self.passwords, max_workers=1)
+        old_files = set(os.listdir(self.cache_directory))
+        # other files in the directory are not touched
+        with open(os.path.join(self.cache_directory, 'notes.txt'), 'w') as f:
+            f.write('keep')
+        self.passwords['KFZ81'] = 'neu'
+        webuntis.create_qr_codes(self.passwords, max_workers=1)
+        files = set(os.listdir(self.cache_directory))
+        self.assertEqual(len(files), 3)
+        self.assertIn('notes.txt', files)
+        # only the image of the old password was removed
+        self.assertEqual(len(old_files & files), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
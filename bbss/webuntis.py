@@ -10,26 +10,27 @@ Created on Fri Jul 21 11:26:47 2017
 """
 
 
-import io
 import os
 import csv
+import hashlib
 import logging
 import datetime
-from itertools import chain
+import functools
+import concurrent.futures
 
 import qrcode
-from reportlab.lib import colors
 from reportlab.lib.units import cm
 from reportlab.lib.pagesizes import A4
-from reportlab.lib.styles import ParagraphStyle
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-from reportlab.platypus.flowables import KeepTogether, Image
+from reportlab.lib.utils import ImageReader
 
+from bbss import pdf
 from bbss import data
 from bbss import config
+from bbss import export
+from bbss import fileio
 
 
-__all__ = ['export_data']
+__all__ = ['export_data', 'WebUntisWriter']
 
 
 logger = logging.getLogger('bbss.webuntis')
@@ -42,88 +43,32 @@ TODAY = datetime.datetime.today().strftime('%d.%m.%Y')
 TITLE = 'Benutzerdaten für WebUntis - Import vom {}'.format(TODAY)
 AUTHOR = 'bbss - BBS Student Management'
 INCLUDE_QR_CODE = False
+# classes that should not be imported into WebUntis
+CLASSES_BLACKLIST = ('BFS0X', 'ZABI0X', 'AAK31')
+# fixed size of the cards with account data of a single class
+CARD_WIDTH = PAGE_WIDTH - 2*BORDER_HORIZONTAL
+CARD_HEIGHT = 7.2*cm
+CARD_PADDING = 20
+QR_CODE_SIZE = 2.5*cm
+QR_CODE_URL = ('untis://setschool?url=asopo.webuntis.com&school=BBS Brinkstr-Osnabrück&user={}&key={}'
+               '&schoolNumber=2042600')
+# size of a single module (dot) of the QR code in pixels, the image is scaled when drawn into the PDF file
+QR_CODE_BOX_SIZE = 4
+# name of the directory below config.CACHE_DIRECTORY for storing generated QR codes, so that they can be reused as
+# long as the password is not changed
+QR_CODE_CACHE_DIRECTORY = 'qr_codes'
 
 
 def export_data(output_file, change_set):
-    # generate import file for importing users for all students
-    _write_student_user_list_file(output_file, change_set)
-    # generate import file for importing students into base data (Stammdaten)
-    _write_student_list_file(output_file, change_set)
+    # generate import files for importing users for all students and for
+    # importing students into base data (Stammdaten)
+    export.export_changeset(change_set, [WebUntisWriter(output_file)])
     #list_of_passwords = _write_class_list_file(output_file, change_set)
     # create a PDF file with every new class including its password
     #output_file += '.pdf'
     #create_pdf_doc(output_file, list_of_passwords)
 
 
-def _write_student_list_file(output_file, change_set):
-    """
-    Write all added and changed students into a CSV file to be imported into
-    Webuntis. Removed students will not be updated in Webuntis, the exit date
-    should be set manually by the teachers.
-    """
-    blacklist = ['BFS0X', 'ZABI0X', 'AAK31']
-    output_file = os.path.splitext(output_file)
-    output_file_students = '{}.students_added{}'.format(*output_file)
-    if os.path.exists(output_file_students):
-        logger.warning('Output file already exists, will be overwritten...')
-    with open(output_file_students, 'w', newline='', encoding='utf8') as csvfile:
-        output_file_writer = csv.writer(csvfile, delimiter=';')
-        output_file_writer.writerow(('Familienname', 'Vorname', 'Geburtsdatum', 'Kurzname', 'Klasse',
-                                     'Fremdbenutzername', 'Eintrittsdatum', 'Austrittsdatum'))
-        for student in sorted(change_set.students_added):
-            if student.classname in blacklist:
-                continue
-            # output student data for change set into file
-            user_id = student.generate_user_id().lower()
-            birthday = datetime.datetime.strptime(student.birthday, '%Y-%m-%d').strftime('%d.%m.%Y')
-            entry = datetime.datetime.strptime(student.entry_date, '%Y-%m-%d').strftime('%d.%m.%Y')
-            # add new student with entry date, so that he/she will not be shown for dates before that!
-            output_file_writer.writerow((student.surname, student.firstname,
-                                         birthday, user_id, student.classname,
-                                         student.guid, entry ,''))
-    # put students that changed classes into separate file because their entry date should not be changed!
-    output_file_students = '{}.students_changed{}'.format(*output_file)
-    if os.path.exists(output_file_students):
-        logger.warning('Output file already exists, will be overwritten...')
-    with open(output_file_students, 'w', newline='', encoding='utf8') as csvfile:
-        output_file_writer = csv.writer(csvfile, delimiter=';')
-        output_file_writer.writerow(('Familienname', 'Vorname', 'Geburtsdatum', 'Benutzername', 'Klasse',
-                                     'Fremdbenutzername',  'Eintrittsdatum', 'Austrittsdatum'))
-        for student in sorted(change_set.students_changed):
-            if student.classname in blacklist:
-                continue
-            # output student data for change set into file
-            user_id = student.generate_user_id().lower()
-            birthday = datetime.datetime.strptime(student.birthday, '%Y-%m-%d').strftime('%d.%m.%Y')
-            entry = datetime.datetime.strptime(student.entry_date, '%Y-%m-%d').strftime('%d.%m.%Y')
-            # add changed student without entry date, because that would overwrite an existing date;
-            # class change will take effect depending on the given date for that when importing the data!
-            output_file_writer.writerow((student.surname, student.firstname,
-                                         birthday, user_id, student.classname,
-                                         student.guid, entry, ''))
-    # only export removed students if config option is set, otherwise ignore them
-    if config.SHOULD_SET_REMOVE_DATE_FROM_WEBUNTIS:
-        output_file_students = '{}.students_removed{}'.format(*output_file)
-        if os.path.exists(output_file_students):
-            logger.warning('Output file already exists, will be overwritten...')
-        with open(output_file_students, 'w', newline='', encoding='utf8') as csvfile:
-            output_file_writer = csv.writer(csvfile, delimiter=';')
-            output_file_writer.writerow(('Familienname', 'Vorname', 'Geburtsdatum', 'Benutzername', 'Klasse',
-                                        'Fremdbenutzername', 'Eintrittsdatum', 'Austrittsdatum'))
-            for student in sorted(change_set.students_removed):
-                if student.classname in blacklist:
-                    continue
-                # output student data for change set into file
-                user_id = student.generate_user_id().lower()
-                birthday = datetime.datetime.strptime(student.birthday, '%Y-%m-%d').strftime('%d.%m.%Y')
-                entry = datetime.datetime.strptime(student.entry_date, '%Y-%m-%d').strftime('%d.%m.%Y')
-                exit = datetime.datetime.strptime(student.exit_date, '%Y-%m-%d').strftime('%d.%m.%Y')
-                # add changed student without entry date, because that would overwrite an existing date;
-                # class change will take effect depending on the given date for that when importing the data!
-                output_file_writer.writerow((student.surname, student.firstname, birthday, user_id,
-                                             student.classname, student.guid, entry, exit))
-
-
 def _write_class_list_file(output_file, change_set):
     """
     Writes a file containing all data to import new classes into WebUntis. For
@@ -153,56 +98,162 @@ def _write_class_list_file(output_file, change_set):
     return list_of_passwords
 
 
-def _write_student_user_list_file(output_file, change_set):
+class WebUntisWriter(export.Writer):
     """
-    Writes a file containing all data to import new student users into WebUntis.
-    Each student will be imported into the base data ("Stammdaten") and gets a
-    user for accessing the schedule. This function ONLY produces the user data!
-
-    :param output_file: file name to write student user list to
-    :param change_set: object representing all changes between given imports
+    Writes files containing all data to import students into WebUntis.
+
+    Each new student will be imported into the base data ("Stammdaten") and
+    gets a user for accessing the schedule. The user data for all new students
+    is written into a separate file. Students that changed classes are put into
+    a separate file because their entry date should not be changed! Removed
+    students are only written, if the option SHOULD_SET_REMOVE_DATE_FROM_WEBUNTIS
+    is set in the config module, otherwise the exit date should be set manually
+    by the teachers.
     """
-    output_file = os.path.splitext(output_file)
-    output_file_students = '{}.student_users{}'.format(*output_file)
-    if os.path.exists(output_file_students):
-        logger.warning('Output file already exists, will be overwritten...')
-    # export file with all student users
-    with open(output_file_students, 'w', newline='', encoding='utf8') as csvfile:
-        count = 0
-        output_file_writer = csv.writer(csvfile, delimiter=';')
-        output_file_writer.writerow(('Benutzername', 'Passwort', 'Benutzergruppe', 'Fremdbenutzername', 'E-Mail Adresse'))
-        # only write user accounts for *new* students
-        for student in sorted(change_set.students_added):
-            output_file_writer.writerow((student.user_id.lower(), student.password, 'Schüler', student.guid, student.email))
-            count += 1
-        logger.debug('{0} students (added) exported to Moodle file format.'.format(count))
-
-
-def create_first_page(canvas, _):
-    canvas.saveState()
+    def __init__(self, output_file, replace_illegal_characters=False):
+        super().__init__(output_file, replace_illegal_characters)
+        self._count_users = 0
+
+    def open(self):
+        self._users_writer = self._open_csv_file(self._get_filename('student_users'),
+                                                 ('Benutzername', 'Passwort', 'Benutzergruppe',
+                                                  'Fremdbenutzername', 'E-Mail Adresse'))
+        self._added_writer = self._open_csv_file(self._get_filename('students_added'),
+                                                 ('Familienname', 'Vorname', 'Geburtsdatum', 'Kurzname', 'Klasse',
+                                                  'Fremdbenutzername', 'Eintrittsdatum', 'Austrittsdatum'))
+        self._changed_writer = self._open_csv_file(self._get_filename('students_changed'),
+                                                   ('Familienname', 'Vorname', 'Geburtsdatum', 'Benutzername',
+                                                    'Klasse', 'Fremdbenutzername', 'Eintrittsdatum',
+                                                    'Austrittsdatum'))
+        # only export removed students if config option is set, otherwise ignore them
+        self._removed_writer = None
+        if config.SHOULD_SET_REMOVE_DATE_FROM_WEBUNTIS:
+            self._removed_writer = self._open_csv_file(self._get_filename('students_removed'),
+                                                       ('Familienname', 'Vorname', 'Geburtsdatum', 'Benutzername',
+                                                        'Klasse', 'Fremdbenutzername', 'Eintrittsdatum',
+                                                        'Austrittsdatum'))
+
+    def write(self, record):
+        student = record.student
+        if record.change == export.ADDED:
+            # only write user accounts for *new* students
+            self._users_writer.writerow((record.username, record.password, 'Schüler', student.guid, student.email))
+            self._count_users += 1
+        if student.classname in CLASSES_BLACKLIST:
+            return
+        birthday = _format_date(student.birthday)
+        entry = _format_date(student.entry_date)
+        if record.change == export.ADDED:
+            # add new student with entry date, so that he/she will not be shown for dates before that!
+            self._added_writer.writerow((student.surname, student.firstname, birthday, record.username,
+                                         student.classname, student.guid, entry, ''))
+        elif record.change == export.CHANGED:
+            # class change will take effect depending on the given date for that when importing the data!
+            self._changed_writer.writerow((student.surname, student.firstname, birthday, record.username,
+                                           student.classname, student.guid, entry, ''))
+        elif self._removed_writer:
+            exit = _format_date(student.exit_date)
+            self._removed_writer.writerow((student.surname, student.firstname, birthday, record.username,
+                                           student.classname, student.guid, entry, exit))
+
+    def close(self):
+        super().close()
+        logger.debug('{0} students (added) exported to WebUntis file format.'.format(self._count_users))
+
+
+def _format_date(date):
+    """Converts a date from the database into the format used by WebUntis."""
+    return datetime.datetime.strptime(date, '%Y-%m-%d').strftime('%d.%m.%Y')
+
+
+def _draw_header(canvas):
     canvas.setFont('Helvetica', 16)
     canvas.drawCentredString(PAGE_WIDTH/2.0, PAGE_HEIGHT-58, TITLE)
-    canvas.setFont('Helvetica', 10)
-    canvas.drawString(BORDER_HORIZONTAL, BORDER_VERTICAL, TITLE)
-    canvas.drawRightString(PAGE_WIDTH-BORDER_HORIZONTAL, BORDER_VERTICAL, "Seite 1")
-    canvas.restoreState()
 
 
-def create_later_pages(canvas, doc):
-    canvas.saveState()
-    canvas.setFont('Helvetica', 10)
-    canvas.drawString(BORDER_HORIZONTAL, BORDER_VERTICAL, TITLE)
-    canvas.drawRightString(PAGE_WIDTH-BORDER_HORIZONTAL, BORDER_VERTICAL, "Seite {}".format(doc.page))
-    canvas.restoreState()
+def _draw_class_card(canvas, x, y, grid, card):
+    class_name, password, qr_code = card
+    canvas.setLineWidth(0.25)
+    canvas.rect(x, y, grid.card_width, grid.card_height)
+    left = x + CARD_PADDING
+    inner_width = grid.card_width - 2*CARD_PADDING
+    top = y + grid.card_height - CARD_PADDING - 10
+    canvas.setFont('Helvetica', 14)
+    canvas.drawString(left, top, 'Benutzerdaten für den Zugriff auf den Stundenplan')
+    pdf.draw_fitted_string(canvas, left, top - 18, 'der Klasse {}'.format(class_name), 'Helvetica', 14, inner_width)
+    # user account information with QR code for the app on the right side
+    user_name_text = 'Benutzername: {}'.format(class_name)
+    password_text = 'Passwort: {}'.format(password)
+    if qr_code:
+        canvas.drawImage(qr_code, x + grid.card_width - CARD_PADDING - QR_CODE_SIZE, top - 30 - QR_CODE_SIZE,
+                         width=QR_CODE_SIZE, height=QR_CODE_SIZE)
+        text_width = inner_width - QR_CODE_SIZE - CARD_PADDING
+        pdf.draw_fitted_string(canvas, left + 15, top - 48, user_name_text, 'Courier', 12, text_width)
+        pdf.draw_fitted_string(canvas, left + 15, top - 64, password_text, 'Courier', 12, text_width)
+    else:
+        pdf.draw_fitted_string(canvas, left + 15, top - 48, user_name_text, 'Courier', 12, inner_width / 2)
+        pdf.draw_fitted_string(canvas, left + inner_width / 2 + 15, top - 48, password_text, 'Courier', 12,
+                               inner_width / 2)
+    bottom = y + CARD_PADDING
+    canvas.setFont('Helvetica', 14)
+    canvas.drawString(left, bottom + 36, 'Bitte die Benutzerdaten an die Klasse weitergeben. Danke!')
+    canvas.setFont('Helvetica', 11)
+    canvas.drawString(left, bottom + 14, 'Zugriff online unter: https://asopo.webuntis.com/WebUntis/')
+    canvas.drawString(left, bottom, 'oder als App: Untis Mobile (Schulname: BBS Brinkstr-Osnabrück)')
+
+
+def create_qr_code(user, password, cache_directory):
+    """
+    Returns the file name of a PNG image containing a QR code to set up the
+    Untis Mobile app for the given user. Images are stored in the cache
+    directory under the hash of the encoded URL and are only generated, if
+    they are not already in the cache.
+    """
+    url = QR_CODE_URL.format(user, password)
+    filename = os.path.join(cache_directory, '{}.png'.format(hashlib.sha256(url.encode('utf8')).hexdigest()))
+    if not os.path.exists(filename):
+        # store as grayscale image, so that ReportLab can embed the pixels without converting them to RGB
+        img = qrcode.make(url, box_size=QR_CODE_BOX_SIZE).get_image().convert('L')
+        with fileio.atomic_open(filename, 'wb') as output:
+            img.save(output, format='PNG')
+    return filename
+
 
+def _remove_unused_qr_codes(cache_directory, filenames):
+    """Removes all cached QR codes except the given ones, so that no outdated passwords are kept."""
+    used = {os.path.basename(f) for f in filenames}
+    for name in os.listdir(cache_directory):
+        if name.endswith('.png') and name not in used:
+            os.remove(os.path.join(cache_directory, name))
 
-def create_qr_code(user, password):
-    url_template = 'untis://setschool?url=asopo.webuntis.com&school=BBS Brinkstr-Osnabrück&user={}&key={}&schoolNumber=2042600'
-    img = qrcode.make(url_template.format(user, password))
-    # get binary data for image to be inserted into PDF
-    output = io.BytesIO()
-    img.save(output, format=img.format)
-    return output
+
+def create_qr_codes(list_of_passwords, max_workers=None, cache_directory=None):
+    """
+    Creates QR codes for all given users in a pool of processes. Cached
+    images are reused without generating them again. The images contain the
+    passwords, therefore they are stored in a directory only accessible by
+    the current user and all images not used by this export are removed.
+
+    :param list_of_passwords: dictionary with passwords for all user names
+    :param max_workers: maximum number of processes generating QR codes
+    :param cache_directory: directory storing the QR codes, None for
+                            QR_CODE_CACHE_DIRECTORY below
+                            config.CACHE_DIRECTORY
+    :return: dictionary with image readers for all user names
+    """
+    if cache_directory is None:
+        cache_directory = os.path.join(config.CACHE_DIRECTORY, QR_CODE_CACHE_DIRECTORY)
+    fileio.private_directory(cache_directory)
+    users = sorted(list_of_passwords)
+    passwords = [list_of_passwords[u] for u in users]
+    create = functools.partial(create_qr_code, cache_directory=cache_directory)
+    if len(users) > 1 and max_workers != 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+            filenames = list(executor.map(create, users, passwords, chunksize=8))
+    else:
+        filenames = list(map(create, users, passwords))
+    _remove_unused_qr_codes(cache_directory, filenames)
+    return {u: ImageReader(f) for u, f in zip(users, filenames)}
 
 
 def create_pdf_doc(output_file, list_of_passwords):
@@ -211,49 +262,11 @@ def create_pdf_doc(output_file, list_of_passwords):
     for k, v in list_of_passwords.items():
         logger.debug('User: {} Password: {}'.format(k, v))
     logger.debug('Finished creating new passwords for WebUntis.')
-    # create PDF file
-    main_paragraph_style = ParagraphStyle(name='Normal', fontSize=14, leading=18)
-    link_paragraph_style = ParagraphStyle(name='Normal', fontSize=11)
-    doc = SimpleDocTemplate(output_file, author=AUTHOR, title=TITLE)
-    story = [Spacer(1, 0.75*cm)]
-    for k, v in sorted(list_of_passwords.items()):
-        # build inner table with class specific user account information
-        img = create_qr_code(k, v)
-        if INCLUDE_QR_CODE:
-            inner_table_data = [['Benutzername: {}'.format(k), Image(img, width=2.5*cm, height=2.5*cm, hAlign='RIGHT')], ['Passwort: {}'.format(v)]]
-            inner_table = Table(inner_table_data, colWidths=[8*cm, 4*cm])
-        else:
-            inner_table_data = [['Benutzername: {}'.format(k), 'Passwort: {}'.format(v)]]
-            inner_table = Table(inner_table_data)
-        inner_table.setStyle(TableStyle([('FONT', (0, 0), (-1, -1), 'Courier'),
-                                         ('FONTSIZE', (0, 0), (-1, -1), 12),
-                                         ('SPAN', (1, 0), (1, -1)),
-                                         ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-                                         ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                                         ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
-                                         ('INNERGRID', (0, 0), (-1, -1), 0.25, colors.white),
-                                         ('BOX', (0, 0), (-1, -1), 0.25, colors.white),
-                                         ('LEFTPADDING', (0, 0), (-1, -1), 15),
-                                         ('RIGHTPADDING', (0, 0), (-1, -1), 15),
-                                         ('BOTTOMPADDING', (0, 0), (-1, -1), 5),
-                                         ('TOPPADDING', (0, 0), (-1, -1), 5)]))
-        # build paragraphs for outer table
-        elements = [[Paragraph('Benutzerdaten für den Zugriff auf den Stundenplan<br/>der Klasse {}'.format(k), main_paragraph_style)],
-                    [inner_table],
-                    [Paragraph('Bitte die Benutzerdaten an die Klasse weitergeben. Danke!', main_paragraph_style)],
-                    [Paragraph('Zugriff online unter: https://asopo.webuntis.com/WebUntis/ oder als App: Untis Mobile (Schulname: BBS Brinkstr-Osnabrück)', link_paragraph_style)]]
-        outer_table = Table(elements)
-        outer_table.setStyle(TableStyle([('FONT', (0, 0), (-1, -1), 'Helvetica'),
-                                         ('FONTSIZE', (0, 0), (-1, -1), 14),
-                                         ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                                         ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                                         ('INNERGRID', (0, 0), (-1, -1), 0.25, colors.white),
-                                         ('BOX', (0, 0), (-1, -1), 0.25, colors.black),
-                                         ('LEFTPADDING', (0, 0), (-1, -1), 20),
-                                         ('RIGHTPADDING', (0, 0), (-1, -1), 20),
-                                         ('BOTTOMPADDING', (0, 0), (-1, -1), 10),
-                                         ('TOPPADDING', (0, 0), (-1, -1), 10)]))
-        # append outer table for this class to document (without breaking table over multiple pages)
-        story.append(KeepTogether(outer_table))
-        story.append(Paragraph('<br/><br/><br/><br/>', ParagraphStyle(name='Normal')))
-    doc.build(story, onFirstPage=create_first_page, onLaterPages=create_later_pages)
+    # generate QR codes only if they should be included in the PDF file
+    qr_codes = create_qr_codes(list_of_passwords) if INCLUDE_QR_CODE else {}
+    cards = [(k, v, qr_codes.get(k)) for k, v in sorted(list_of_passwords.items())]
+    # create PDF file by drawing a card of fixed size for each class
+    grid = pdf.CardGrid(CARD_WIDTH, CARD_HEIGHT, top=2.5*cm)
+    # write PDF file atomically, so that no incomplete files are left behind
+    with fileio.atomic_open(output_file, 'wb') as pdf_file:
+        pdf.render_cards(pdf_file, cards, _draw_class_card, grid, TITLE, draw_header=_draw_header)
@@ -15,13 +15,17 @@ Created on Mon Feb  3 15:08:56 2014
 @author: Christian Wichmann
 """
 
+import os
+import sys
+import getpass
 import logging
 import logging.handlers
-import sys
 from docopt import docopt
 
+from bbss import ad
 from bbss import bbss
 from bbss import data
+from bbss import export
 
 
 if __name__ == '__main__':
@@ -45,8 +49,15 @@ bbss - BBS Student Management - A tool to store and manage student data
 
 Usage:
   bbss_cli clear
-  bbss_cli import <IMPORT_FILENAME> [--import-format (csv | excel)] [-c CONFIG_FILE] [--dsdb]
-  bbss_cli export <EXPORT_FILENAME> [--export-format (logodidact | moodle | radius | ad)] [--drc] [--dric]
+  bbss_cli import <IMPORT_FILENAME>... [--import-format (csv | excel)] [-c CONFIG_FILE] [--dsdb]
+  bbss_cli export <EXPORT_FILENAME> [--export-format (logodidact | moodle | radius | ad)] [--since-last] [--drc] [--dric]
+  bbss_cli export <EXPORT_FILENAME> --formats FORMATS [--workers WORKERS] [--since-last] [--drc] [--dric]
+  bbss_cli upload --since-last
+  bbss_cli upload --reconcile [--dry-run]
+  bbss_cli sync --bind-user USER [--server SERVER...] [--ad] [--full] [--dry-run]
+  bbss_cli analytics <OUTPUT_DIRECTORY> [--arrow]
+  bbss_cli images <IMAGE_ARCHIVE> <OUTPUT_FILE> [--classes CLASSES] [--changes] [--manifest MANIFEST_FILE] [--size SIZE]
+  bbss_cli convert <INPUT_FILE> [<OUTPUT_FILE>] [--domain DOMAIN] [--password-length LENGTH] [--workers WORKERS]
   bbss_cli search <SEARCH_STRING>
   bbss_cli diff <FIRST_STUDENT_LIST> <SECOND_STUDENT_LIST> <OUTPUT_FILE>
 
@@ -55,6 +66,39 @@ Options:
   --version             Show version information.
   --import-format       Import file format for student data. [default: csv]
   --export-format       Export file format for student data. [default: logodidact]
+  --formats FORMATS     Comma separated list of export formats that are all
+                        written in a single pass, e.g. moodle,iserv,webuntis.
+                        Use "-" as file name to write format jsonl to
+                        standard output.
+  --workers WORKERS     Write the export formats or convert the user list
+                        concurrently with the given number of worker
+                        processes.
+  --since-last          Export only changes since the last successful export
+                        for each format and remember the last import.
+  --arrow               Write Arrow IPC files instead of Parquet files.
+  --classes CLASSES     Comma separated list of classes to include photos for.
+  --changes             Include only photos of students added or changed by
+                        the last import.
+  --manifest MANIFEST_FILE
+                        Store exported photos in a JSON file and include only
+                        new or changed photos.
+  --size SIZE           Normalize photos into square avatars of the given
+                        width and height in pixels (requires Pillow).
+  --domain DOMAIN       Domain part of the email addresses of converted users.
+                        [default: bbs-brinkstrasse.net]
+  --password-length LENGTH
+                        Length of generated passwords for users without
+                        password. [default: 24]
+  --bind-user USER      DN of the user to bind to the directory service with.
+                        The password is read from environment variable
+                        BBSS_LDAP_PASSWORD or asked for.
+  --server SERVER       URL of directory server, can be given multiple times.
+  --ad                  Synchronize with Active Directory instead of OpenLDAP.
+  --full                Compare all students of the last import with the
+                        directory and delete accounts of unknown students.
+  --reconcile           Compare all students of the last import with the
+                        users on the school server and send only changes.
+  --dry-run             Only print the planned operations.
   -c CONFIG_FILE --config CONFIG_FILE
                         Config file in local directory.
   --drc                  Do not replace class names.
@@ -63,6 +107,10 @@ Options:
 """
     options = docopt(docopt_string, version='bbss 0.6')
 
+    # keep standard output free for data, if it is written there
+    if options['<EXPORT_FILENAME>'] == export.STDOUT:
+        log_to_screen.setStream(sys.stderr)
+
     # use default config file (config.py) or a given file in directory
     # where this file lies
     #try:
@@ -101,22 +149,64 @@ Options:
     elif options['import']:
         if not options['csv'] and not options['excel']:
             options['csv'] = True
+        import_files = options['<IMPORT_FILENAME>']
         if options['csv']:
             # read file into list of students
             # TODO use options.dontReplaceClassNames when importing
-            bbss.import_bbs_verwaltung_csv_file(options['<IMPORT_FILENAME>'])
+            if len(import_files) > 1:
+                # merge students from all files into a single import
+                bbss.import_bbs_verwaltung_csv_files(import_files)
+            else:
+                bbss.import_bbs_verwaltung_csv_file(import_files[0])
         elif options['excel']:
-            bbss.import_excel_file(options['<IMPORT_FILENAME>'])
+            if len(import_files) > 1:
+                logger.error('Only a single Excel file can be imported at once!')
+                sys.exit(1)
+            bbss.import_excel_file(import_files[0])
         # store newly imported student list in database
         if not options['--dsdb']:
-            bbss.store_students_db(options['<IMPORT_FILENAME>'])
+            bbss.store_students_db(', '.join(import_files))
 
     # evaluate import and export command line options
+    elif options['export'] and options['--formats']:
+        formats = [f.strip().lower() for f in options['--formats'].split(',') if f.strip()]
+        unknown_formats = set(formats) - set(export.available_formats())
+        if unknown_formats:
+            logger.error('Unknown export formats: {} (available: {})'.format(
+                ', '.join(sorted(unknown_formats)), ', '.join(export.available_formats())))
+            sys.exit(1)
+        if options['<EXPORT_FILENAME>'] == export.STDOUT and formats != ['jsonl']:
+            logger.error('Only the export format jsonl can be written to standard output!')
+            sys.exit(1)
+        replace_illegal_characters = False if options['--dric'] else None
+        max_workers = int(options['--workers']) if options['--workers'] else None
+        if options['--since-last']:
+            exported_imports = bbss.export_files_since_last(options['<EXPORT_FILENAME>'], formats,
+                                                            replace_illegal_characters, max_workers)
+            for format_name, (old_import_id, new_import_id) in sorted(exported_imports.items()):
+                print('{:>12} imports {} to {}'.format(format_name, old_import_id, new_import_id))
+        elif options['--workers']:
+            # WebUntis needs entry and exit dates of all students
+            changes = bbss.generate_changeset(include_dates='webuntis' in formats)
+            timings = bbss.export_files_parallel(options['<EXPORT_FILENAME>'], changes, formats,
+                                                 replace_illegal_characters,
+                                                 max_workers=max_workers, use_processes=True)
+            for format_name, duration in sorted(timings.items()):
+                print('{:>12} {:8.2f} s'.format(format_name, duration))
+        else:
+            changes = bbss.generate_changeset(include_dates='webuntis' in formats)
+            bbss.export_files(options['<EXPORT_FILENAME>'], changes, formats, replace_illegal_characters)
+
     elif options['export']:
         if (not options['logodidact'] and not options['ad']
-           and not options['radius']):
+           and not options['radius'] and not options['moodle']):
             options['logodidact'] = True
-        if options['logodidact']:
+        if options['--since-last'] and not options['ad']:
+            format_name = next(f for f in ('logodidact', 'radius', 'moodle') if options[f])
+            logger.info('Exporting student data for {} since last export...'.format(format_name))
+            bbss.export_files_since_last(options['<EXPORT_FILENAME>'], [format_name],
+                                         not options['--dric'])
+        elif options['logodidact']:
             logger.info("Exporting student data for use in logodidact...")
             bbss.export_csv_file(options['<EXPORT_FILENAME>'],
                                  bbss.generate_changeset(old_import_id=1),
@@ -137,6 +227,60 @@ Options:
                                     not options['--dric'])
             logger.info("Exported student data for use in Moodle server.")
 
+    # upload students to school server for Single SignOn
+    elif options['upload'] and options['--reconcile']:
+        plan, summary = bbss.reconcile_school_server(options['--dry-run'])
+        print('{:>14} {}'.format('new groups', len(plan.new_groups)))
+        print('{:>14} {}'.format('new users', len(plan.creates)))
+        print('{:>14} {}'.format('updated users', len(plan.updates)))
+        print('{:>14} {}'.format('changed groups', len(plan.group_changes)))
+        print('{:>14} {}'.format('deactivated', len(plan.deactivations)))
+        if summary and summary.failed:
+            print(summary.report())
+            sys.exit(1)
+    elif options['upload']:
+        bbss.upload_students_to_school_server_since_last()
+
+    # synchronize student accounts with directory service
+    elif options['sync']:
+        password = os.environ.get('BBSS_LDAP_PASSWORD') or getpass.getpass('Password: ')
+        servers = options['--server'] or [ad.LDAP_SERVER]
+        plan, result = bbss.sync_directory_since_last(servers, options['--bind-user'], password,
+                                                      'ad' if options['--ad'] else 'openldap',
+                                                      options['--full'], options['--dry-run'])
+        for operation in plan if options['--dry-run'] else []:
+            print('{:>12} {}'.format(operation.kind, operation.new_dn or operation.dn))
+        if result:
+            for kind, count in sorted(result.counts.items()):
+                print('{:>12} {}'.format(kind, count))
+            if result.errors:
+                logger.error('{} operations failed, see log file.'.format(len(result.errors)))
+                sys.exit(1)
+
+    # write database tables as columnar files for analytics
+    elif options['analytics']:
+        bbss.export_analytics(options['<OUTPUT_DIRECTORY>'], 'arrow' if options['--arrow'] else 'parquet')
+
+    # collect photos of students into an archive named by user names
+    elif options['images']:
+        classes = [c.strip() for c in options['--classes'].split(',')] if options['--classes'] else None
+        avatar_size = int(options['--size']) if options['--size'] else None
+        result = bbss.export_user_images(options['<IMAGE_ARCHIVE>'], options['<OUTPUT_FILE>'], classes,
+                                         options['--changes'], options['--manifest'], avatar_size)
+        print('{} photos copied, {} unchanged, {} missing.'.format(*result))
+
+    # convert user list exported from iServ for uploading users into Moodle
+    elif options['convert']:
+        def show_progress(position, size):
+            print('\rConverting user list... {:3.0f} %'.format(100 * position / size if size else 100),
+                  end='', file=sys.stderr, flush=True)
+        max_workers = int(options['--workers']) if options['--workers'] else 1
+        output_file, count = bbss.convert_user_list(options['<INPUT_FILE>'], options['<OUTPUT_FILE>'],
+                                                    options['--domain'], int(options['--password-length']),
+                                                    max_workers, show_progress)
+        print('', file=sys.stderr)
+        print('{} users converted into file {}.'.format(count, output_file))
+
     # evaluate diff command line options
     elif options['diff']:
         print('Diffing two student data files...')
@@ -0,0 +1,92 @@
+#! /usr/bin/env python3
+
+"""
+bbss - BBS Student Management
+
+Benchmark for normalizing photos of students into avatars. Compares decoding
+every photo in full resolution in a single process with decoding in draft
+mode in a pool of processes and with a second run taking all avatars from
+the cache. The photos are JPEG files of the size of a camera photo.
+
+Usage: python3 benchmarks/bench_avatars.py [NUMBER_OF_PHOTOS] [AVATAR_SIZE]
+
+Created on Tue Oct 20 09:12:44 2026
+
+@author: Christian Wichmann
+"""
+
+
+import io
+import os
+import sys
+import time
+import uuid
+import zipfile
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from PIL import Image
+from PIL import ImageOps
+
+from bbss import data
+from bbss import images
+
+
+def create_archive(filename, count):
+    students = []
+    # noise can not be compressed, so that the photos have a realistic size
+    photo = Image.effect_noise((3000, 4000), 64).convert('RGB')
+    with zipfile.ZipFile(filename, 'w') as source_zip:
+        for i in range(count):
+            student = data.Student('Nachname', 'Vorname', 'BFS{:03d}'.format(i // 25), '2000-01-01')
+            student.guid = uuid.uuid4()
+            student.user_id = 'BFS.NACHVORN{}'.format(i)
+            students.append(student)
+            photo.putpixel((0, 0), (i % 256, i // 256 % 256, 0))
+            output = io.BytesIO()
+            photo.save(output, format='JPEG', quality=90)
+            source_zip.writestr('{}.jpg'.format(student.guid), output.getvalue())
+    return students
+
+
+def normalize_without_draft(source_archive, target_archive, students, size):
+    with zipfile.ZipFile(source_archive) as source_zip, zipfile.ZipFile(target_archive, 'w') as target_zip:
+        for student in students:
+            with Image.open(source_zip.open('{}.jpg'.format(student.guid))) as image:
+                image = ImageOps.exif_transpose(image).convert('RGB')
+                avatar = ImageOps.fit(image, (size, size), Image.Resampling.LANCZOS)
+            output = io.BytesIO()
+            avatar.save(output, format='JPEG', quality=images.AVATAR_QUALITY)
+            target_zip.writestr(student.user_id.lower() + '.jpeg', output.getvalue())
+
+
+def measure(name, func, *args, **kwargs):
+    start = time.perf_counter()
+    func(*args, **kwargs)
+    duration = time.perf_counter() - start
+    print('{:>36} {:8.2f} s {:8.1f} photos/s'.format(name, duration, len(args[2]) / duration))
+    os.remove(args[1])
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else images.AVATAR_SIZE
+    with tempfile.TemporaryDirectory() as directory:
+        source_archive = os.path.join(directory, 'photos.zip')
+        target_archive = os.path.join(directory, 'moodle.zip')
+        cache_directory = os.path.join(directory, 'avatars')
+        print('Creating archive with {} photos of 3000x4000 pixels...'.format(count))
+        students = create_archive(source_archive, count)
+        measure('full decode in single process', normalize_without_draft, source_archive, target_archive,
+                students, size)
+        measure('draft mode in single process', images.collect_images, source_archive, target_archive,
+                students, avatar_size=size, max_workers=1, cache_directory=os.path.join(directory, 'single'))
+        measure('draft mode in process pool', images.collect_images, source_archive, target_archive,
+                students, avatar_size=size, cache_directory=cache_directory)
+        measure('avatars from cache', images.collect_images, source_archive, target_archive,
+                students, avatar_size=size, cache_directory=cache_directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+#! /usr/bin/env python3
+
+"""
+bbss - BBS Student Management
+
+Benchmark for converting user lists exported from iServ. Compares the former
+conversion with dictionaries per row and a call of secrets.choice() per
+password character with the conversion in chunks of tuples.
+
+Usage: python3 benchmarks/bench_convert.py [NUMBER_OF_USERS]
+
+Created on Tue Oct 20 11:02:58 2026
+
+@author: Christian Wichmann
+"""
+
+
+import os
+import sys
+import csv
+import time
+import secrets
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from bbss import convert
+
+
+def create_user_list(filename, count):
+    with open(filename, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(('Account', 'Vorname', 'Nachname', 'Klasse/Information', 'Passwort', 'Gruppen'))
+        for i in range(count):
+            # most accounts have no password yet
+            writer.writerow(('vorname.nachname{}'.format(i), 'Vorname', 'Nachname', 'BFS{:03d}'.format(i // 25),
+                             'geheim' if i % 10 == 0 else '', 'Schüler;BFS'))
+
+
+def convert_with_dicts(input_file, output_file):
+    with open(input_file, 'r', encoding='utf-8-sig', newline='') as src_file, \
+            open(output_file, 'w', encoding='utf-8', newline='') as dst_file:
+        reader = csv.DictReader(src_file)
+        writer = csv.DictWriter(dst_file, fieldnames=convert.OUTPUT_HEADER, delimiter=';')
+        writer.writeheader()
+        for row in reader:
+            username = (row.get('Account') or '').strip()
+            password = (row.get('Passwort') or '').strip() or \
+                ''.join(secrets.choice(convert.PASSWORD_ALPHABET) for _ in range(convert.PASSWORD_LENGTH))
+            writer.writerow({'lastname': (row.get('Nachname') or '').strip(),
+                             'firstname': (row.get('Vorname') or '').strip(),
+                             'cohort1': (row.get('Klasse/Information') or '').strip(),
+                             'username': username, 'email': f'{username}@{convert.DOMAIN}' if username else '',
+                             'password': password, 'profile_field_source': convert.SOURCE, 'auth': convert.AUTH})
+
+
+def copy_file(input_file, output_file):
+    with open(input_file, 'rb') as source, open(output_file, 'wb') as target:
+        for line in source:
+            target.write(line)
+
+
+def measure(name, func, *args, **kwargs):
+    start = time.perf_counter()
+    func(*args, **kwargs)
+    duration = time.perf_counter() - start
+    print('{:>36} {:8.2f} s'.format(name, duration))
+    os.remove(args[1])
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    with tempfile.TemporaryDirectory() as directory:
+        input_file = os.path.join(directory, 'users.csv')
+        output_file = os.path.join(directory, 'users.converted.csv')
+        print('Creating user list with {} accounts...'.format(count))
+        create_user_list(input_file, count)
+        measure('copy file line by line', copy_file, input_file, output_file)
+        measure('dictionaries and secrets.choice()', convert_with_dicts, input_file, output_file)
+        measure('chunks of tuples', convert.convert_user_list, input_file, output_file)
+        measure('chunks of tuples in process pool', convert.convert_user_list, input_file, output_file,
+                max_workers=None)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+#! /usr/bin/env python3
+
+"""
+bbss - BBS Student Management
+
+Benchmark for building an archive with photos of students. Compares reading
+and compressing every photo again (as done by the former script) with
+copying the photos without compressing them again. The photos are random
+data of the size of a camera JPEG, so they can not be compressed.
+
+Usage: python3 benchmarks/bench_images.py [NUMBER_OF_PHOTOS] [SIZE_IN_KB]
+
+The defaults (1000 photos of 3 MB) create a source archive of 3 GB.
+
+Created on Mon Oct 19 21:12:06 2026
+
+@author: Christian Wichmann
+"""
+
+
+import os
+import sys
+import time
+import uuid
+import zipfile
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from bbss import data
+from bbss import images
+
+
+def create_archive(filename, count, size, compression):
+    students = []
+    photo = os.urandom(size)
+    with zipfile.ZipFile(filename, 'w', compression=compression) as source_zip:
+        for i in range(count):
+            student = data.Student('Nachname', 'Vorname', 'BFS{:03d}'.format(i // 25), '2000-01-01')
+            student.guid = uuid.uuid4()
+            student.user_id = 'BFS.NACHVORN{}'.format(i)
+            students.append(student)
+            # change a few bytes, so that every photo has its own checksum
+            source_zip.writestr('{}.jpg'.format(student.guid), i.to_bytes(4, 'big') + photo[4:])
+    return students
+
+
+def copy_with_recompression(source_archive, target_archive, students):
+    with zipfile.ZipFile(target_archive, 'w', compression=zipfile.ZIP_DEFLATED) as target_zip:
+        with zipfile.ZipFile(source_archive, 'r') as source_zip:
+            for student in students:
+                info = source_zip.getinfo('{}.jpg'.format(student.guid))
+                target_zip.writestr(student.user_id.lower() + '.jpeg', source_zip.open(info.filename).read())
+
+
+def measure(name, func, *args):
+    start = time.perf_counter()
+    func(*args)
+    duration = time.perf_counter() - start
+    size = os.path.getsize(args[1]) / 1024 / 1024
+    print('{:>36} {:8.2f} s {:8.1f} MB/s'.format(name, duration, size / duration))
+    os.remove(args[1])
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    size = (int(sys.argv[2]) if len(sys.argv) > 2 else 3072) * 1024
+    with tempfile.TemporaryDirectory() as directory:
+        target_archive = os.path.join(directory, 'moodle.zip')
+        for compression, label in ((zipfile.ZIP_STORED, 'stored'), (zipfile.ZIP_DEFLATED, 'deflated')):
+            source_archive = os.path.join(directory, 'photos.zip')
+            print('Creating archive with {} {} photos of {} KB...'.format(count, label, size // 1024))
+            students = create_archive(source_archive, count, size, compression)
+            measure('decompress and deflate every photo', copy_with_recompression, source_archive,
+                    target_archive, students)
+            measure('copy without compression', images.collect_images, source_archive, target_archive, students)
+            os.remove(source_archive)
+
+
+if __name__ == '__main__':
+    main()
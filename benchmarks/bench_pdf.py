@@ -0,0 +1,62 @@
+#! /usr/bin/env python3
+
+"""
+bbss - BBS Student Management
+
+Benchmark for creating PDF files with user account data of many students.
+Compares rendering all classes in a single process with rendering them in a
+pool of processes, writing either a merged file or a ZIP archive.
+
+Usage: python3 benchmarks/bench_pdf.py [NUMBER_OF_STUDENTS]
+
+Created on Mon Oct 19 15:02:37 2026
+
+@author: Christian Wichmann
+"""
+
+
+import os
+import sys
+import time
+import random
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from bbss import pdf
+
+
+STUDENTS_PER_CLASS = 25
+
+
+def create_rows(count):
+    rng = random.Random(42)
+    rows = []
+    for i in range(count):
+        classname = 'BFS{:03d}'.format(i // STUDENTS_PER_CLASS)
+        surname = 'Nachname{}'.format(rng.randint(0, 99999))
+        firstname = 'Vorname{}'.format(i)
+        user_id = '{}.{}{}'.format(classname, surname, firstname[0])
+        password = ''.join(rng.choice('abcdefghkmnpqrstuvwxyz23456789') for _ in range(9))
+        rows.append(pdf.StudentRow(classname, surname, firstname, user_id, password))
+    return rows
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    rows = create_rows(count)
+    print('Creating PDF files for {} students in {} classes...'.format(count, count // STUDENTS_PER_CLASS))
+    with tempfile.TemporaryDirectory() as directory:
+        output_file = os.path.join(directory, 'benchmark.pdf')
+        for name, max_workers, as_zip in (('single process, merged', 1, False),
+                                          ('process pool, merged', None, False),
+                                          ('single process, zip', 1, True),
+                                          ('process pool, zip', None, True)):
+            start = time.perf_counter()
+            written_file = pdf.create_pdf_doc(output_file, rows, max_workers=max_workers, as_zip=as_zip)
+            duration = time.perf_counter() - start
+            print('{:<24} {:6.2f} s  {:8.1f} KiB'.format(name, duration, os.path.getsize(written_file) / 1024))
+
+
+if __name__ == '__main__':
+    main()
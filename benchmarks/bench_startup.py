@@ -0,0 +1,86 @@
+#! /usr/bin/env python3
+
+"""
+bbss - BBS Student Management
+
+Benchmark for the startup time of the command line interface and the GUI.
+Every entry point is imported in a new interpreter with "-X importtime".
+For comparison all modules for file formats and services are additionally
+imported at once, like bbss.bbss did before they were loaded on first use.
+
+Usage: python3 benchmarks/bench_startup.py [NUMBER_OF_RUNS]
+
+Created on Tue Oct 20 15:12:44 2026
+
+@author: Christian Wichmann
+"""
+
+
+import os
+import sys
+import tempfile
+import subprocess
+
+BASE_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, BASE_DIRECTORY)
+
+import bbss
+
+
+ENTRY_POINTS = (('command line interface', 'bbss_cli'), ('GUI', 'gui.gui'))
+
+# number of slowest modules shown for every entry point
+TOP_MODULES = 5
+
+
+def import_all_modules():
+    """Returns code importing all lazily loaded modules, skipping those with missing dependencies."""
+    return ''.join('try:\n    import bbss.{}\nexcept ImportError:\n    pass\n'.format(name)
+                   for name in bbss._lazy_modules)
+
+
+def measure_imports(module, eager, directory):
+    """
+    Imports a module in a new interpreter and returns the cumulative import
+    times in seconds and the nesting depth of all imported modules.
+    """
+    code = 'import sys\nsys.path.insert(0, {!r})\n{}import {}\n'.format(
+        os.path.abspath(BASE_DIRECTORY), import_all_modules() if eager else '', module)
+    environment = dict(os.environ, QT_QPA_PLATFORM='offscreen')
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=directory, env=environment,
+                             stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    times = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # names of nested imports are indented by two spaces per level
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        times[name.strip()] = (int(cumulative) / 1e6, depth)
+    return times
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    # the database is created in the working directory, if it is opened
+    with tempfile.TemporaryDirectory() as directory:
+        for title, module in ENTRY_POINTS:
+            print('Startup of {} ({}):'.format(title, module))
+            for name, eager in (('all modules at once', True), ('modules on first use', False)):
+                try:
+                    results = [measure_imports(module, eager, directory) for _ in range(runs)]
+                except subprocess.CalledProcessError as e:
+                    print('  could not import {}: {}'.format(module, e.stderr.strip().splitlines()[-1]))
+                    break
+                total_time = lambda times: sum(t for t, depth in times.values() if depth == 0)
+                times = min(results, key=total_time)
+                print('  {:>24} {:8.3f} s'.format(name, total_time(times)))
+                # slowest modules imported directly, including those imported by the entry point itself
+                slowest = sorted(((t, m) for m, (t, depth) in times.items() if depth <= 1 and m != module),
+                                 reverse=True)
+                for t, m in slowest[:TOP_MODULES]:
+                    print('  {:>24} {:8.3f} s  {}'.format('', t, m))
+
+
+if __name__ == '__main__':
+    main()
@@ -15,6 +15,9 @@ Created on Mon Feb  23 15:08:56 2014
 import os
 import sys
 import logging
+import itertools
+import collections
+import concurrent.futures
 
 from PyQt6 import QtGui
 from PyQt6 import QtCore
@@ -22,6 +25,8 @@ from PyQt6 import QtWidgets
 
 from gui.main import Ui_BBSS_Main_Window
 from bbss import bbss
+from bbss import fileio
+from bbss import search
 
 
 __all__ = ['start_gui']
@@ -33,41 +38,216 @@ logger = logging.getLogger('bbss.gui')
 APP_NAME = "BBSS"
 
 
-class StudentTableFilterProxyModel(QtCore.QSortFilterProxyModel):
-    """Filters student table for regular expression in all columns."""
-    def filterAcceptsRow(self, sourceRow, sourceParent):
-        index0 = self.sourceModel().index(sourceRow, 0, sourceParent)
-        index1 = self.sourceModel().index(sourceRow, 1, sourceParent)
-        index2 = self.sourceModel().index(sourceRow, 2, sourceParent)
-        return (self.filterRegularExpression().match(self.sourceModel().data(index0)).capturedStart() >= 0
-                or self.filterRegularExpression().match(self.sourceModel().data(index1)).capturedStart() >= 0
-                or self.filterRegularExpression().match(self.sourceModel().data(index2)).capturedStart() >= 0)
+class StudentTableFilterProxyModel(QtCore.QAbstractProxyModel):
+    """
+    Filters student table for a string in surname, first name and class. The
+    filter string may contain the wildcards "*" and "?". All students are
+    indexed once, when the first filter is set after the students changed.
+
+    Rows are mapped through the list of matching students, so that changing
+    the filter only resets the model and the view asks just for the visible
+    rows instead of checking every row of the source model.
+    """
+    def __init__(self, parent=None):
+        super(StudentTableFilterProxyModel, self).__init__(parent)
+        self._index = None
+        self._filter_string = ''
+        # positions of all matching students in the source model, None if no filter is set
+        self._rows = None
+        self._proxy_rows = None
+
+    def _source_signals(self, source_model):
+        return ((source_model.modelAboutToBeReset, self._on_source_about_to_be_reset),
+                (source_model.modelReset, self._on_source_reset),
+                (source_model.rowsAboutToBeInserted, self._on_source_rows_about_to_be_inserted),
+                (source_model.rowsInserted, self._on_source_rows_inserted),
+                (source_model.rowsAboutToBeRemoved, self._on_source_rows_about_to_be_removed),
+                (source_model.rowsRemoved, self._on_source_rows_removed))
+
+    def setSourceModel(self, source_model):
+        self.beginResetModel()
+        if self.sourceModel() is not None:
+            for signal, slot in self._source_signals(self.sourceModel()):
+                signal.disconnect(slot)
+        super(StudentTableFilterProxyModel, self).setSourceModel(source_model)
+        for signal, slot in self._source_signals(source_model):
+            signal.connect(slot)
+        self._drop_index()
+        self.endResetModel()
+
+    def _drop_index(self):
+        self._index = None
+        self._rows = None
+        self._proxy_rows = None
+
+    # changes of the source model are passed on as they are without filter,
+    # otherwise the filter is dropped, because the positions are no longer valid
+    def _on_source_about_to_be_reset(self):
+        self.beginResetModel()
+
+    def _on_source_reset(self):
+        self._drop_index()
+        self.endResetModel()
+
+    def _on_source_rows_about_to_be_inserted(self, parent, first, last):
+        if self._rows is None:
+            self.beginInsertRows(QtCore.QModelIndex(), first, last)
+        else:
+            self.beginResetModel()
+
+    def _on_source_rows_inserted(self, parent, first, last):
+        if self._rows is None:
+            self._index = None
+            self.endInsertRows()
+        else:
+            self._drop_index()
+            self.endResetModel()
+
+    def _on_source_rows_about_to_be_removed(self, parent, first, last):
+        if self._rows is None:
+            self.beginRemoveRows(QtCore.QModelIndex(), first, last)
+        else:
+            self.beginResetModel()
+
+    def _on_source_rows_removed(self, parent, first, last):
+        if self._rows is None:
+            self._index = None
+            self.endRemoveRows()
+        else:
+            self._drop_index()
+            self.endResetModel()
+
+    def set_filter_string(self, filter_string):
+        """Shows only students matching the given string, all students if it is empty."""
+        self._filter_string = filter_string
+        if filter_string:
+            # filter all students, not only the ones already shown
+            self.sourceModel().fetch_all()
+        self.beginResetModel()
+        if filter_string:
+            if self._index is None:
+                self._index = search.StudentIndex(self.sourceModel().student_list)
+            self._rows = self._index.filter(filter_string)
+        else:
+            self._rows = None
+        self._proxy_rows = None
+        self.endResetModel()
+
+    def index(self, row, column, parent=QtCore.QModelIndex()):
+        if parent.isValid() or not self.hasIndex(row, column, parent):
+            return QtCore.QModelIndex()
+        return self.createIndex(row, column)
+
+    def parent(self, index=QtCore.QModelIndex()):
+        return QtCore.QModelIndex()
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid() or self.sourceModel() is None:
+            return 0
+        return self.sourceModel().rowCount() if self._rows is None else len(self._rows)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid() or self.sourceModel() is None:
+            return 0
+        return self.sourceModel().columnCount()
+
+    def mapToSource(self, proxy_index):
+        if not proxy_index.isValid():
+            return QtCore.QModelIndex()
+        row = proxy_index.row() if self._rows is None else self._rows[proxy_index.row()]
+        return self.sourceModel().index(row, proxy_index.column())
+
+    def mapFromSource(self, source_index):
+        if not source_index.isValid():
+            return QtCore.QModelIndex()
+        if self._rows is None:
+            return self.index(source_index.row(), source_index.column())
+        if self._proxy_rows is None:
+            self._proxy_rows = {row: i for i, row in enumerate(self._rows)}
+        row = self._proxy_rows.get(source_index.row())
+        return QtCore.QModelIndex() if row is None else self.index(row, source_index.column())
 
 
 class StudentTableModel(QtCore.QAbstractTableModel):
+    """
+    Table model for students. The students can be given as list or as
+    iterator, e.g. over a database cursor. They are only fetched in batches,
+    when the view scrolls down to them, and each batch is inserted as new rows.
+    The texts of all cells of a row are formatted at once and kept in a cache
+    of the recently shown rows.
+    """
+    # number of students fetched at once
+    FETCH_SIZE = 500
+    # number of rows kept in the cache of formatted rows
+    ROW_CACHE_SIZE = 2000
+
     def __init__(self, student_list, parent=None):
-        super(StudentTableModel, self).__init__()
-        self.student_list = student_list
+        super(StudentTableModel, self).__init__(parent)
+        self.student_list = []
         self.column_list = ('surname', 'firstname', 'classname', 'birthday')
         self.column_list_i18n = ('Nachname', 'Vorname', 'Klasse', 'Geburtstag')
+        self._source = iter(())
+        self._exhausted = True
+        self._row_cache = collections.OrderedDict()
+        self.update(student_list)
 
     def update(self, student_list):
-        self.student_list = student_list
-        self.layoutChanged.emit()
+        """Replaces all students of the model. The rows of the old students
+        are removed and the first batch of new students is fetched."""
+        if self.student_list:
+            self.beginRemoveRows(QtCore.QModelIndex(), 0, len(self.student_list) - 1)
+            self.student_list = []
+            self._row_cache.clear()
+            self.endRemoveRows()
+        self._source = iter(student_list)
+        self._exhausted = False
+        self.fetchMore()
+
+    def canFetchMore(self, parent=QtCore.QModelIndex()):
+        return not parent.isValid() and not self._exhausted
+
+    def fetchMore(self, parent=QtCore.QModelIndex()):
+        if parent.isValid() or self._exhausted:
+            return
+        students = list(itertools.islice(self._source, self.FETCH_SIZE))
+        if len(students) < self.FETCH_SIZE:
+            self._exhausted = True
+            self._source = iter(())
+        if students:
+            first_row = len(self.student_list)
+            self.beginInsertRows(QtCore.QModelIndex(), first_row, first_row + len(students) - 1)
+            self.student_list.extend(students)
+            self.endInsertRows()
+
+    def fetch_all(self):
+        """Fetches all remaining students, e.g. before filtering all rows."""
+        while self.canFetchMore():
+            self.fetchMore()
 
     def rowCount(self, parent=QtCore.QModelIndex()):
-        return len(self.student_list)
+        return 0 if parent.isValid() else len(self.student_list)
 
     def columnCount(self, parent=QtCore.QModelIndex()):
         return len(self.column_list)
 
+    def _formatted_row(self, row):
+        texts = self._row_cache.get(row)
+        if texts is None:
+            student = self.student_list[row]
+            texts = tuple('{0}'.format(getattr(student, c)) for c in self.column_list)
+            self._row_cache[row] = texts
+            if len(self._row_cache) > self.ROW_CACHE_SIZE:
+                self._row_cache.popitem(last=False)
+        else:
+            self._row_cache.move_to_end(row)
+        return texts
+
     def data(self, index, role=QtCore.Qt.ItemDataRole.DisplayRole):
         if not index.isValid():
             return ''
         elif role != QtCore.Qt.ItemDataRole.DisplayRole:
             return None
-        student = self.student_list[index.row()]
-        return '{0}'.format(getattr(student, self.column_list[index.column()]))
+        return self._formatted_row(index.row())[index.column()]
 
     def student_data(self, index, role=QtCore.Qt.ItemDataRole.DisplayRole):
         student = self.student_list[index.row()]
@@ -89,6 +269,78 @@ class StudentTableModel(QtCore.QAbstractTableModel):
         return QtCore.Qt.ItemFlag.ItemIsEnabled | QtCore.Qt.ItemFlag.ItemIsSelectable
 
 
+class SearchController(QtCore.QObject):
+    """
+    Searches students while the search string is typed. Keystrokes are
+    collected until no key was pressed for DEBOUNCE_INTERVAL milliseconds.
+    The search runs in a worker thread with its own read-only connection to
+    the database. A running search is cancelled as soon as a newer search
+    string was entered and results of outdated searches are dropped.
+    """
+    # time in milliseconds to wait for further keystrokes before searching
+    DEBOUNCE_INTERVAL = 250
+
+    # emitted with the SearchResult of the latest search
+    search_finished = QtCore.pyqtSignal(object)
+    # emitted from the worker thread with the generation and future of a search
+    _search_done = QtCore.pyqtSignal(int, object)
+
+    def __init__(self, parent=None):
+        super(SearchController, self).__init__(parent)
+        self._student_search = search.StudentSearch()
+        # a single worker, because the connection is bound to its thread
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        # incremented for every new search string, older searches are cancelled
+        self._generation = 0
+        self._search_string = ''
+        self._timer = QtCore.QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(self.DEBOUNCE_INTERVAL)
+        self._timer.timeout.connect(self._start_search)
+        self._search_done.connect(self._on_search_done, QtCore.Qt.ConnectionType.QueuedConnection)
+
+    def search(self, search_string):
+        """Searches for the given string after the debounce interval. A
+        pending or running search is superseded."""
+        self._search_string = search_string
+        self._generation += 1
+        self._timer.start()
+
+    @QtCore.pyqtSlot()
+    def _start_search(self):
+        generation = self._generation
+        future = self._executor.submit(self._student_search.search, self._search_string,
+                                       lambda: generation != self._generation)
+        future.add_done_callback(lambda f: self._search_done.emit(generation, f))
+
+    @QtCore.pyqtSlot(int, object)
+    def _on_search_done(self, generation, future):
+        if generation != self._generation:
+            return
+        try:
+            result = future.result()
+        except Exception as e:
+            logger.error('Could not search for students: {}'.format(e))
+            return
+        if result is not None:
+            self.search_finished.emit(result)
+
+    def reset(self, wait=False):
+        """Cancels the running search and drops all cached results, e.g.
+        after the database was changed. If wait is set, the connection of the
+        worker is closed before returning, e.g. before deleting the database."""
+        self._generation += 1
+        self._timer.stop()
+        future = self._executor.submit(self._student_search.reset)
+        if wait:
+            future.result()
+
+    def shutdown(self):
+        """Cancels the running search and stops the worker thread."""
+        self.reset()
+        self._executor.shutdown(wait=True)
+
+
 class DateDialog(QtWidgets.QDialog):
     """
     Shows a dialog to input a date and time similar to what QtGui.QInputDialog
@@ -139,6 +391,8 @@ class BbssGui(QtWidgets.QMainWindow, Ui_BBSS_Main_Window):
         self.FILENAME = ''
         self.setupUi(self)
         self.setup_table_models()
+        self.search_controller = SearchController(self)
+        self.search_controller.search_finished.connect(self.on_search_finished)
         self.setup_combo_boxes()
         self.center_on_screen()
         self.set_signals_and_slots()
@@ -195,7 +449,6 @@ class BbssGui(QtWidgets.QMainWindow, Ui_BBSS_Main_Window):
         self.import_table_model = StudentTableModel(bbss.student_list)
         self.proxy_import_table_model = StudentTableFilterProxyModel()
         self.proxy_import_table_model.setSourceModel(self.import_table_model)
-        self.proxy_import_table_model.setDynamicSortFilter(True)
         self.import_data_tableview.setModel(self.proxy_import_table_model)
         self.import_data_tableview.horizontalHeader().setSectionResizeMode (
             QtWidgets.QHeaderView.ResizeMode.Stretch)
@@ -261,19 +514,31 @@ class BbssGui(QtWidgets.QMainWindow, Ui_BBSS_Main_Window):
     def on_load_file(self):
         logger.info('Loading file with student data...')
 		# store only first element of tuple (new in PyQt5)
-        self.FILENAME = QtWidgets.QFileDialog\
-            .getOpenFileName(self, 'Öffne Schülerdatendatei...', '',
-                             'BBS-Verwaltung (*.csv);;BBS-Planung (*.xls *.xlsx)')[0]
+        filenames = QtWidgets.QFileDialog\
+            .getOpenFileNames(self, 'Öffne Schülerdatendatei...', '',
+                              'BBS-Verwaltung (*.csv *.csv.gz *.csv.bz2 *.csv.xz *.zip);;BBS-Planung (*.xls *.xlsx)')[0]
+        if not filenames:
+            return
+        self.FILENAME = ', '.join(filenames)
         logger.info('Student data file chosen: "{0}".'.format(self.FILENAME))
-        _, ext = os.path.splitext(self.FILENAME)
-        if ext == '.csv':
-            bbss.import_bbs_verwaltung_csv_file(self.FILENAME)
+        _, ext = os.path.splitext(fileio.strip_compression_extension(filenames[0]))
+        # ZIP archives with data from BBS-Verwaltung do not have to be named *.csv.zip
+        if ext == '.csv' or (fileio.is_compressed(filenames[0]) and ext not in ('.xls', '.xlsx')):
+            if len(filenames) > 1:
+                # merge students from multiple files into a single import
+                bbss.import_bbs_verwaltung_csv_files(filenames)
+            else:
+                bbss.import_bbs_verwaltung_csv_file(self.FILENAME)
         elif ext == '.xls' or ext == '.xlsx':
+            if len(filenames) > 1:
+                logger.warning('Only the first Excel file will be imported.')
+                self.FILENAME = filenames[0]
             bbss.import_excel_file(self.FILENAME)
         else:
             logger.warning('Given file format can not be imported.')
         self.import_table_model.update(bbss.student_list)
         self.proxy_import_table_model.setSourceModel(self.import_table_model)
+        self.on_import_filter(self.import_filter_text.text())
         self.import_data_tableview.resizeColumnsToContents()
 
     @QtCore.pyqtSlot()
@@ -288,6 +553,7 @@ class BbssGui(QtWidgets.QMainWindow, Ui_BBSS_Main_Window):
             self.progress.setRange(0, complete)
             self.progress.setValue(current+1)
         bbss.store_students_db(self.FILENAME, callback=update_progressbar)
+        self.search_controller.reset()
         message = "Schülerdaten aus Datei {0} wurden erfolgreich eingelesen."\
                   .format(self.FILENAME)
         QtWidgets.QMessageBox.information(self, 'Schülerdaten importiert.',
@@ -302,6 +568,7 @@ class BbssGui(QtWidgets.QMainWindow, Ui_BBSS_Main_Window):
                                                message, QtWidgets.QMessageBox.StandardButton.Yes,
                                                QtWidgets.QMessageBox.StandardButton.No)
         if reply == QtWidgets.QMessageBox.StandardButton.Yes:
+            self.search_controller.reset(wait=True)
             bbss.clear_database()
 
     @QtCore.pyqtSlot()
@@ -318,6 +585,7 @@ class BbssGui(QtWidgets.QMainWindow, Ui_BBSS_Main_Window):
                 self.progress.setRange(0, complete)
                 self.progress.setValue(current+1)
             bbss.delete_old_data(date.toString('yyyy-MM-dd'), callback=update_progressbar)
+            self.search_controller.reset()
 
     @QtCore.pyqtSlot()
     def on_compare_mail_addresses(self):
@@ -331,12 +599,9 @@ class BbssGui(QtWidgets.QMainWindow, Ui_BBSS_Main_Window):
 
     @QtCore.pyqtSlot(str)
     def on_import_filter(self, filter_string):
+        logger.debug('Filtering for {0}...'.format(filter_string))
+        self.proxy_import_table_model.set_filter_string(filter_string)
         if filter_string:
-            logger.debug('Filtering for {0}...'.format(filter_string))
-            syntax = QtCore.QRegularExpression.PatternSyntax(QtCore.QRegularExpression.Wildcard)
-            case_sensitivity = QtCore.Qt.CaseInsensitive
-            regExp = QtCore.QRegularExpression(filter_string, case_sensitivity, syntax)
-            self.proxy_import_table_model.setFilterRegExp(regExp)
             count = self.proxy_import_table_model.rowCount()
             self.search_result_label.setText('{} Schüler gefunden...'.format(count))
         else:
@@ -344,12 +609,18 @@ class BbssGui(QtWidgets.QMainWindow, Ui_BBSS_Main_Window):
 
     @QtCore.pyqtSlot(str)
     def on_search_student(self, search_string):
-        """Search database each time the search text field was edited. The
-        result is shown in the search table view.
+        """Search database when the search text field was edited. The search
+        runs in the background after the user stopped typing.
         """
-        logger.debug('Searching for "{}"...'.format(search_string))
-        result = bbss.search_student_in_database(search_string)
-        self.search_students_table_model.update(result)
+        self.search_controller.search(search_string)
+
+    @QtCore.pyqtSlot(object)
+    def on_search_finished(self, result):
+        """Shows the result of a search in the search table view."""
+        self.search_students_table_model.update(result.students)
+        message = '{} Schüler gefunden in {:.0f} ms{}'.format(len(result.students), result.duration * 1000,
+                                                              ' (aus Zwischenspeicher)' if result.cached else '')
+        self.statusbar.showMessage(message)
 
     @QtCore.pyqtSlot(QtCore.QItemSelection, QtCore.QItemSelection)
     def on_select_student_from_search(self, selected, deselected):
@@ -392,14 +663,8 @@ class BbssGui(QtWidgets.QMainWindow, Ui_BBSS_Main_Window):
         logger.debug('{} added, {} changed, {} removed'
                      .format(*self.changeset.get_statistics()))
         # update tables for added and removed students
-        self.added_students_table_model = StudentTableModel(
-            self.changeset.students_added)
-        self.removed_students_table_model = StudentTableModel(
-            self.changeset.students_removed)
-        self.added_students_tableview.setModel(
-            self.added_students_table_model)
-        self.removed_students_tableview.setModel(
-            self.removed_students_table_model)
+        self.added_students_table_model.update(self.changeset.students_added)
+        self.removed_students_table_model.update(self.changeset.students_removed)
         # update labels with student count
         self.added_student_table_label.setText('Hinzugefügte Schüler ({}):'.format(self.changeset.get_statistics().added))
         self.removed_student_table_label.setText('Entfernte Schüler ({}):'.format(self.changeset.get_statistics().removed))
@@ -439,6 +704,10 @@ class BbssGui(QtWidgets.QMainWindow, Ui_BBSS_Main_Window):
         logger.info('Export file chosen: "{0}".'.format(filename))
         return filename
 
+    def closeEvent(self, event):
+        self.search_controller.shutdown()
+        super(BbssGui, self).closeEvent(event)
+
     @QtCore.pyqtSlot()
     def on_tab_changed(self):
         if self.TaskTabbedPane.currentIndex() == 1:
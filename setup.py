@@ -13,6 +13,13 @@ base = None
 if sys.platform == "win32":
     base = "Win32GUI"
 
+# optional packages, only necessary for some export formats and commands
+extras = {
+    'pdf': ['pypdf'],
+    'analytics': ['pyarrow'],
+    'ldap': ['ldap3'],
+}
+
 executables = [
     Executable('bbss_cli.py'),
     Executable('bbss_gui.py', base=base)
@@ -28,6 +35,7 @@ setup(
     license='LICENSE',
     description='Management software for students of german vocational colleges',
     #test_suite='bbss.tests.get_suite',
+    extras_require=extras,
     options=dict(build_exe=buildOptions),
     executables=executables
 )